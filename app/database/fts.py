@@ -0,0 +1,117 @@
+import re
+from typing import Optional
+
+from sqlalchemy import DateTime, text
+
+# Внешний контент: FTS хранит только индекс, сам текст читается из
+# messages, поэтому база не растёт вдвое. Источник — представление с
+# колонкой owner (токен владельца чата «u<user_id>»): поиск пользователя
+# пересекает список его документов с термами запроса внутри индекса, а не
+# отбирает совпадения всех пользователей через JOIN
+_FTS_DDL = [
+    """
+    CREATE VIEW IF NOT EXISTS messages_fts_source AS
+    SELECT m.id AS id, m.content AS content, 'u' || c.user_id AS owner
+    FROM messages m
+    JOIN chats c ON c.id = m.chat_id
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content,
+        owner,
+        content='messages_fts_source',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, owner)
+        VALUES (new.id, new.content, (SELECT 'u' || user_id FROM chats WHERE id = new.chat_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, owner)
+        VALUES ('delete', old.id, old.content, (SELECT 'u' || user_id FROM chats WHERE id = old.chat_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, owner)
+        VALUES ('delete', old.id, old.content, (SELECT 'u' || user_id FROM chats WHERE id = old.chat_id));
+        INSERT INTO messages_fts(rowid, content, owner)
+        VALUES (new.id, new.content, (SELECT 'u' || user_id FROM chats WHERE id = new.chat_id));
+    END
+    """,
+]
+
+# Объекты первой версии индекса (без owner) — пересоздаются при миграции
+_FTS_LEGACY_OBJECTS = [
+    "DROP TRIGGER IF EXISTS messages_fts_ai",
+    "DROP TRIGGER IF EXISTS messages_fts_ad",
+    "DROP TRIGGER IF EXISTS messages_fts_au",
+    "DROP TABLE IF EXISTS messages_fts",
+]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Ограничиваем число термов, чтобы длинный ввод не превращался в тяжёлый MATCH
+_MAX_QUERY_TERMS = 8
+
+# Страница выдачи — keyset по (rank, id): следующая страница начинается
+# строго после последней строки предыдущей, без OFFSET. rank — bm25 с
+# весами из конфигурации индекса (см. create_fts)
+SEARCH_SQL = text("""
+    SELECT m.id AS message_id,
+           m.chat_id AS chat_id,
+           c.title AS chat_title,
+           m.role AS role,
+           m.created_at AS created_at,
+           snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet,
+           messages_fts.rank AS rank
+    FROM messages_fts
+    JOIN messages m ON m.id = messages_fts.rowid
+    JOIN chats c ON c.id = m.chat_id
+    WHERE messages_fts MATCH :match
+      AND c.user_id = :user_id
+      AND (:after_rank IS NULL
+           OR messages_fts.rank > :after_rank
+           OR (messages_fts.rank = :after_rank AND m.id < :after_id))
+    ORDER BY rank, m.id DESC
+    LIMIT :limit
+""").columns(created_at=DateTime)
+
+
+def create_fts(connection):
+    """Создаёт FTS5-индекс по messages и триггеры синхронизации.
+
+    Вызывается синхронно внутри ``run_sync``. При первом создании индекс
+    заполняется из уже существующих сообщений; индекс первой версии (без
+    колонки owner) пересоздаётся.
+    """
+    columns = {
+        row[0] for row in connection.execute(text("SELECT name FROM pragma_table_info('messages_fts')"))
+    }
+    if columns and "owner" not in columns:
+        for ddl in _FTS_LEGACY_OBJECTS:
+            connection.execute(text(ddl))
+        columns = set()
+    for ddl in _FTS_DDL:
+        connection.execute(text(ddl))
+    if not columns:
+        # owner в ранжировании не участвует (вес 0); настройка хранится в индексе
+        connection.execute(text("INSERT INTO messages_fts(messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')"))
+        connection.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+
+
+def build_match_query(query: str, user_id: int) -> Optional[str]:
+    """Превращает пользовательский ввод в безопасное FTS5-выражение.
+
+    Каждое слово берётся в кавычки (спецсимволы FTS не интерпретируются)
+    и ищется по префиксу в тексте сообщения; слова объединяются через AND.
+    Выражение ограничено документами пользователя ``user_id``.
+    """
+    terms = _TOKEN_RE.findall(query.lower())[:_MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return f'owner : "u{int(user_id)}" AND content : (' + " ".join(f'"{term}"*' for term in terms) + ")"
@@ -1,29 +1,83 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import sys
+from sqlalchemy import event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+import logging
+import os
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./app.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Сколько миллисекунд ждать освобождения блокировки записи SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+logger = logging.getLogger(__name__)
+
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL + synchronous=NORMAL: читатели не блокируют писателя, а fsync
+    выполняется на checkpoint, а не на каждый commit."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")  # ~16 МБ страничного кэша
+    cursor.close()
+
+# expire_on_commit=False: объекты остаются читаемыми после commit без
+# повторного (неявного, а значит блокирующего) запроса к БД
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 # Import models to ensure they're registered with Base
 from app.models.user import User
 from app.models.chat import Chat, Message
+from app.database.fts import create_fts
+
+# Денормализованные поля чатов, добавленные после первых релизов
+_CHAT_ACTIVITY_COLUMNS = {
+    "last_message_at": "DATETIME",
+    "last_message_preview": "TEXT",
+    "message_count": "INTEGER NOT NULL DEFAULT 0",
+}
+
+def _migrate_chat_activity(connection):
+    """create_all не добавляет колонки в существующую таблицу: добавляем их
+    и один раз заполняем из messages."""
+    existing = {column["name"] for column in inspect(connection).get_columns("chats")}
+    missing = [name for name in _CHAT_ACTIVITY_COLUMNS if name not in existing]
+    if not missing:
+        return
+    for name in missing:
+        connection.execute(text(f"ALTER TABLE chats ADD COLUMN {name} {_CHAT_ACTIVITY_COLUMNS[name]}"))
+    connection.execute(text("""
+        UPDATE chats SET
+            message_count = (SELECT count(*) FROM messages WHERE messages.chat_id = chats.id),
+            last_message_preview = (SELECT substr(content, 1, 200) FROM messages
+                                    WHERE messages.chat_id = chats.id ORDER BY id DESC LIMIT 1),
+            last_message_at = coalesce((SELECT created_at FROM messages
+                                        WHERE messages.chat_id = chats.id ORDER BY id DESC LIMIT 1),
+                                       created_at)
+    """))
+    logger.info("Добавлены поля активности чатов", extra={"columns": missing})
+
+def _create_all(connection):
+    Base.metadata.create_all(bind=connection)
+    _migrate_chat_activity(connection)
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+    create_fts(connection)
 
-def create_tables():
-    print("Создание таблиц в базе данных...", file=sys.stderr)
-    Base.metadata.create_all(bind=engine)
-    print("Таблицы успешно созданы!", file=sys.stderr)
+async def create_tables():
+    logger.info("Создание таблиц в базе данных...")
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_all)
+    logger.info("Таблицы успешно созданы!")
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
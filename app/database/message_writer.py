@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, select, update
+
+from app.database.init_db import AsyncSessionLocal
+from app.models.chat import Chat, Message
+
+# Длина превью последнего сообщения в списке чатов
+LAST_MESSAGE_PREVIEW_LEN = 200
+
+# Сколько ждать попутных сообщений после первого в пачке (секунды)
+MESSAGE_WRITER_FLUSH_INTERVAL = float(os.getenv("MESSAGE_WRITER_FLUSH_INTERVAL_MS", "10")) / 1000
+# Максимум сообщений в одной транзакции
+MESSAGE_WRITER_BATCH_SIZE = int(os.getenv("MESSAGE_WRITER_BATCH_SIZE", "100"))
+# Ограничение очереди: при переполнении save() ждёт (backpressure)
+MESSAGE_WRITER_QUEUE_SIZE = int(os.getenv("MESSAGE_WRITER_QUEUE_SIZE", "10000"))
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+_PendingRow = Tuple[Dict[str, Any], asyncio.Future]
+
+
+class MessageWriter:
+    """Фоновый писатель сообщений чата (write-behind).
+
+    Все соединения складывают вставки в общую очередь, а одна задача
+    объединяет их в групповые транзакции: вместо commit+fsync на каждое
+    сообщение SQLite получает одну транзакцию на пачку. Вызывающий код
+    ждёт future и получает сохранённый ``Message`` с id и created_at.
+    """
+
+    def __init__(self, flush_interval: float = MESSAGE_WRITER_FLUSH_INTERVAL,
+                 batch_size: int = MESSAGE_WRITER_BATCH_SIZE,
+                 max_queue_size: int = MESSAGE_WRITER_QUEUE_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="message-writer")
+
+    async def stop(self):
+        """Дописывает всё, что уже стоит в очереди, и останавливает задачу.
+
+        Сообщения, сохраняемые во время остановки, пишутся напрямую.
+        """
+        if not self.running:
+            return
+        self._stopping = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def save(self, chat_id: int, role: str, content: str, is_voice: int = 0) -> Message:
+        row = {"chat_id": chat_id, "role": role, "content": content, "is_voice": is_voice}
+        if not self.running or self._stopping:
+            # Писатель не запущен (скрипты, тесты) или останавливается — пишем напрямую
+            return (await self._insert([row]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch: List[_PendingRow] = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # save(), ждавший места в переполненной очереди, мог положить строку
+        # уже после _STOP: дописываем, пока такие строки появляются
+        while True:
+            leftovers = []
+            while not self._queue.empty() and len(leftovers) < self.batch_size:
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    leftovers.append(item)
+            if not leftovers:
+                break
+            await self._flush(leftovers)
+
+    async def _flush(self, batch: List[_PendingRow]):
+        try:
+            messages = await self._insert([row for row, _ in batch])
+        except Exception as e:
+            logger.error("Failed to write batch of %d: %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), message in zip(batch, messages):
+            if not future.done():
+                future.set_result(message)
+
+    @staticmethod
+    async def _insert(rows: List[Dict[str, Any]]) -> List[Message]:
+        async with AsyncSessionLocal() as db:
+            result = await db.scalars(
+                insert(Message).returning(Message, sort_by_parameter_order=True),
+                rows,
+            )
+            messages = result.all()
+            await _touch_chats(db, messages)
+            await db.commit()
+            return messages
+
+
+async def _touch_chats(db, messages: List[Message]):
+    """Обновляет денормализованные поля чатов в той же транзакции, что и вставка."""
+    latest: Dict[int, Message] = {}
+    counts: Dict[int, int] = {}
+    for message in messages:
+        latest[message.chat_id] = message
+        counts[message.chat_id] = counts.get(message.chat_id, 0) + 1
+    chats = Chat.__table__
+    await db.execute(
+        update(chats)
+        .where(chats.c.id == bindparam("b_chat_id"))
+        .values(
+            message_count=chats.c.message_count + bindparam("b_count"),
+            last_message_preview=bindparam("b_preview"),
+            # Время берём из самой строки сообщения — тот же формат, что у created_at
+            last_message_at=select(Message.created_at)
+            .where(Message.id == bindparam("b_message_id"))
+            .scalar_subquery(),
+            # Активность чата — не изменение его свойств: onupdate не срабатывает
+            updated_at=chats.c.updated_at,
+        ),
+        [
+            {
+                "b_chat_id": chat_id,
+                "b_count": counts[chat_id],
+                "b_preview": (message.content or "")[:LAST_MESSAGE_PREVIEW_LEN],
+                "b_message_id": message.id,
+            }
+            for chat_id, message in latest.items()
+        ],
+    )
+
+
+message_writer = MessageWriter()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -12,10 +12,22 @@ class Chat(Base):
     title = Column(String, default="New Chat")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Денормализовано для списка чатов; обновляется вместе со вставкой
+    # сообщений (app.database.message_writer). У пустого чата — время создания
+    last_message_at = Column(DateTime(timezone=True), default=func.now())
+    last_message_preview = Column(Text)
+    message_count = Column(Integer, default=0, nullable=False)
 
     # Relationships
     user = relationship("User", backref="chats")
     messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Список чатов пользователя и проверка владельца чата
+        Index("ix_chats_user_id_id", "user_id", "id"),
+        # Список чатов по последней активности: страница — range scan
+        Index("ix_chats_user_id_last_message_at_id", "user_id", "last_message_at", "id"),
+    )
     
     def dict(self):
         return {
@@ -38,6 +50,11 @@ class Message(Base):
 
     # Relationships
     chat = relationship("Chat", back_populates="messages")
+
+    __table_args__ = (
+        # Keyset-пагинация истории и поиск последнего сообщения чата
+        Index("ix_messages_chat_id_id", "chat_id", "id"),
+    )
     
     def dict(self):
         return {
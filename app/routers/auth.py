@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-import sys
+import logging
 
 from app.database.init_db import get_db
 from app.models.user import User
@@ -13,7 +14,8 @@ from app.utils.auth import (
     create_refresh_token, 
     get_password_hash, 
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    decode_token
+    decode_token,
+    token_claims
 )
 
 router = APIRouter(
@@ -21,10 +23,12 @@ router = APIRouter(
     tags=["auth"],
 )
 
+logger = logging.getLogger(__name__)
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Проверка, существует ли пользователь с таким именем
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = await db.scalar(select(User).where(User.username == user.username))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -33,7 +37,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     
     # Проверка, существует ли пользователь с таким email
     if user.email:
-        db_user = db.query(User).filter(User.email == user.email).first()
+        db_user = await db.scalar(select(User).where(User.email == user.email))
         if db_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -41,22 +45,21 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
             )
     
     # Создаем нового пользователя
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     
-    print(f"Registered new user: {user.username}", file=sys.stderr)
+    logger.info("Registered new user", extra={"username": user.username})
     return {"message": "User created successfully"}
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -67,13 +70,13 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     # Создаем access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     
     # Создаем refresh token
-    refresh_token = create_refresh_token(data={"sub": user.username})
+    refresh_token = create_refresh_token(data=token_claims(user))
     
-    print(f"User logged in: {user.username}", file=sys.stderr)
+    logger.info("User logged in", extra={"username": user.username})
     return {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -86,7 +89,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     }
 
 @router.post("/refresh", response_model=Token)
-async def refresh_access_token(token_data: RefreshToken, db: Session = Depends(get_db)):
+async def refresh_access_token(token_data: RefreshToken, db: AsyncSession = Depends(get_db)):
     refresh_token = token_data.refresh_token
     
     # Проверяем refresh token
@@ -100,7 +103,7 @@ async def refresh_access_token(token_data: RefreshToken, db: Session = Depends(g
     
     # Получаем пользователя
     username = user_data["username"]
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).where(User.username == username))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -111,13 +114,13 @@ async def refresh_access_token(token_data: RefreshToken, db: Session = Depends(g
     # Создаем новый access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     
     # Создаем новый refresh token
-    new_refresh_token = create_refresh_token(data={"sub": user.username})
+    new_refresh_token = create_refresh_token(data=token_claims(user))
     
-    print(f"Tokens refreshed for user: {user.username}", file=sys.stderr)
+    logger.info("Tokens refreshed", extra={"username": user.username})
     return {
         "access_token": access_token,
         "refresh_token": new_refresh_token,
@@ -1,26 +1,113 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
-from sqlalchemy.orm import Session
-from typing import List, Dict
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import String, and_, or_, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+import asyncio
+import base64
+import itertools
 import json
-import sys
+import logging
+import orjson
+import time
 
-from app.database.init_db import get_db
-from app.models.user import User
+from app.database.init_db import AsyncSessionLocal, get_db
+from app.database.message_writer import message_writer
+from app.database.fts import SEARCH_SQL, build_match_query
 from app.models.chat import Chat, Message
-from app.schemas.chat import ChatCreate, Chat as ChatSchema, ChatResponse, ChatListResponse, MessageCreate, Message as MessageSchema
+from app.models.user import User
+from app.schemas.chat import ChatCreate, Chat as ChatSchema, ChatListResponse, MessageCreate, Message as MessageSchema, SearchResponse
 from app.utils.auth import get_current_user, decode_token
-from app.utils.ai_agent_new import process_message
+from app.utils.auth_cache import CurrentUser
+from app.utils.ai_agent_new import process_message, process_message_stream
+from app.utils.serialization import dumps, dumps_text, encode_chat, encode_message, encode_messages, fast_response
+from app.utils.response_cache import response_cache
+from app.utils.broker import broker
+from app.utils.connections import ClientConnection, ReplyStream, connections
+from app.utils.rate_limit import CHAT_MESSAGE_LIMIT, rate_limiter, retry_after_header
+from app.utils.llm_scheduler import PRIORITY_INTERACTIVE, llm_context
 
 router = APIRouter(
     prefix="/chat",
     tags=["chat"],
+    # Ответы собираются в app.utils.serialization и отдаются через orjson
+    # без повторной валидации по response_model (он остаётся для OpenAPI)
+    default_response_class=ORJSONResponse,
 )
 
-# Store active websocket connections
-active_connections: Dict[int, List[WebSocket]] = {}
+logger = logging.getLogger(__name__)
+
+
+async def _on_chat_event(event: dict):
+    """Доставка события брокера в локальные соединения и сброс локального кэша."""
+    chat_id = event["chat_id"]
+    if event.get("owner_id") is not None:
+        response_cache.invalidate(event["owner_id"], chat_id)
+
+    frame = event.get("frame")
+    if frame is None:
+        return
+    # Не ждём отправки: у каждого соединения своя очередь и задача-отправитель
+    connections.broadcast(chat_id, dumps_text(frame))
+
+broker.subscribe(_on_chat_event)
+
+async def _publish_chat_update(chat_id: int, owner_id: Optional[int], frame: Optional[dict] = None):
+    """Сообщает всем воркерам об изменении чата.
+
+    Свой кэш сбрасываем сразу, не дожидаясь брокера, — чтобы GET сразу
+    после записи в этом же воркере видел новые данные.
+    """
+    if owner_id is not None:
+        response_cache.invalidate(owner_id, chat_id)
+    try:
+        await broker.publish({"chat_id": chat_id, "owner_id": owner_id, "frame": frame})
+    except Exception:
+        # Сообщение уже сохранено: без брокера другие воркеры узнают о нём по
+        # TTL кэша и при следующей загрузке истории, а запрос не падает
+        logger.exception("Chat update publish failed", extra={"chat_id": chat_id})
+
+def _message_frame(message) -> dict:
+    """Кадр сохранённого сообщения для всех соединений чата (клиент отбрасывает дубли по id)."""
+    return {"type": "message", **encode_message(message)}
+
+# Пагинация списка чатов
+CHAT_LIST_DEFAULT_LIMIT = 50
+CHAT_LIST_MAX_LIMIT = 200
+# Пагинация истории сообщений
+MESSAGES_DEFAULT_LIMIT = 50
+MESSAGES_MAX_LIMIT = 200
+# Пагинация полнотекстового поиска
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Сколько пропущенных сообщений отдаём при переподключении по WebSocket
+RESUME_MAX_MESSAGES = 500
 
-async def get_chat_or_404(chat_id: int, user_id: int, db: Session):
-    chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user_id).first()
+def _encode_chat_cursor(activity_key: str, chat_id: int) -> str:
+    raw = json.dumps([activity_key, chat_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_chat_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        activity_key, chat_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(activity_key), int(chat_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _encode_search_cursor(rank: float, message_id: int) -> str:
+    # repr float в JSON восстанавливается без потерь — сравнение rank точное
+    raw = json.dumps([rank, message_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        rank, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(message_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def get_chat_or_404(chat_id: int, user_id: int, db: AsyncSession):
+    chat = await db.scalar(select(Chat).where(Chat.id == chat_id, Chat.user_id == user_id))
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     return chat
@@ -28,244 +115,454 @@ async def get_chat_or_404(chat_id: int, user_id: int, db: Session):
 @router.post("/", response_model=ChatSchema)
 async def create_chat(
     chat: ChatCreate, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     db_chat = Chat(
         user_id=current_user.id,
         title=chat.title
     )
     db.add(db_chat)
-    db.commit()
-    db.refresh(db_chat)
-    return db_chat
+    await db.commit()
+    await db.refresh(db_chat)
+    await _publish_chat_update(db_chat.id, current_user.id)
+    return fast_response(encode_chat(db_chat))
 
 @router.get("/", response_model=ChatListResponse)
 async def get_chats(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    limit: int = Query(CHAT_LIST_DEFAULT_LIMIT, ge=1, le=CHAT_LIST_MAX_LIMIT),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    chats = db.query(Chat).filter(Chat.user_id == current_user.id).all()
-    
-    # Format the response with last message
-    chat_responses = []
-    for chat in chats:
-        last_message = db.query(Message).filter(Message.chat_id == chat.id).order_by(Message.created_at.desc()).first()
-        last_message_content = last_message.content if last_message else None
-        
-        chat_responses.append(ChatResponse(
-            id=chat.id,
-            title=chat.title,
-            created_at=chat.created_at,
-            updated_at=chat.updated_at,
-            last_message=last_message_content
+    """Список чатов пользователя, от последней активности к старой.
+
+    Последнее сообщение, его время и число сообщений хранятся в самой
+    строке чата и обновляются вместе со вставкой сообщения, поэтому
+    страница — это range scan по индексу (user_id, last_message_at, id)
+    без обращения к messages. Пагинация — по непрозрачному курсору.
+    """
+    cache_key = ("chats", None, cursor, limit)
+    cached = response_cache.get(current_user.id, cache_key)
+    if cached:
+        return cached.to_response(if_none_match)
+    # До запроса к БД: запись, закоммиченная во время построения, не даст
+    # сохранить устаревший ответ
+    generation = response_cache.generation(current_user.id)
+
+    # Сырое строковое значение из SQLite — по нему сравниваем курсор без
+    # потерь на разборе/форматировании дат
+    activity_key = type_coerce(Chat.last_message_at, String)
+
+    query = select(Chat, activity_key.label("activity_key")).where(Chat.user_id == current_user.id)
+
+    if cursor:
+        cursor_activity, cursor_id = _decode_chat_cursor(cursor)
+        query = query.where(or_(
+            activity_key < cursor_activity,
+            and_(activity_key == cursor_activity, Chat.id < cursor_id),
         ))
-    
-    return ChatListResponse(chats=chat_responses)
+
+    rows = (await db.execute(
+        query.order_by(activity_key.desc(), Chat.id.desc()).limit(limit + 1)
+    )).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_chat_cursor(last.activity_key, last.Chat.id)
+
+    chat_responses = [
+        {
+            "id": row.Chat.id,
+            "title": row.Chat.title,
+            "created_at": row.Chat.created_at,
+            "updated_at": row.Chat.updated_at,
+            "last_message": row.Chat.last_message_preview,
+            "message_count": row.Chat.message_count,
+            "last_activity": row.Chat.last_message_at,
+        }
+        for row in rows
+    ]
+
+    body = dumps({"chats": chat_responses, "next_cursor": next_cursor})
+    return response_cache.set(current_user.id, cache_key, body, generation).to_response(if_none_match)
+
+@router.get("/search", response_model=SearchResponse)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Полнотекстовый поиск по истории чатов текущего пользователя (FTS5).
+
+    Результаты ранжируются по bm25, совпадения в ``snippet`` выделены
+    ``<mark>``. Пагинация — по непрозрачному курсору (rank, id).
+    Объявлен до ``/{chat_id}``, чтобы путь не перехватывался.
+    """
+    match = build_match_query(q, current_user.id)
+    if not match:
+        return fast_response({"results": [], "next_cursor": None})
+
+    after_rank = after_id = None
+    if cursor:
+        after_rank, after_id = _decode_search_cursor(cursor)
+
+    rows = (await db.execute(SEARCH_SQL, {
+        "match": match,
+        "user_id": current_user.id,
+        "after_rank": after_rank,
+        "after_id": after_id,
+        "limit": limit + 1,
+    })).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_search_cursor(rows[-1]["rank"], rows[-1]["message_id"])
+
+    return fast_response({"results": [dict(row) for row in rows], "next_cursor": next_cursor})
 
 @router.get("/{chat_id}", response_model=ChatSchema)
 async def get_chat(
     chat_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     chat = await get_chat_or_404(chat_id, current_user.id, db)
-    return chat
+    return fast_response(encode_chat(chat))
 
 @router.post("/{chat_id}/messages", response_model=MessageSchema)
 async def create_message(
     chat_id: int,
     message: MessageCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     chat = await get_chat_or_404(chat_id, current_user.id, db)
     
     # Create user message
-    db_message = Message(
-        chat_id=chat.id,
-        role="user",
-        content=message.content,
-        is_voice=message.is_voice
-    )
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    db_message = await message_writer.save(chat.id, "user", message.content, message.is_voice)
+    await _publish_chat_update(chat.id, current_user.id, _message_frame(db_message))
     
     # Generate AI response
-    ai_response = await process_message(chat_id, message.content)
+    with llm_context(user=f"user:{current_user.id}", priority=PRIORITY_INTERACTIVE):
+        ai_response = await process_message(chat_id, message.content, db_message.id)
     
     # Save AI response
-    ai_message = Message(
-        chat_id=chat.id,
-        role="assistant",
-        content=ai_response,
-        is_voice=0
-    )
-    db.add(ai_message)
-    db.commit()
-    db.refresh(ai_message)
-    
-    # Notify websocket connections about new messages
-    if chat.id in active_connections:
-        for connection in active_connections[chat.id]:
-            try:
-                await connection.send_text(json.dumps({
-                    "user_message": db_message.dict(),
-                    "ai_message": ai_message.dict()
-                }))
-            except:
-                pass
+    ai_message = await message_writer.save(chat.id, "assistant", ai_response)
+
+    # Notify websocket connections about new messages (на всех воркерах)
+    await _publish_chat_update(chat.id, current_user.id, _message_frame(ai_message))
     
-    return db_message
+    return fast_response(encode_message(db_message))
 
 @router.get("/{chat_id}/messages", response_model=List[MessageSchema])
 async def get_messages(
     chat_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    before: Optional[int] = Query(None, ge=1, description="Сообщения с id меньше указанного"),
+    after: Optional[int] = Query(None, ge=0, description="Сообщения с id больше указанного"),
+    limit: int = Query(MESSAGES_DEFAULT_LIMIT, ge=1, le=MESSAGES_MAX_LIMIT),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
+    """Страница истории чата (keyset-пагинация по (chat_id, id)).
+
+    Без параметров возвращает последние ``limit`` сообщений. ``before`` листает
+    историю назад, ``after`` догружает новые сообщения. Ответ всегда
+    отсортирован по возрастанию id, каждая страница — range scan по индексу
+    ``ix_messages_chat_id_id``.
+    """
+    # Записи кэша создаются только после проверки владельца чата
+    cache_key = ("messages", chat_id, before, after, limit)
+    cached = response_cache.get(current_user.id, cache_key)
+    if cached:
+        return cached.to_response(if_none_match)
+    generation = response_cache.generation(current_user.id, chat_id)
+
     chat = await get_chat_or_404(chat_id, current_user.id, db)
-    messages = db.query(Message).filter(Message.chat_id == chat.id).order_by(Message.created_at).all()
+
+    # Только колонки, без ORM-сущностей: не заполняем identity map
+    query = select(
+        Message.id, Message.chat_id, Message.role, Message.content, Message.created_at, Message.is_voice
+    ).where(Message.chat_id == chat.id)
+    if before is not None:
+        query = query.where(Message.id < before)
+    if after is not None:
+        query = query.where(Message.id > after)
+
+    if after is not None and before is None:
+        # Догрузка вперёд: ближайшие к after сообщения
+        messages = (await db.execute(query.order_by(Message.id).limit(limit))).all()
+    else:
+        # Последняя страница или листание назад: берём хвост и разворачиваем
+        messages = (await db.execute(query.order_by(Message.id.desc()).limit(limit))).all()
+        messages = list(reversed(messages))
     
     # Отладочный вывод
-    print(f"Retrieved {len(messages)} messages for chat {chat_id}")
+    logger.debug("Retrieved messages", extra={"chat_id": chat_id, "count": len(messages)})
     
-    # Явное преобразование SQLAlchemy моделей в словари для корректной сериализации
-    result = []
-    for msg in messages:
-        result.append({
-            "id": msg.id,
-            "chat_id": msg.chat_id,
-            "role": msg.role,
-            "content": msg.content,
-            "created_at": msg.created_at.isoformat(),
-            "is_voice": msg.is_voice
-        })
-    
-    print(f"Serialized {len(result)} messages")
-    
-    return result
+    body = dumps(encode_messages(messages))
+    return response_cache.set(current_user.id, cache_key, body, generation).to_response(if_none_match)
+
+async def _stream_reply(stream: ReplyStream, chat_id: int, content: str, message_id: int) -> str:
+    """Пересылает события process_message_stream кадрами delta/reset.
+
+    Возвращает итоговый текст ответа. Основная метрика — время до первого
+    токена (TTFT), а не до конца генерации.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    async for event in process_message_stream(chat_id, content, message_id):
+        if event["type"] != "reset" and first_token_at is None:
+            first_token_at = time.perf_counter()
+        stream.push(event)
+
+    total = time.perf_counter() - started
+    ttft = (first_token_at - started) if first_token_at is not None else total
+    logger.info("Reply streamed", extra={"chat_id": chat_id, "request_id": stream.request_id, "ttft_ms": round(ttft * 1000), "total_ms": round(total * 1000)})
+    return stream.text
+
+async def _handle_request(connection: ClientConnection, chat_id: int, owner_id: Optional[int], request_id, message_data: dict):
+    """Обрабатывает один запрос клиента: сохраняет вопрос, стримит и сохраняет ответ.
+
+    Запускается отдельной задачей, поэтому несколько запросов одного
+    соединения идут параллельно; все кадры помечены ``request_id``.
+    Кадры ответа идут через ReplyStream: переподключившийся клиент
+    подхватывает недогенерированный ответ.
+    """
+    stream = None
+    try:
+        # Создаем сообщение пользователя в БД
+        db_message = await message_writer.save(
+            chat_id,
+            "user",
+            message_data.get("content", ""),
+            message_data.get("is_voice", 0)
+        )
+        logger.debug("User message saved", extra={"chat_id": chat_id, "message_id": db_message.id})
+        await _publish_chat_update(chat_id, owner_id, _message_frame(db_message))
+
+        stream = connections.open_stream(connection, request_id, encode_message(db_message))
+
+        # Обрабатываем с помощью AI, отправляя ответ по токенам. Вызовы модели
+        # идут в планировщик с интерактивным приоритетом от имени владельца чата
+        llm_user = f"user:{owner_id}" if owner_id is not None else f"chat:{chat_id}"
+        with llm_context(user=llm_user, priority=PRIORITY_INTERACTIVE):
+            ai_response = await _stream_reply(stream, chat_id, message_data.get("content", ""), db_message.id)
+
+        # Сохраняем ответ AI
+        ai_message = await message_writer.save(chat_id, "assistant", ai_response)
+        logger.debug("AI message saved", extra={"chat_id": chat_id, "message_id": ai_message.id})
+
+        # Финальный кадр: полный текст и id сохранённого сообщения. Слушатели
+        # ответа получают его раньше кадра message и заменяют им черновик
+        stream.finish({"type": "done", "request_id": request_id, **encode_message(ai_message)})
+        await _publish_chat_update(chat_id, owner_id, _message_frame(ai_message))
+        logger.debug("Response sent", extra={"chat_id": chat_id, "request_id": request_id, "message_id": ai_message.id})
+    except asyncio.CancelledError:
+        # Клиент прислал cancel: частичный ответ не сохраняем
+        logger.info("Request cancelled", extra={"chat_id": chat_id, "request_id": request_id})
+        frame = {"type": "cancelled", "request_id": request_id}
+        if stream is not None:
+            stream.finish(frame)
+        else:
+            connection.send(dumps_text(frame), droppable=False)
+        raise
+    except Exception as e:
+        logger.exception("Error processing message", extra={"chat_id": chat_id, "request_id": request_id})
+        frame = {"error": "Error processing message", "details": str(e), "request_id": request_id}
+        if stream is not None:
+            stream.finish(frame)
+        else:
+            connection.send(dumps_text(frame), droppable=False)
+
+async def _resume_frames(connection: ClientConnection, chat_id: int, last_message_id: int) -> List[str]:
+    """Кадры, догоняющие переподключившегося клиента до текущего состояния чата.
+
+    Сначала подписываемся на генерируемые ответы (их снимок берётся сейчас,
+    а следующие delta придерживаются в соединении), затем читаем из БД
+    сообщения новее ``last_message_id``. Сообщение, сохранённое между этими
+    шагами, может прийти дважды — клиент различает их по id.
+    """
+    stream_frames: List[str] = []
+    for stream in connections.streams(chat_id):
+        stream_frames.extend(stream.attach(connection))
+
+    async with AsyncSessionLocal() as db:
+        messages = (await db.scalars(
+            select(Message)
+            .where(Message.chat_id == chat_id, Message.id > last_message_id)
+            .order_by(Message.id)
+            .limit(RESUME_MAX_MESSAGES + 1)
+        )).all()
+
+    if len(messages) > RESUME_MAX_MESSAGES:
+        # Пропущено слишком много — дешевле перечитать историю через REST
+        return [dumps_text({"type": "resync"})] + stream_frames
+
+    frames = [dumps_text(_message_frame(m)) for m in messages]
+    frames.extend(stream_frames)
+    frames.append(dumps_text({
+        "type": "resumed",
+        "last_message_id": messages[-1].id if messages else last_message_id,
+        "replayed": len(messages),
+    }))
+    return frames
+
+# id для запросов, в которых клиент его не указал. Общий счётчик воркера:
+# после переподключения id подхваченных запросов не пересекаются с новыми
+_auto_request_ids = itertools.count(1)
+
+def _send_error(connection: ClientConnection, error: str, request_id=None, details: Optional[str] = None):
+    frame = {"error": error, "request_id": request_id}
+    if details is not None:
+        frame["details"] = details
+    connection.send(dumps_text(frame), droppable=False)
 
 @router.websocket("/ws/{chat_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
-    chat_id: int,
-    db: Session = Depends(get_db)
+    chat_id: int
 ):
-    print(f"[WebSocket] Connection attempt for chat {chat_id}", file=sys.stderr)
-    print(f"[WebSocket] URL: {websocket.url}", file=sys.stderr)
-    print(f"[WebSocket] Headers: {dict(websocket.headers)}", file=sys.stderr)
-    print(f"[WebSocket] Query params: {dict(websocket.query_params)}", file=sys.stderr)
+    # Без заголовков и query: в них токен
+    logger.debug("Connection attempt", extra={"chat_id": chat_id, "client": websocket.client.host if websocket.client else None})
     
+    connection = None
     try:
         await websocket.accept()
-        print(f"[WebSocket] Connection accepted for chat {chat_id}", file=sys.stderr)
+        logger.debug("Connection accepted", extra={"chat_id": chat_id})
         
         # Валидация аутентификации
         try:
             # В WebSocket нет normal headers, получаем из query параметров
             token = websocket.query_params.get("token")
-            print(f"[WebSocket] Token from query params: {token[:10] if token else None}...", file=sys.stderr)
             
             if not token:
                 auth_header = websocket.headers.get("Authorization")
-                print(f"[WebSocket] Authorization header: {auth_header}", file=sys.stderr)
                 if auth_header and auth_header.startswith("Bearer "):
                     token = auth_header.split(" ")[1]
-                    print(f"[WebSocket] Token from Authorization header: {token[:10] if token else None}...", file=sys.stderr)
             
             if not token:
-                print(f"[WebSocket] Closed: No authentication token provided", file=sys.stderr)
+                logger.info("Closed: no authentication token provided", extra={"chat_id": chat_id})
                 await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
                 return
                 
             # Проверка токена
             payload = decode_token(token)
             if not payload:
-                print(f"[WebSocket] Invalid token, closing connection", file=sys.stderr)
+                logger.info("Invalid token, closing connection", extra={"chat_id": chat_id})
                 await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
                 return
             
             username = payload.get("username")
-            print(f"[WebSocket] Authenticated user: {username}", file=sys.stderr)
+            logger.debug("Authenticated user", extra={"chat_id": chat_id, "username": username})
+            # Ключ для лимита сообщений — тот же, что у REST (app.utils.rate_limit)
+            identity = f"user:{payload['user_id'] if payload.get('user_id') is not None else username}"
+
+            # Владелец чата: чужой (или несуществующий) чат не открываем —
+            # ни истории при возобновлении, ни живых кадров
+            user_id = payload.get("user_id")
+            async with AsyncSessionLocal() as db:
+                owner_id = await db.scalar(select(Chat.user_id).where(Chat.id == chat_id))
+                if user_id is None:
+                    # Токены, выпущенные до появления uid в claims
+                    user_id = await db.scalar(select(User.id).where(User.username == username))
+            if owner_id is None or owner_id != user_id:
+                logger.info("Chat not owned by user, closing connection", extra={"chat_id": chat_id, "username": username})
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
             
-            # Добавляем соединение к активным
-            if chat_id not in active_connections:
-                active_connections[chat_id] = []
-            active_connections[chat_id].append(websocket)
-            print(f"[WebSocket] Connection added for chat {chat_id}, total connections: {len(active_connections[chat_id])}", file=sys.stderr)
+            # Переподключение: клиент сообщает id последнего полученного сообщения
+            last_message_id = None
+            raw_last_message_id = websocket.query_params.get("last_message_id")
+            if raw_last_message_id is not None:
+                try:
+                    last_message_id = int(raw_last_message_id)
+                except ValueError:
+                    logger.info("Invalid last_message_id", extra={"chat_id": chat_id, "value": raw_last_message_id})
+
+            # Добавляем соединение к активным; при возобновлении живые кадры
+            # придерживаются, пока клиент не получит пропущенное
+            connection = connections.connect(chat_id, websocket, held=last_message_id is not None)
+            logger.info("Connection added", extra={"chat_id": chat_id, "connections": connections.count(chat_id)})
+
+            if last_message_id is not None:
+                frames = await _resume_frames(connection, chat_id, last_message_id)
+                connection.release(frames)
+                logger.info("Resumed", extra={"chat_id": chat_id, "last_message_id": last_message_id, "frames": len(frames)})
             
             try:
                 while True:
                     try:
                         data = await websocket.receive_text()
-                        print(f"[WebSocket] Received data: {data[:100]}...", file=sys.stderr)
-                        message_data = json.loads(data)
-                        
+                        logger.debug("Received frame", extra={"chat_id": chat_id, "size": len(data)})
+                        message_data = orjson.loads(data)
+                        if not isinstance(message_data, dict):
+                            _send_error(connection, "Invalid message format", details="Expected a JSON object")
+                            continue
+
+                        request_id = message_data.get("request_id")
+                        if request_id is not None and (isinstance(request_id, bool) or not isinstance(request_id, (str, int))):
+                            _send_error(connection, "Invalid request_id")
+                            continue
+
+                        # Отмена запроса, который ещё обрабатывается
+                        if message_data.get("type") == "cancel":
+                            if not connection.cancel_request(request_id):
+                                _send_error(connection, "Unknown request_id", request_id)
+                            continue
+
                         # Проверяем тип сообщения, пропускаем служебные сообщения
                         if message_data.get("type") == "ping" or not message_data.get("content"):
-                            print(f"[WebSocket] Skipping service message type: {message_data.get('type', 'unknown')}", file=sys.stderr)
+                            logger.debug("Skipping service message", extra={"chat_id": chat_id, "type": message_data.get("type", "unknown")})
                             continue
-                        
-                        # Создаем сообщение пользователя в БД
-                        db_message = Message(
-                            chat_id=chat_id,
-                            role="user",
-                            content=message_data.get("content", ""),
-                            is_voice=message_data.get("is_voice", 0)
-                        )
-                        db.add(db_message)
-                        db.commit()
-                        db.refresh(db_message)
-                        print(f"[WebSocket] User message saved to DB: {db_message.id}", file=sys.stderr)
-                        
-                        # Обрабатываем с помощью AI
-                        ai_response = await process_message(chat_id, message_data.get("content", ""))
-                        
-                        # Сохраняем ответ AI
-                        ai_message = Message(
-                            chat_id=chat_id,
-                            role="assistant",
-                            content=ai_response,
-                            is_voice=0
+
+                        if request_id is None:
+                            request_id = f"auto-{next(_auto_request_ids)}"
+                        if connection.has_request(request_id):
+                            _send_error(connection, "Duplicate request_id", request_id)
+                            continue
+                        if connection.inflight >= connection.max_inflight:
+                            _send_error(connection, "Too many requests in flight", request_id)
+                            continue
+                        allowed, retry_after = await rate_limiter.hit(CHAT_MESSAGE_LIMIT, identity)
+                        if not allowed:
+                            connection.send(dumps_text({
+                                "error": "Too many requests",
+                                "request_id": request_id,
+                                "retry_after": int(retry_after_header(retry_after))
+                            }), droppable=False)
+                            continue
+
+                        # Не ждём ответа: следующий запрос можно принять сразу
+                        connection.start_request(
+                            request_id,
+                            _handle_request(connection, chat_id, owner_id, request_id, message_data)
                         )
-                        db.add(ai_message)
-                        db.commit()
-                        db.refresh(ai_message)
-                        print(f"[WebSocket] AI message saved to DB: {ai_message.id}", file=sys.stderr)
-                        
-                        # Отправляем ответ обратно
-                        response_data = {
-                            "id": ai_message.id,
-                            "role": "assistant",
-                            "content": ai_response,
-                            "created_at": ai_message.created_at.isoformat(),
-                            "is_voice": 0
-                        }
-                        await websocket.send_text(json.dumps(response_data))
-                        print(f"[WebSocket] Response sent via WebSocket: {ai_message.id}", file=sys.stderr)
+                    except WebSocketDisconnect:
+                        # Пробрасываем наверх, иначе общий except ниже зациклит receive
+                        raise
                     except json.JSONDecodeError as e:
-                        print(f"[WebSocket] JSON decode error: {e}", file=sys.stderr)
-                        await websocket.send_text(json.dumps({
-                            "error": "Invalid JSON format",
-                            "details": str(e)
-                        }))
+                        logger.info("JSON decode error: %s", e, extra={"chat_id": chat_id})
+                        _send_error(connection, "Invalid JSON format", details=str(e))
                     except Exception as e:
-                        print(f"[WebSocket] Error processing message: {str(e)}", file=sys.stderr)
-                        await websocket.send_text(json.dumps({
-                            "error": "Error processing message",
-                            "details": str(e)
-                        }))
+                        logger.exception("Error processing frame", extra={"chat_id": chat_id})
+                        _send_error(connection, "Error processing message", details=str(e))
                     
             except WebSocketDisconnect:
-                if chat_id in active_connections and websocket in active_connections[chat_id]:
-                    active_connections[chat_id].remove(websocket)
-                    print(f"[WebSocket] Disconnected for chat {chat_id}", file=sys.stderr)
+                await connections.disconnect(connection)
+                logger.info("Disconnected", extra={"chat_id": chat_id})
         except Exception as e:
-            print(f"[WebSocket] Error in WebSocket handler: {str(e)}", file=sys.stderr)
-            if chat_id in active_connections and websocket in active_connections[chat_id]:
-                active_connections[chat_id].remove(websocket)
-            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+            logger.exception("Error in WebSocket handler", extra={"chat_id": chat_id})
+            if connection is not None:
+                await connection.close(code=status.WS_1011_INTERNAL_ERROR)
+            else:
+                await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
     except Exception as e:
-        print(f"[WebSocket] Failed to accept connection: {str(e)}", file=sys.stderr) 
\ No newline at end of file
+        logger.exception("Failed to accept connection", extra={"chat_id": chat_id}) 
\ No newline at end of file
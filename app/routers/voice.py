@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Request
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
 import json
 import logging
 import os
@@ -16,8 +15,7 @@ from app.utils.auth import get_current_user
 from app.utils.salutespeech_client import SaluteSpeechClient, SALUTE_SPEECH_VOICES, VOICE_DESCRIPTIONS, DEFAULT_VOICE
 # from app.routers.mongo_adapter import get_mongo_collections
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Логирование настраивается в app.utils.logging_setup
 logger = logging.getLogger(__name__)
 
 # --- НАСТРОЙКА FFMPEG ---
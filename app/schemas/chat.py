@@ -38,6 +38,22 @@ class ChatResponse(ChatBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     last_message: Optional[str] = None
+    message_count: int = 0
+    last_activity: Optional[datetime] = None
 
 class ChatListResponse(BaseModel):
-    chats: List[ChatResponse] 
\ No newline at end of file
+    chats: List[ChatResponse]
+    next_cursor: Optional[str] = None  # курсор следующей страницы (None — страниц больше нет) 
+
+class SearchHit(BaseModel):
+    message_id: int
+    chat_id: int
+    chat_title: str
+    role: str
+    snippet: str  # фрагмент с совпадениями, выделенными <mark>…</mark>
+    created_at: datetime
+    rank: float
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+    next_cursor: Optional[str] = None
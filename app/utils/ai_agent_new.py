@@ -1,38 +1,57 @@
 import asyncio
+import contextvars
 import json
+import logging
+import os
+import threading
 from functools import lru_cache
 import re
+from typing import AsyncIterator, Callable, Iterator, Optional
 
 # Импортируем инструменты из news_agent
-from new_agent.main import run_news_agent, safe_model_invoke, search_tool
+from new_agent.main import (
+    async_model_available,
+    run_news_agent,
+    safe_model_ainvoke,
+    safe_model_astream,
+    safe_model_stream,
+    search_tool,
+)
 
 # Новый импорт — улучшенный парсер на базе старого агента
-from app.utils.news_parser_old import get_news_summary
+from app.utils.answer_cache import CATEGORY_CHAT, CATEGORY_NEWS, CATEGORY_WEB, answer_cache
+from app.utils.chat_memory import ChatHistory, chat_memory, render_history
+from app.utils.llm_scheduler import PRIORITY_BACKGROUND, llm_context
+from app.utils.llm_memo import KIND_CLASSIFY, KIND_PREPROCESS, KIND_REWRITE, KIND_WEB_SEARCH, llm_memo
+from app.utils.news_parser_old import append_sources, build_news_prompt
+from app.utils.query_router import LABEL_NEWS, RouteDecision, query_router
+from app.utils.single_flight import flight_key, llm_flights, news_flights, query_key
 
 # Порог, после которого считаем, что news-агент «не смог» ответить
 _MIN_MEANINGFUL_LEN = 30
 
+# Общий бюджет времени на ответ (секунды): по его истечении незавершённые ветки отменяются
+ANSWER_LATENCY_BUDGET = float(os.getenv("ANSWER_LATENCY_BUDGET", "120"))
+
+_TIMEOUT_MESSAGE = "Не удалось подготовить ответ за отведённое время. Попробуйте ещё раз."
+
+logger = logging.getLogger(__name__)
+
 # ----------------------------------------------------------------------------
 # Вспомогательные функции
 # ----------------------------------------------------------------------------
 
 @lru_cache(maxsize=256)
-def _is_news_query(text: str) -> bool:
-    """Определяет, является ли запрос *новостным* только через LLM.
+def _route_locally(text: str) -> RouteDecision:
+    """Решение локального ``query_router`` (ключевые правила + наивный Байес, микросекунды)."""
+    decision = query_router.classify(text)
+    if query_router.confident(decision):
+        logger.debug("Query routed locally", extra={"label": decision.label, "source": decision.source,
+                                                    "confidence": round(decision.confidence, 3)})
+    return decision
 
-    Отправляет запрос в GigaChat (safe_model_invoke) с просьбой вернуть
-    строго `news` или `chat`.
-
-    Добавлена быстрая эвристика: если текст короче 20 символов и содержит
-    одно из распространённых приветствий/фраз ("как дела", "привет" и т.д.),
-    сразу считаем его обычным чатом, чтобы не гонять LLM.
-    """
-
-    lower_text = text.lower().strip()
-    greeting_triggers = [
-        "как дела", "как у тебя дела", "привет", "доброе утро", "добрый вечер",
-        "добрый день", "здравствуй", "здравствуйте"
-    ]
+async def _ask_is_news(text: str, decision: RouteDecision) -> bool:
+    """LLM-классификатор news/chat; при сбое модели — догадка ``decision``."""
 
     # Более строгий промпт, чтобы отделять запросы "рецепт" и другие от новостей
     prompt = (
@@ -51,12 +70,19 @@ def _is_news_query(text: str) -> bool:
         "Запрос: " + text
     )
 
+    async def ask() -> Optional[str]:
+        # Пустой ответ — модель недоступна; такой результат не кэшируем
+        resp = (await safe_model_ainvoke(prompt, "")).strip().lower()
+        if not resp:
+            return None
+        return "news" if resp.startswith("news") else "chat"
+
     try:
-        resp = safe_model_invoke(prompt, "chat").strip().lower()
-        return resp.startswith("news")
+        label = await llm_memo.aget_or_compute(KIND_CLASSIFY, text, ask)
     except Exception:
-        # При ошибке классифицируем как обычное общение
-        return False
+        label = None
+    # Если модель не ответила, доверяем лучшей догадке локального классификатора
+    return (label or decision.label) == LABEL_NEWS
 
 # ----------------------------------------------------------------------------
 # Вспомогательная утилита: получить свежую информацию из интернета
@@ -73,7 +99,7 @@ async def _answer_with_web_search(query: str) -> str:
     loop = asyncio.get_event_loop()
 
     # Переписываем запрос для более точного поиска
-    search_query = _rewrite_query(query, "general")
+    search_query = await _rewrite_query(query, "general")
 
     # Поиск (может быть блокирующим) – выполняем в треде
     raw_results = await loop.run_in_executor(None, lambda: search_tool.invoke(search_query)) or []
@@ -112,7 +138,7 @@ async def _answer_with_web_search(query: str) -> str:
 Сформулируй краткий, точный ответ на русском языке, ссылаясь (в квадратных скобках) на номера использованных источников.
 """
 
-    return await loop.run_in_executor(None, lambda: safe_model_invoke(prompt, ""))
+    return await safe_model_ainvoke(prompt, "")
 
 # ----------------------------------------------------------------------------
 # Новый классификатор: нужен ли веб-поиск
@@ -132,13 +158,13 @@ _LOCAL_KNOWLEDGE_TOPICS = [
     r"как сделать", r"как сварить", r"как приготовить", r"how to cook", r"how to make"
 ]
 
-@lru_cache(maxsize=256)
-def _needs_web_search(text: str) -> bool:
+async def _needs_web_search(text: str, hint: Optional[bool] = None) -> bool:
     """Определяет, требуется ли веб-поиск для ответа.
 
     Если запрос содержит явные вопросительные слова или знак вопроса, считаем,
     что нужна проверка информации. Обычные приветствия/реплики без вопроса не
-    должны отдавать ссылки.
+    должны отдавать ссылки. ``hint`` — ответ модели из _preprocess: если он
+    есть, отдельный LLM-классификатор не вызывается.
     """
 
     lower = text.lower()
@@ -156,13 +182,22 @@ def _needs_web_search(text: str) -> bool:
     if len(lower) > 120:
         return False
 
+    if hint is not None:
+        return hint
+
     # Запасной вариант: быстрый LLM-классификатор
     prompt = (
         "Нужен ли веб-поиск, чтобы корректно ответить на следующий запрос? "
         "Ответь одним словом 'yes' или 'no'. Запрос: " + text
     )
+    async def ask() -> Optional[str]:
+        resp = (await safe_model_ainvoke(prompt, "")).strip().lower()
+        if not resp:
+            return None
+        return "yes" if resp.startswith("y") else "no"
+
     try:
-        return safe_model_invoke(prompt, "no").strip().lower().startswith("y")
+        return await llm_memo.aget_or_compute(KIND_WEB_SEARCH, text, ask) == "yes"
     except Exception:
         return False
 
@@ -170,7 +205,7 @@ def _needs_web_search(text: str) -> bool:
 # Подготовка запроса к веб-поиску (rewriter)
 # ----------------------------------------------------------------------------
 
-def _rewrite_query(text: str, mode: str = "general") -> str:
+async def _rewrite_query(text: str, mode: str = "general") -> str:
     """Переписывает пользовательский запрос для подачи в поисковик.
 
     mode="news"      — нужен запрос, оптимальный для новостного поиска (добавить год, ключевые слова «news»).
@@ -190,78 +225,533 @@ def _rewrite_query(text: str, mode: str = "general") -> str:
         f"Оригинал: {text}"
     )
 
-    try:
-        rewritten = safe_model_invoke(prompt, text).strip()
+    async def ask() -> Optional[str]:
         # Ограничиваем длину до 120 символов — этого достаточно для поисковика
-        return rewritten[:120]
+        return (await safe_model_ainvoke(prompt, "")).strip()[:120] or None
+
+    try:
+        # Режим входит в ключ: для новостей и общего поиска запросы разные
+        return await llm_memo.aget_or_compute(KIND_REWRITE, f"{mode}:{text}", ask) or text
     except Exception:
         return text
 
-async def process_message(chat_id: int, user_message: str) -> str:
+# ----------------------------------------------------------------------------
+# Совмещённая предобработка: классификация, переписывание и перевод за один вызов
+# ----------------------------------------------------------------------------
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.S)
+_MAX_QUERY_LEN = 120
+
+class _Preprocessed:
+    """Разбор запроса моделью: намерение, поисковый запрос на RU/EN, нужен ли веб-поиск."""
+
+    __slots__ = ("intent", "query_ru", "query_en", "web_search")
+
+    def __init__(self, intent: str, query_ru: str, query_en: str, web_search: bool):
+        self.intent = intent
+        self.query_ru = query_ru
+        self.query_en = query_en
+        self.web_search = web_search
+
+def _parse_preprocessed(raw: str) -> Optional[_Preprocessed]:
+    """Строгий разбор ответа модели; всё, что не похоже на ожидаемый JSON, — None."""
+    match = _JSON_OBJECT_RE.search(raw or "")
+    if match is None:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    intent = data.get("intent")
+    query_ru = data.get("query_ru")
+    query_en = data.get("query_en")
+    web_search = data.get("web_search")
+    if intent not in ("news", "chat") or not isinstance(web_search, bool):
+        return None
+    if not isinstance(query_ru, str) or not isinstance(query_en, str):
+        return None
+    query_ru = query_ru.strip().strip('"\'')[:_MAX_QUERY_LEN]
+    query_en = query_en.strip().strip('"\'')[:_MAX_QUERY_LEN]
+    if not query_ru or not query_en:
+        return None
+    return _Preprocessed(intent, query_ru, query_en, web_search)
+
+async def _preprocess(text: str) -> Optional[_Preprocessed]:
+    """Один вызов модели вместо трёх: news/chat, переписанный запрос (RU и EN), нужен ли поиск.
+
+    Заменяет связку _ask_is_news → _rewrite_query("news") →
+    _translate_if_needed. Если модель недоступна или ответ не проходит
+    строгий разбор, возвращает None — вызывающий переходит на отдельные
+    промпты.
+    """
+    prompt = (
+        "Проанализируй запрос пользователя и верни ТОЛЬКО JSON-объект без пояснений и Markdown:\n"
+        '{"intent": "news" или "chat", "query_ru": "...", "query_en": "...", "web_search": true или false}\n\n'
+        "intent:\n"
+        "news — если человек просит актуальные новости, аналитику свежих событий, обзор СМИ;\n"
+        "chat — если это дружеское общение, личный вопрос, совет, рецепт, инструкция, учебный материал "
+        "или любой вопрос, НЕ требующий просмотра СМИ за последние дни.\n"
+        "query_ru — лаконичный ключевой запрос на русском для поиска новостей последних дней, "
+        "без стоп-слов (расскажи, пожалуйста и т.д.);\n"
+        "query_en — тот же ключевой запрос на английском;\n"
+        "web_search — нужен ли веб-поиск, чтобы корректно ответить на запрос.\n\n"
+        "Примеры:\n"
+        '"Как приготовить яблочный пирог?" → {"intent": "chat", "query_ru": "рецепт яблочного пирога", '
+        '"query_en": "apple pie recipe", "web_search": false}\n'
+        '"Расскажи последние новости про Tesla" → {"intent": "news", "query_ru": "Tesla новости", '
+        '"query_en": "Tesla news", "web_search": true}\n\n'
+        "Запрос: " + text
+    )
+
+    async def ask() -> Optional[str]:
+        prep = _parse_preprocessed(await safe_model_ainvoke(prompt, ""))
+        if prep is None:
+            # Пустой или неразборчивый ответ не кэшируем
+            return None
+        return json.dumps({"intent": prep.intent, "query_ru": prep.query_ru, "query_en": prep.query_en,
+                           "web_search": prep.web_search}, ensure_ascii=False)
+
+    try:
+        raw = await llm_memo.aget_or_compute(KIND_PREPROCESS, text, ask)
+    except Exception:
+        raw = None
+    prep = _parse_preprocessed(raw) if raw else None
+    if prep is None:
+        logger.info("Preprocess fallback to separate prompts")
+    return prep
+
+# prep_task ждут несколько веток; shield — чтобы отмена одной из них не отменила разбор для остальных
+async def _resolve_intent(prep_task: "asyncio.Future", text: str, decision: RouteDecision) -> bool:
+    prep = await asyncio.shield(prep_task)
+    if prep is not None:
+        return prep.intent == LABEL_NEWS
+    return await _ask_is_news(text, decision)
+
+async def _news_queries(prep_task: "asyncio.Future", text: str):
+    """Новостной запрос и его английский вариант (None — перевести отдельно)."""
+    prep = await asyncio.shield(prep_task)
+    if prep is not None:
+        return prep.query_ru, prep.query_en
+    return await _rewrite_query(text, "news"), None
+
+def _normalize_user_message(user_message) -> str:
+    """Достаёт текст из сообщения, пришедшего JSON-строкой, и приводит к str."""
+    # Проверяем, не является ли сообщение уже JSON-объектом в виде строки
+    if isinstance(user_message, str) and user_message.strip().startswith('{') and user_message.strip().endswith('}'):
+        try:
+            # Попытка распарсить JSON
+            json_data = json.loads(user_message)
+            # Если в JSON есть поле content, используем его как сообщение
+            if isinstance(json_data, dict) and 'content' in json_data:
+                user_message = json_data['content']
+            # В противном случае просто обрабатываем весь JSON как текст
+        except json.JSONDecodeError:
+            # Если это не валидный JSON, используем исходное сообщение
+            pass
+
+    # Убедимся, что user_message - строка
+    if not isinstance(user_message, str):
+        user_message = str(user_message)
+    return user_message
+
+async def _iterate_in_thread(make_iterator: Callable[[Callable[[], bool]], Iterator[str]]) -> AsyncIterator[str]:
+    """Прогоняет блокирующий генератор в треде и отдаёт его элементы в event loop.
+
+    ``make_iterator`` получает проверку отмены: при выходе из async-итерации
+    (клиент отключился, ветка проиграла) она начинает возвращать True, и
+    генератор может не ждать слот модели и не вызывать её. В любом случае
+    тред останавливается на следующем элементе.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    finished = object()
+
+    def _put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # Event loop уже закрыт
+            stop.set()
+
+    def _worker():
+        try:
+            for item in make_iterator(stop.is_set):
+                if stop.is_set():
+                    break
+                _put(item)
+        except Exception as e:
+            _put(e)
+        finally:
+            _put(finished)
+
+    # Контекст (пользователь и приоритет для llm_scheduler) переносим в тред
+    loop.run_in_executor(None, contextvars.copy_context().run, _worker)
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def _delta(content: str) -> dict:
+    return {"type": "delta", "content": content}
+
+# Отменяет уже отправленные дельты: клиент очищает черновик ответа
+_RESET = {"type": "reset"}
+
+def _collect(parts: list, event: dict):
+    """Накопление итогового текста из событий delta/reset."""
+    if event["type"] == "reset":
+        parts.clear()
+    else:
+        parts.append(event["content"])
+
+class _Outcome:
+    """Итог генерации ответа: категория для TTL кэша и можно ли его кэшировать."""
+
+    __slots__ = ("category", "cacheable")
+
+    def __init__(self, category: str):
+        self.category = category
+        self.cacheable = True
+
+class _Deadline:
+    """Общий бюджет времени запроса: каждое ожидание ограничено остатком."""
+
+    __slots__ = ("_loop", "_at")
+
+    def __init__(self, budget: float):
+        self._loop = asyncio.get_running_loop()
+        self._at = self._loop.time() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self._at - self._loop.time())
+
+    async def wait(self, awaitable):
+        return await asyncio.wait_for(awaitable, self.remaining())
+
+    async def iterate(self, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        iterator = tokens.__aiter__()
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(iterator.__anext__(), self.remaining())
+                except StopAsyncIteration:
+                    return
+                yield token
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+
+_END = object()
+
+class _BufferedStream:
+    """Потоковый ответ модели, запущенный заранее.
+
+    Токены копятся в очереди, пока не станет ясно, нужен ли этот ответ;
+    ``cancel`` останавливает генерацию (тред завершится на следующем токене).
+    """
+
+    def __init__(self, tokens: AsyncIterator[str]):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._pump(tokens))
+
+    async def _pump(self, tokens: AsyncIterator[str]):
+        try:
+            async for token in tokens:
+                self._queue.put_nowait(token)
+        except Exception as e:
+            self._queue.put_nowait(e)
+        finally:
+            self._queue.put_nowait(_END)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            item = await self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self._task.cancel()
+
+def _cancel(*branches):
+    """Отменяет проигравшие спекулятивные ветки (задачи и _BufferedStream)."""
+    for branch in branches:
+        if branch is None:
+            continue
+        if isinstance(branch, asyncio.Future) and branch.done() and not branch.cancelled():
+            # Забираем исключение, чтобы asyncio не ругался на «never retrieved»
+            branch.exception()
+        branch.cancel()
+
+def _model_stream(prompt: str) -> AsyncIterator[str]:
+    """Потоковый ответ модели; одинаковые одновременные промпты делят один вызов.
+
+    С асинхронным клиентом GigaChat поток идёт без тредов (слот — через
+    ``aslot``); иначе синхронный ``safe_model_stream`` крутится в треде.
     """
-    Обрабатывает сообщение пользователя с использованием переписанного агента
+    if async_model_available():
+        factory = lambda: safe_model_astream(prompt, "")
+    else:
+        factory = lambda: _iterate_in_thread(
+            lambda should_stop: safe_model_stream(prompt, "", should_stop=should_stop)
+        )
+    return llm_flights.stream(flight_key(prompt), factory)
+
+async def _build_news_prompt(news_query: str, query_en: Optional[str] = None):
+    """Сбор статей и промпт сводки; одинаковые запросы ждут один сбор.
+
+    Сбор идёт в треде. Если его больше никто не ждёт (проигравшая ветка
+    отменена), тред прекращает поиск и загрузку статей на ближайшей проверке.
     """
+    async def _collect():
+        stop = threading.Event()
+        try:
+            return await asyncio.to_thread(build_news_prompt, news_query, 5, query_en, stop.is_set)
+        finally:
+            stop.set()
+
+    # Английский вариант меняет поисковую выдачу, поэтому он тоже часть ключа
+    return await news_flights.ado(query_key("prompt", news_query, query_en or ""), _collect)
+
+async def _run_news_agent(news_query: str) -> str:
+    return await news_flights.ado(query_key("agent", news_query), lambda: asyncio.to_thread(run_news_agent, news_query))
+
+async def _prepare_news(rewrite_task: "asyncio.Future"):
+    news_query, query_en = await rewrite_task
+    return await _build_news_prompt(news_query, query_en)
+
+async def _load_history(chat_id: int, message_id: Optional[int]) -> ChatHistory:
     try:
-        # Проверяем, не является ли сообщение уже JSON-объектом в виде строки
-        if user_message.strip().startswith('{') and user_message.strip().endswith('}'):
-            try:
-                # Попытка распарсить JSON
-                json_data = json.loads(user_message)
-                # Если в JSON есть поле content, используем его как сообщение
-                if isinstance(json_data, dict) and 'content' in json_data:
-                    user_message = json_data['content']
-                # В противном случае просто обрабатываем весь JSON как текст
-            except json.JSONDecodeError:
-                # Если это не валидный JSON, используем исходное сообщение
-                pass
-                
-        # Убедимся, что user_message - строка
-        if not isinstance(user_message, str):
-            user_message = str(user_message)
-            
-        response = ""
+        return await chat_memory.history(chat_id, message_id)
+    except Exception as e:
+        # Без истории ответ всё равно возможен
+        logger.warning("Chat history unavailable: %s", e, extra={"chat_id": chat_id})
+        return ChatHistory("", [])
 
+async def process_message_stream(chat_id: int, user_message: str,
+                                 message_id: Optional[int] = None) -> AsyncIterator[dict]:
+    """
+    Потоковая обработка сообщения: отдаёт события
+    ``{"type": "delta", "content": ...}`` по мере генерации и
+    ``{"type": "reset"}``, если частичный ответ оказался неудачным и дальше
+    пойдёт ответ из запасной ветки. Итоговый текст — конкатенация дельт
+    после последнего reset.
+
+    Если локальный классификатор уверен, выполняется только нужная ветка.
+    Иначе, пока LLM разбирает запрос (_preprocess: news/chat, поисковый
+    запрос на RU/EN — один вызов), параллельно стартуют прямой ответ
+    модели (буферизуется) и новостной поиск; выбранная ветка
+    продолжается, проигравшая отменяется. Весь ответ ограничен
+    ANSWER_LATENCY_BUDGET секунд.
+
+    Перед генерацией проверяется ``answer_cache``: ключ — переписанный
+    новостной запрос или нормализованный текст сообщения. Найденный ответ
+    отдаётся одной дельтой; устаревший — с пересчётом в фоне.
+
+    Прямой ответ модели учитывает историю чата (``chat_memory``) до
+    сохранённого сообщения ``message_id``. Такой
+    ответ зависит от контекста, поэтому в ``answer_cache`` попадают только
+    ответы на первое сообщение чата и новостные сводки.
+    """
+    deadline = _Deadline(ANSWER_LATENCY_BUDGET)
+    direct: Optional[_BufferedStream] = None
+    prep_task = rewrite_task = news_task = None
+    try:
+        try:
+            user_message = _normalize_user_message(user_message)
+            history = await deadline.wait(_load_history(chat_id, message_id))
+            direct_prompt = render_history(history, user_message)
+            decision = _route_locally(user_message)
+            if query_router.confident(decision):
+                is_news = decision.label == LABEL_NEWS
+            else:
+                prep_task = asyncio.ensure_future(_preprocess(user_message))
+                rewrite_task = asyncio.ensure_future(_news_queries(prep_task, user_message))
+                news_task = asyncio.ensure_future(_prepare_news(rewrite_task))
+                direct = _BufferedStream(_model_stream(direct_prompt))
+                is_news = await deadline.wait(_resolve_intent(prep_task, user_message, decision))
+
+            if is_news:
+                _cancel(direct)
+                direct = None
+                if rewrite_task is None:
+                    prep_task = asyncio.ensure_future(_preprocess(user_message))
+                    rewrite_task = asyncio.ensure_future(_news_queries(prep_task, user_message))
+                news_query, query_en = await deadline.wait(rewrite_task)
+                cache_key = answer_cache.key(CATEGORY_NEWS, news_query)
+            else:
+                _cancel(news_task, rewrite_task)
+                news_task = None
+                news_query = query_en = None
+                cache_key = answer_cache.key(CATEGORY_CHAT, user_message) if not history else None
+            # Подсказка «нужен ли веб-поиск» из того же разбора, если он удался
+            prep = prep_task.result() if prep_task is not None and prep_task.done() else None
+            web_search = prep.web_search if prep is not None else None
+        except asyncio.TimeoutError:
+            logger.warning("Answer latency budget exceeded", extra={"chat_id": chat_id, "stage": "route"})
+            yield _delta(_TIMEOUT_MESSAGE)
+            return
+        except Exception as e:
+            logger.exception("Error in process_message_stream", extra={"chat_id": chat_id})
+            yield _delta(f"Произошла ошибка при обработке запроса: {str(e)}")
+            return
+
+        cached = answer_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            text, stale = cached
+            if stale:
+                answer_cache.refresh(
+                    cache_key, lambda: _refresh_answer(chat_id, user_message, news_query, cache_key, query_en)
+                )
+            logger.debug("Answer cache hit", extra={"chat_id": chat_id, "stale": stale})
+            yield _delta(text)
+            return
+
+        outcome = _Outcome(CATEGORY_NEWS if news_query is not None else CATEGORY_CHAT)
+        parts: list[str] = []
+        async for event in _answer_stream(chat_id, user_message, news_query, outcome, deadline, direct, news_task,
+                                          query_en, web_search, direct_prompt):
+            _collect(parts, event)
+            yield event
+        # Сюда доходим, только если ответ сгенерирован целиком (не отменён)
+        _remember_answer(cache_key, "".join(parts), outcome)
+    finally:
+        # Запрос отменён или завершился раньше — останавливаем неиспользованные ветки
+        _cancel(direct, news_task, rewrite_task, prep_task)
+
+async def _refresh_answer(chat_id: int, user_message: str, news_query: Optional[str], cache_key: str,
+                          query_en: Optional[str] = None):
+    # Фоновый пересчёт никто не ждёт — он уступает интерактивным вызовам
+    with llm_context(priority=PRIORITY_BACKGROUND):
+        await _regenerate_answer(chat_id, user_message, news_query, cache_key, query_en)
+
+
+async def _regenerate_answer(chat_id: int, user_message: str, news_query: Optional[str], cache_key: str,
+                             query_en: Optional[str] = None):
+    outcome = _Outcome(CATEGORY_NEWS if news_query is not None else CATEGORY_CHAT)
+    parts: list[str] = []
+    deadline = _Deadline(ANSWER_LATENCY_BUDGET)
+    async for event in _answer_stream(chat_id, user_message, news_query, outcome, deadline, query_en=query_en):
+        _collect(parts, event)
+    _remember_answer(cache_key, "".join(parts), outcome)
+
+def _remember_answer(cache_key: Optional[str], text: str, outcome: _Outcome):
+    # Ошибки и слишком короткие ответы не кэшируем: их стоит попробовать заново
+    if cache_key is not None and outcome.cacheable and len(text.strip()) >= _MIN_MEANINGFUL_LEN:
+        answer_cache.set(cache_key, text, outcome.category)
+
+async def _answer_stream(chat_id: int, user_message: str, news_query: Optional[str], outcome: _Outcome,
+                         deadline: _Deadline, direct: Optional[_BufferedStream] = None,
+                         news_task: Optional["asyncio.Future"] = None, query_en: Optional[str] = None,
+                         web_search: Optional[bool] = None,
+                         direct_prompt: Optional[str] = None) -> AsyncIterator[dict]:
+    """Генерирует ответ: новостной конвейер, прямой ответ LLM, веб-поиск.
+
+    ``direct`` и ``news_task`` — уже запущенные спекулятивно ветки; если их
+    нет, соответствующая работа начинается здесь. ``query_en`` и
+    ``web_search`` — результаты _preprocess, если он уже выполнен.
+    ``direct_prompt`` — вопрос вместе с историей чата для прямого ответа.
+    """
+    sent = False  # были ли уже отправлены дельты текущего варианта ответа
+    try:
         # Если запрос похож на новостной – сначала пользуемся news-агентом
-        if _is_news_query(user_message):
-            # Переписываем запрос для новостного поиска
-            news_search_query = _rewrite_query(user_message, "news")
-
-            summary_resp = await asyncio.to_thread(get_news_summary, news_search_query, 5)
-            if summary_resp and len(summary_resp.strip()) >= _MIN_MEANINGFUL_LEN:
-                response = summary_resp
+        if news_query is not None:
+            if news_task is None:
+                news_task = _build_news_prompt(news_query, query_en)
+            try:
+                prepared = await deadline.wait(news_task)
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                logger.warning("Ошибка в build_news_prompt: %s", e, extra={"chat_id": chat_id})
+                prepared = None
+            if prepared:
+                prompt, sources_block = prepared
+                summary_parts = []
+                async for token in deadline.iterate(_model_stream(prompt)):
+                    summary_parts.append(token)
+                    sent = True
+                    yield _delta(token)
+                summary = "".join(summary_parts)
+                if len(summary.strip()) >= _MIN_MEANINGFUL_LEN and "⚠️" not in summary:
+                    yield _delta(append_sources(summary, sources_block)[len(summary):])
+                    return
 
             # Если парсер не дал достойного ответа – пробуем fallback-агента
-            if not response:
-                response = await asyncio.to_thread(run_news_agent, news_search_query)
+            fallback = await deadline.wait(_run_news_agent(news_query))
+            if fallback and len(fallback.strip()) >= _MIN_MEANINGFUL_LEN and "⚠️" not in fallback:
+                if sent:
+                    yield _RESET
+                yield _delta(fallback)
+                return
 
         # ------------------------------------------------------------
-        # Для остальных запросов: сначала пробуем прямой ответ LLM.
+        # Для остальных запросов: сначала пробуем прямой ответ LLM (потоком).
         # Если он слишком короткий/неинформативный И нужен веб-поиск – добавляем поиск.
         # ------------------------------------------------------------
 
-        if not response or len(response.strip()) < _MIN_MEANINGFUL_LEN or "⚠️" in response:
+        if sent:
+            yield _RESET
+            sent = False
+
+        # 1. Сначала пробуем получить прямой ответ модели (возможно, уже начатый)
+        if direct is None:
+            tokens = _model_stream(direct_prompt or user_message)
+        else:
+            tokens = direct
+        direct_parts = []
+        async for token in deadline.iterate(tokens):
+            direct_parts.append(token)
+            sent = True
+            yield _delta(token)
+        direct_text = "".join(direct_parts)
+
+        # 2. Если ответ достаточен — используем его
+        if len(direct_text.strip()) >= _MIN_MEANINGFUL_LEN:
+            return
+
+        # 3. Ответ слабый — решаем, нужен ли веб-поиск
+        if await deadline.wait(_needs_web_search(user_message, web_search)):
+            web_resp = await deadline.wait(_answer_with_web_search(user_message))
+            if web_resp and (len(web_resp.strip()) >= _MIN_MEANINGFUL_LEN or not direct_text):
+                if sent:
+                    yield _RESET
+                if outcome.category == CATEGORY_CHAT:
+                    outcome.category = CATEGORY_WEB
+                yield _delta(web_resp)
+    except asyncio.TimeoutError:
+        # Частично отправленный ответ оставляем как есть
+        logger.warning("Answer latency budget exceeded", extra={"chat_id": chat_id, "stage": "answer"})
+        outcome.cacheable = False
+        if not sent:
+            yield _delta(_TIMEOUT_MESSAGE)
+    except Exception as e:
+        logger.exception("Error in process_message_stream", extra={"chat_id": chat_id})
+        outcome.cacheable = False
+        if sent:
+            yield _RESET
+        yield _delta(f"Произошла ошибка при обработке запроса: {str(e)}")
 
-            # 1. Сначала пробуем получить прямой ответ модели
-            direct = await asyncio.to_thread(safe_model_invoke, user_message, "")
+async def process_message(chat_id: int, user_message: str, message_id: Optional[int] = None) -> str:
+    """
+    Обрабатывает сообщение пользователя целиком (без стриминга) —
+    собирает итоговый текст из process_message_stream.
+    """
+    parts: list[str] = []
+    async for event in process_message_stream(chat_id, user_message, message_id):
+        _collect(parts, event)
+    response = "".join(parts)
 
-            # 2. Если ответ достаточен — используем его
-            if direct and len(direct.strip()) >= _MIN_MEANINGFUL_LEN:
-                response = direct
-            else:
-                # 3. Ответ слабый — решаем, нужен ли веб-поиск
-                if _needs_web_search(user_message):
-                    web_resp = await _answer_with_web_search(user_message)
-                    if web_resp and len(web_resp.strip()) >= _MIN_MEANINGFUL_LEN:
-                        response = web_resp
-                    else:
-                        response = direct or web_resp
-                else:
-                    response = direct
-
-        print(f"AI response length: {len(response) if response else 0}")
-        print(f"AI response: {response[:100]}...")  # Выводим начало ответа для отладки
-        # Убеждаемся, что возвращаем именно строку
-        return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
-    except Exception as e:
-        print(f"Error in process_message: {str(e)}")
-        return f"Произошла ошибка при обработке запроса: {str(e)}"
\ No newline at end of file
+    logger.debug("AI response ready", extra={"chat_id": chat_id, "chars": len(response)})
+    return response
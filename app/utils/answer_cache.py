@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app.utils.llm_memo import normalize
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+# Ограничение памяти: число закэшированных ответов
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+
+CATEGORY_NEWS = "news"
+CATEGORY_WEB = "web"
+CATEGORY_CHAT = "chat"
+
+# (свежий, устаревший) в секундах, переопределяются через ANSWER_CACHE_TTL_<CATEGORY>
+# и ANSWER_CACHE_STALE_<CATEGORY>. Свежий ответ отдаётся как есть; устаревший
+# отдаётся сразу, а в фоне считается новый; после обоих сроков — промах.
+_DEFAULT_TTLS = {
+    CATEGORY_NEWS: (600, 1800),
+    CATEGORY_WEB: (3600, 6 * 3600),
+    CATEGORY_CHAT: (86400, 6 * 86400),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _ttls(category: str) -> Tuple[float, float]:
+    fresh, stale = _DEFAULT_TTLS[category]
+    env = category.upper()
+    return (
+        float(os.getenv(f"ANSWER_CACHE_TTL_{env}", str(fresh))),
+        float(os.getenv(f"ANSWER_CACHE_STALE_{env}", str(stale))),
+    )
+
+
+class _Entry:
+    __slots__ = ("text", "category", "fresh_until", "stale_until")
+
+    def __init__(self, text: str, category: str, fresh_until: float, stale_until: float):
+        self.text = text
+        self.category = category
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class AnswerCache:
+    """Кэш готовых ответов ассистента по нормализованному запросу.
+
+    Один и тот же вопрос («новости про нефть сегодня») от разных
+    пользователей в течение нескольких минут не запускает заново поиск,
+    загрузку статей и суммаризацию. Срок жизни зависит от категории:
+    новости устаревают быстро, общие знания — медленно. Устаревший ответ
+    отдаётся сразу, а свежий считается в фоне (stale-while-revalidate), не
+    больше одного пересчёта на ключ. Кэш локален для процесса.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, enabled: bool = ANSWER_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.ttls: Dict[str, Tuple[float, float]] = {category: _ttls(category) for category in _DEFAULT_TTLS}
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._counters: Counter = Counter()
+
+    @staticmethod
+    def key(category: str, query: str) -> str:
+        return f"{category}:{normalize(query)}"
+
+    def get(self, key: str) -> Optional[Tuple[str, bool]]:
+        """Возвращает (ответ, устарел ли он) или None."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.stale_until <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            stale = entry.fresh_until <= now
+            self._counters["stale_hits" if stale else "hits"] += 1
+            return entry.text, stale
+
+    def set(self, key: str, text: str, category: str):
+        if not self.enabled:
+            return
+        fresh, stale = self.ttls[category]
+        if fresh <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = _Entry(text, category, now + fresh, now + fresh + stale)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, key: str, compute: Callable[[], Awaitable[None]]):
+        """Запускает фоновый пересчёт ключа, если он ещё не идёт.
+
+        ``compute`` сам кладёт новый ответ через ``set``; ошибки только
+        логируются — в кэше остаётся прежний ответ до конца его срока.
+        """
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        self._counters["refreshes"] += 1
+
+        async def run():
+            try:
+                await compute()
+            except Exception as e:
+                logger.warning("Answer refresh failed: %s", e, extra={"cache_key": key})
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        return {"enabled": self.enabled, "entries": size, "refreshing": len(self._refreshing), **counters}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+answer_cache = AnswerCache()
@@ -1,16 +1,18 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
 import os
-import sys
 
 from app.database.init_db import get_db
 from app.models.user import User
 from app.schemas.user import TokenData
+from app.utils.auth_cache import CurrentUser, auth_cache
+from app.utils.password_hasher import PasswordHasherBusy, password_hasher
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "my_super_secret_key_for_development_only")
@@ -18,20 +20,39 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+logger = logging.getLogger(__name__)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def _hasher_busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+async def get_password_hash(password):
+    # bcrypt считается в пуле app.utils.password_hasher, не в event loop
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise _hasher_busy_exception()
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await db.scalar(select(User).where(User.username == username))
+    if not user:
+        return False
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy_exception()
+    if not valid:
         return False
+    if new_hash is not None:
+        # Хэш со старым числом раундов (BCRYPT_ROUNDS изменился) — пересчитываем при входе
+        user.hashed_password = new_hash
+        await db.commit()
+        logger.info("Password hash upgraded", extra={"username": username})
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -53,17 +74,17 @@ def create_refresh_token(data: dict):
 
 def decode_token(token, verify_type=None):
     try:
-        print(f"Decoding token: {token[:10]}... (type check: {verify_type})", file=sys.stderr)
+        logger.debug("Decoding token", extra={"verify_type": verify_type})
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         
         # Проверяем тип токена, если требуется
         if verify_type and payload.get("type") != verify_type:
-            print(f"Token type mismatch: expected {verify_type}, got {payload.get('type')}", file=sys.stderr)
+            logger.info("Token type mismatch", extra={"expected": verify_type, "got": payload.get("type")})
             return None
             
         username = payload.get("sub")
         if username is None:
-            print(f"No 'sub' field in token payload", file=sys.stderr)
+            logger.info("No 'sub' field in token payload")
             return None
             
         # Проверяем срок действия (хотя jwt.decode уже должен это проверить)
@@ -74,36 +95,78 @@ def decode_token(token, verify_type=None):
         try:
             exp_datetime = datetime.fromtimestamp(float(exp))
             if exp_datetime < datetime.utcnow():
-                print(f"Token expired at {exp_datetime}", file=sys.stderr)
+                logger.info("Token expired", extra={"expired_at": exp_datetime.isoformat()})
                 return None
         except (ValueError, TypeError) as e:
-            print(f"Error parsing token expiration: {str(e)}", file=sys.stderr)
+            logger.warning("Error parsing token expiration: %s", e)
             return None
             
-        return {"username": username, "exp": exp, "type": payload.get("type")}
+        return {"username": username, "user_id": payload.get("uid"), "exp": exp, "type": payload.get("type")}
     except JWTError as e:
-        print(f"JWT Error: {str(e)}", file=sys.stderr)
+        logger.info("JWT error: %s", e)
         return None
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def token_identity(token: str) -> Optional[str]:
+    """Ключ пользователя для лимитов запросов — без БД и без отладочного вывода.
+
+    Сначала смотрим кэш проверенных токенов, иначе проверяем подпись JWT.
+    """
+    cached = auth_cache.get(token)
+    if cached is not None:
+        return f"user:{cached[1].id}"
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "access":
+        return None
+    if payload.get("uid") is not None:
+        return f"user:{payload['uid']}"
+    if payload.get("sub") is not None:
+        return f"user:{payload['sub']}"
+    return None
+
+def token_claims(user: User) -> dict:
+    """Claims для access/refresh токенов: имя пользователя и его id."""
+    return {"sub": user.username, "uid": user.id}
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> CurrentUser:
+    # Горячий путь: токен уже проверен, пользователь известен — без БД
+    cached = auth_cache.get(token)
+    if cached is not None:
+        return cached[1]
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    print(f"Authenticating user with token: {token[:10] if token else 'None'}...", file=sys.stderr)
     user_data = decode_token(token, verify_type="access")
     if user_data is None:
-        print(f"Authentication failed: invalid token", file=sys.stderr)
+        logger.info("Authentication failed: invalid token")
         raise credentials_exception
     
     username = user_data["username"]
-    user = db.query(User).filter(User.username == username).first()
+    if user_data["user_id"] is not None:
+        user = await db.get(User, user_data["user_id"])
+        if user is not None and user.username != username:
+            user = None
+    else:
+        # Токены, выпущенные до появления uid в claims
+        user = await db.scalar(select(User).where(User.username == username))
     
     if user is None:
-        print(f"Authentication failed: user {username} not found", file=sys.stderr)
+        logger.info("Authentication failed: user not found", extra={"username": username})
         raise credentials_exception
     
-    print(f"Authentication successful for user: {username}", file=sys.stderr)
-    return user 
\ No newline at end of file
+    logger.debug("Authentication successful", extra={"username": username})
+    current_user = CurrentUser.from_model(user)
+    auth_cache.set(token, user_data, current_user)
+    return current_user
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    """Изменённый или удалённый пользователь не должен оставаться в кэше токенов."""
+    auth_cache.invalidate_user(target.id)
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+# Сколько секунд доверяем проверенному токену без обращения к БД
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+# Ограничение памяти: число закэшированных токенов
+AUTH_CACHE_MAX_SIZE = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+
+
+class CurrentUser:
+    """Компактная запись пользователя для обработчиков запросов.
+
+    Отдаётся из ``get_current_user`` вместо ORM-объекта: не привязана к
+    сессии и безопасно переиспользуется между запросами.
+    """
+
+    __slots__ = ("id", "username", "email")
+
+    def __init__(self, id: int, username: str, email: Optional[str] = None):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    @classmethod
+    def from_model(cls, user) -> "CurrentUser":
+        return cls(user.id, user.username, user.email)
+
+    def __repr__(self):
+        return f"CurrentUser(id={self.id}, username={self.username!r})"
+
+
+class _Entry:
+    __slots__ = ("claims", "user", "expires_at")
+
+    def __init__(self, claims: dict, user: CurrentUser, expires_at: float):
+        self.claims = claims
+        self.user = user
+        self.expires_at = expires_at
+
+
+class AuthCache:
+    """LRU-кэш проверенных access-токенов с ограниченным временем жизни.
+
+    Ключ — сам токен, значение — расшифрованные claims и ``CurrentUser``.
+    Запись живёт не дольше TTL и не дольше срока действия токена. При
+    изменении пользователя его записи сбрасываются через ``invalidate_user``.
+    Кэш локален для процесса: в других воркерах запись устареет по TTL.
+    """
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL, max_size: int = AUTH_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # user_id -> токены, чтобы сбрасывать записи пользователя целиком
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Tuple[dict, CurrentUser]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                self._pop(token)
+                return None
+            self._entries.move_to_end(token)
+            return entry.claims, entry.user
+
+    def set(self, token: str, claims: dict, user: CurrentUser):
+        if self.ttl <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        exp = claims.get("exp")
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._pop(token)
+            self._entries[token] = _Entry(claims, user, expires_at)
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._pop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._pop(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _pop(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry.user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry.user.id]
+
+
+auth_cache = AuthCache()
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import orjson
+
+# Пусто — брокер в памяти процесса (один воркер uvicorn).
+# redis://host:6379/0 — события расходятся между всеми воркерами и узлами.
+CHAT_BROKER_URL = os.getenv("CHAT_BROKER_URL", "")
+
+logger = logging.getLogger(__name__)
+
+ChatEvent = Dict
+ChatEventHandler = Callable[[ChatEvent], Awaitable[None]]
+
+
+class Broker:
+    """Публикация событий чата и доставка их подписчикам.
+
+    Событие — словарь с обязательным ``chat_id``. Каждый воркер подписывает
+    свой обработчик, который доставляет событие в локальные WebSocket-соединения,
+    поэтому публиковать можно из любого воркера.
+    """
+
+    def __init__(self):
+        self._handlers: List[ChatEventHandler] = []
+
+    def subscribe(self, handler: ChatEventHandler):
+        self._handlers.append(handler)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: ChatEvent):
+        raise NotImplementedError
+
+    def watch(self, chat_id: int):
+        """У воркера появились соединения чата — нужны его кадры."""
+
+    def unwatch(self, chat_id: int):
+        """Соединений чата в воркере больше нет."""
+
+    async def _dispatch(self, event: ChatEvent):
+        for handler in self._handlers:
+            try:
+                await handler(event)
+            except Exception as e:
+                logger.exception("Handler error", extra={"chat_id": event.get("chat_id")})
+
+
+class InMemoryBroker(Broker):
+    """Доставка внутри одного процесса."""
+
+    async def publish(self, event: ChatEvent):
+        await self._dispatch(event)
+
+
+class RedisBroker(Broker):
+    """Доставка через Redis Pub/Sub.
+
+    Кадры идут в канал ``chat:{chat_id}``, и воркер подписан только на
+    каналы чатов, у которых есть его соединения (``watch``/``unwatch``).
+    Сброс кэшей ответов нужен всем воркерам, поэтому ``owner_id`` без кадра
+    идёт в общий канал ``chat-updates``. Публикующий воркер получает своё
+    событие обратно через подписку, так что путь доставки один для всех.
+    """
+
+    CHANNEL_PREFIX = "chat:"
+    UPDATES_CHANNEL = "chat-updates"
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        self._pubsub = None
+        # Чаты, нужные воркеру, и чаты, на которые подписан текущий pubsub
+        self._watched: Set[int] = set()
+        self._subscribed: Set[int] = set()
+        self._sync_lock = asyncio.Lock()
+        self._sync_tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("Для CHAT_BROKER_URL=redis://... установите пакет redis") from e
+
+        self._redis = aioredis.from_url(self.url)
+        self._task = asyncio.create_task(self._listen(), name="chat-broker")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def publish(self, event: ChatEvent):
+        chat_id = event["chat_id"]
+        async with self._redis.pipeline(transaction=False) as pipe:
+            if event.get("owner_id") is not None:
+                pipe.publish(self.UPDATES_CHANNEL, orjson.dumps({"chat_id": chat_id, "owner_id": event["owner_id"]}))
+            if event.get("frame") is not None:
+                pipe.publish(self._channel(chat_id), orjson.dumps({"chat_id": chat_id, "frame": event["frame"]}))
+            await pipe.execute()
+
+    def watch(self, chat_id: int):
+        self._watched.add(chat_id)
+        self._schedule_sync()
+
+    def unwatch(self, chat_id: int):
+        self._watched.discard(chat_id)
+        self._schedule_sync()
+
+    def _channel(self, chat_id: int) -> str:
+        return f"{self.CHANNEL_PREFIX}{chat_id}"
+
+    def _schedule_sync(self):
+        if self._pubsub is None:
+            # Нет подписки — _listen подпишется на _watched при подключении
+            return
+        task = asyncio.get_running_loop().create_task(self._sync_subscriptions(self._pubsub))
+        self._sync_tasks.add(task)
+        task.add_done_callback(self._sync_tasks.discard)
+
+    async def _sync_subscriptions(self, pubsub):
+        # Приводим подписки к _watched на момент выполнения: порядок задач
+        # watch/unwatch не важен, итог всегда совпадает с последним состоянием
+        async with self._sync_lock:
+            if pubsub is not self._pubsub:
+                return
+            added = self._watched - self._subscribed
+            removed = self._subscribed - self._watched
+            try:
+                if added:
+                    await pubsub.subscribe(*(self._channel(chat_id) for chat_id in added))
+                    self._subscribed |= added
+                if removed:
+                    await pubsub.unsubscribe(*(self._channel(chat_id) for chat_id in removed))
+                    self._subscribed -= removed
+            except Exception as e:
+                logger.warning("Redis subscription update failed: %s", e)
+
+    async def _listen(self):
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.UPDATES_CHANNEL)
+                self._pubsub, self._subscribed = pubsub, set()
+                await self._sync_subscriptions(pubsub)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        event = orjson.loads(message["data"])
+                    except orjson.JSONDecodeError:
+                        continue
+                    await self._dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Соединение с Redis потеряно — переподписываемся
+                logger.warning("Redis subscription lost: %s", e)
+                await asyncio.sleep(self.RECONNECT_DELAY)
+            finally:
+                if self._pubsub is pubsub:
+                    self._pubsub = None
+                await pubsub.aclose()
+
+
+def create_broker(url: str = CHAT_BROKER_URL) -> Broker:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    return InMemoryBroker()
+
+
+broker = create_broker()
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+from collections import Counter, OrderedDict, deque
+from typing import Deque, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app.database.init_db import AsyncSessionLocal
+from app.models.chat import Message
+from app.utils.llm_scheduler import PRIORITY_BACKGROUND, llm_context
+from new_agent.main import safe_model_ainvoke
+
+CHAT_MEMORY_ENABLED = os.getenv("CHAT_MEMORY_ENABLED", "1") == "1"
+# Бюджет истории в промпте (приблизительные токены); старшие реплики уходят в резюме
+CHAT_MEMORY_TOKEN_BUDGET = int(os.getenv("CHAT_MEMORY_TOKEN_BUDGET", "1500"))
+# Ограничение длины резюме (приблизительные токены)
+CHAT_MEMORY_SUMMARY_BUDGET = int(os.getenv("CHAT_MEMORY_SUMMARY_BUDGET", "300"))
+# Сколько чатов держать в памяти процесса (LRU)
+CHAT_MEMORY_HOT_CHATS = int(os.getenv("CHAT_MEMORY_HOT_CHATS", "512"))
+# Сколько последних сообщений читать из БД при первом обращении к чату
+CHAT_MEMORY_LOAD_LIMIT = int(os.getenv("CHAT_MEMORY_LOAD_LIMIT", "50"))
+# Сколько более старых сообщений при первом обращении сворачивать в резюме;
+# то, что старше, в контекст не попадает
+CHAT_MEMORY_SUMMARY_LOAD_LIMIT = int(os.getenv("CHAT_MEMORY_SUMMARY_LOAD_LIMIT", "200"))
+
+# Токенизатора GigaChat у нас нет; для русского текста ~3 символа на токен
+_CHARS_PER_TOKEN = 3
+
+_ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент"}
+
+logger = logging.getLogger(__name__)
+
+
+def _tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+class _Turn:
+    __slots__ = ("id", "role", "content", "tokens")
+
+    def __init__(self, id: int, role: str, content: str, tokens: int):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+
+
+class ChatHistory:
+    """История для промпта: резюме старой части разговора и последние реплики."""
+
+    __slots__ = ("summary", "turns")
+
+    def __init__(self, summary: str, turns: List[Tuple[str, str]]):
+        self.summary = summary
+        self.turns = turns
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+
+class _ChatState:
+    __slots__ = ("turns", "tokens", "last_id", "summary", "pending", "summarizing", "lock")
+
+    def __init__(self):
+        self.turns: Deque[_Turn] = deque()
+        self.tokens = 0
+        self.last_id = 0
+        self.summary = ""
+        # Реплики для резюме (вытесненные из бюджета или старше холодной загрузки)
+        self.pending: List[_Turn] = []
+        self.summarizing = False
+        self.lock = asyncio.Lock()
+
+
+class ChatMemory:
+    """Контекст разговора для ответа модели, ограниченный бюджетом токенов.
+
+    История берётся из таблицы ``messages``. Последние реплики, которые
+    помещаются в ``token_budget``, идут в промпт как есть; более старые
+    сворачиваются моделью в краткое резюме (в фоне, с фоновым приоритетом,
+    не задерживая ответ). Состояние горячих чатов хранится в LRU: для
+    следующего вопроса дочитываются только новые сообщения (id > последнего
+    прочитанного), а не вся история. При первом обращении к чату история
+    старше ``load_limit`` последних сообщений (не больше
+    ``summary_load_limit``) тоже уходит в резюме.
+    """
+
+    def __init__(self, token_budget: int = CHAT_MEMORY_TOKEN_BUDGET,
+                 summary_budget: int = CHAT_MEMORY_SUMMARY_BUDGET,
+                 max_chats: int = CHAT_MEMORY_HOT_CHATS, load_limit: int = CHAT_MEMORY_LOAD_LIMIT,
+                 summary_load_limit: int = CHAT_MEMORY_SUMMARY_LOAD_LIMIT,
+                 enabled: bool = CHAT_MEMORY_ENABLED):
+        self.token_budget = max(1, token_budget)
+        self.summary_budget = summary_budget
+        self.max_chats = max(1, max_chats)
+        self.load_limit = max(1, load_limit)
+        self.summary_load_limit = max(0, summary_load_limit)
+        self.enabled = enabled
+        self._chats: "OrderedDict[int, _ChatState]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._counters: Counter = Counter()
+
+    async def history(self, chat_id: int, message_id: Optional[int] = None) -> ChatHistory:
+        """История чата до сообщения ``message_id``.
+
+        Роутер сохраняет вопрос до вызова модели, поэтому текущее сообщение
+        и всё, что записано после него (параллельные запросы того же чата),
+        в историю не входит и бюджет токенов не расходует.
+        """
+        if not self.enabled:
+            return ChatHistory("", [])
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState()
+            self._counters["cold_loads"] += 1
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+            self._counters["hot_hits"] += 1
+
+        async with state.lock:
+            await self._sync(chat_id, state, message_id)
+            turns = [turn for turn in state.turns if message_id is None or turn.id < message_id]
+            summary = state.summary
+        return ChatHistory(summary, [(turn.role, turn.content) for turn in turns])
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "hot_chats": len(self._chats), **self._counters}
+
+    async def _sync(self, chat_id: int, state: _ChatState, message_id: Optional[int] = None):
+        # Только новые сообщения: индекс (chat_id, id), без чтения всей истории.
+        # Холодный чат — последние load_limit сообщений; в горячем дочитываем
+        # страницами до last_id, иначе при всплеске сообщений в середине
+        # истории осталась бы дыра
+        cold = state.last_id == 0
+        rows = []
+        older = []
+        async with AsyncSessionLocal() as db:
+            while True:
+                query = select(Message.id, Message.role, Message.content).where(
+                    Message.chat_id == chat_id, Message.id > state.last_id
+                )
+                if rows:
+                    query = query.where(Message.id < rows[-1][0])
+                page = (await db.execute(query.order_by(Message.id.desc()).limit(self.load_limit))).all()
+                rows.extend(page)
+                if cold or len(page) < self.load_limit:
+                    break
+            if cold and len(rows) == self.load_limit and self.summary_load_limit:
+                # Более ранняя часть разговора нужна только для резюме
+                query = select(Message.id, Message.role, Message.content).where(
+                    Message.chat_id == chat_id, Message.id < rows[-1][0]
+                )
+                older = (await db.execute(query.order_by(Message.id.desc()).limit(self.summary_load_limit))).all()
+        self._counters["rows_loaded"] += len(rows) + len(older)
+        max_chars = self.token_budget * _CHARS_PER_TOKEN
+        for id, role, content in reversed(older):
+            content = (content or "")[:max_chars]
+            state.pending.append(_Turn(id, role, content, _tokens(content)))
+        for id, role, content in reversed(rows):
+            content = (content or "")[:max_chars]
+            turn = _Turn(id, role, content, _tokens(content))
+            state.turns.append(turn)
+            state.tokens += turn.tokens
+            state.last_id = id
+        # Бюджет считается по репликам до message_id: записанные после него
+        # (параллельные запросы того же чата) не вытесняют его контекст
+        later = [turn for turn in state.turns if message_id is not None and turn.id >= message_id]
+        tokens = state.tokens - sum(turn.tokens for turn in later)
+        visible = len(state.turns) - len(later)
+        # Последняя реплика остаётся всегда, даже если одна превышает бюджет
+        while tokens > self.token_budget and visible > 1:
+            turn = state.turns.popleft()
+            state.tokens -= turn.tokens
+            tokens -= turn.tokens
+            visible -= 1
+            state.pending.append(turn)
+        if state.pending and not state.summarizing:
+            self._start_summary(chat_id, state)
+
+    def _start_summary(self, chat_id: int, state: _ChatState):
+        state.summarizing = True
+        task = asyncio.get_running_loop().create_task(self._summarize(chat_id, state))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, chat_id: int, state: _ChatState):
+        # Не больше token_budget реплик за вызов: длинная история (холодная
+        # загрузка) сворачивается по частям, остаток — следующим вызовом
+        count = tokens = 0
+        for turn in state.pending:
+            if count and tokens + turn.tokens > self.token_budget:
+                break
+            count += 1
+            tokens += turn.tokens
+        turns, state.pending = state.pending[:count], state.pending[count:]
+        lines = "\n".join(f"{_ROLE_NAMES.get(turn.role, turn.role)}: {turn.content}" for turn in turns)
+        max_words = max(20, self.summary_budget * _CHARS_PER_TOKEN // 7)
+        prompt = (
+            "Ниже — резюме начала разговора пользователя с ассистентом и следующие за ним реплики.\n"
+            f"Составь новое краткое резюме всего разговора (не длиннее {max_words} слов): "
+            "сохрани темы, факты, имена, числа и просьбы пользователя. Верни только резюме.\n\n"
+            f"Резюме: {state.summary or '—'}\n\n"
+            f"Реплики:\n{lines}"
+        )
+        try:
+            # Резюме никто не ждёт — уступаем интерактивным вызовам
+            with llm_context(priority=PRIORITY_BACKGROUND):
+                summary = (await safe_model_ainvoke(prompt, "")).strip()
+            if summary:
+                state.summary = summary[:self.summary_budget * _CHARS_PER_TOKEN]
+                self._counters["summaries"] += 1
+            else:
+                # Модель не ответила: эти реплики в резюме не попадут
+                self._counters["summary_failures"] += 1
+                logger.warning("Chat summary failed", extra={"chat_id": chat_id, "turns": len(turns)})
+        finally:
+            state.summarizing = False
+            if state.pending:
+                self._start_summary(chat_id, state)
+
+
+def render_history(history: ChatHistory, user_message: str) -> str:
+    """Промпт для прямого ответа модели: резюме, последние реплики и текущий вопрос."""
+    if not history:
+        return user_message
+    parts = []
+    if history.summary:
+        parts.append(f"Краткое содержание предыдущего разговора: {history.summary}")
+    if history.turns:
+        lines = "\n".join(f"{_ROLE_NAMES.get(role, role)}: {content}" for role, content in history.turns)
+        parts.append(f"Последние сообщения:\n{lines}")
+    parts.append(
+        "Ответь на новое сообщение пользователя с учётом контекста разговора.\n"
+        f"{_ROLE_NAMES['user']}: {user_message}"
+    )
+    return "\n\n".join(parts)
+
+
+chat_memory = ChatMemory()
@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Callable, Coroutine, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket, status
+
+from app.utils.broker import broker
+from app.utils.serialization import dumps_text
+
+# Сколько кадров может ждать отправки в одно соединение
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# Что делать при переполнении: drop_oldest — выбросить самый старый
+# широковещательный кадр, disconnect — закрыть медленное соединение
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+# Если один кадр не ушёл за это время, соединение считается мёртвым
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# Сколько запросов одного соединения обрабатываются одновременно
+WS_MAX_INFLIGHT_REQUESTS = int(os.getenv("WS_MAX_INFLIGHT_REQUESTS", "4"))
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DISCONNECT = "disconnect"
+
+logger = logging.getLogger(__name__)
+
+
+class ClientConnection:
+    """WebSocket с собственной ограниченной очередью и задачей-отправителем.
+
+    ``send`` не блокирует: кадр кладётся в очередь, а отправляет его
+    отдельная задача, поэтому медленный клиент не задерживает остальных.
+    """
+
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager", chat_id: int,
+                 max_queue: int = WS_SEND_QUEUE_SIZE, overflow_policy: str = WS_OVERFLOW_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT, max_inflight: int = WS_MAX_INFLIGHT_REQUESTS,
+                 held: bool = False):
+        self.websocket = websocket
+        self.chat_id = chat_id
+        self.max_queue = max(1, max_queue)
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.max_inflight = max(1, max_inflight)
+        self.dropped = 0
+        self.closed = False
+        self._manager = manager
+        # (текст, можно ли выбросить при переполнении)
+        self._queue: Deque[Tuple[str, bool]] = deque()
+        self._ready = asyncio.Event()
+        # Пока клиент догоняет историю, живые кадры копятся здесь (см. release)
+        self._held: Optional[List[Tuple[str, bool]]] = [] if held else None
+        # Сколько кадров истории из release ещё стоит в начале очереди
+        self._replay = 0
+        # Запросы клиента, которые сейчас обрабатываются, по request_id
+        self._requests: Dict[Hashable, asyncio.Task] = {}
+        self._task = asyncio.create_task(self._sender(), name=f"ws-sender-{chat_id}")
+
+    def send(self, text: str, droppable: bool = True) -> bool:
+        """Ставит кадр в очередь. Возвращает False, если соединение закрыто.
+
+        Ответы на собственные запросы клиента (delta/done) отправляются с
+        ``droppable=False``: drop_oldest их не выбрасывает. Очередь (как и
+        придержанные кадры) не растёт больше ``max_queue``: если выбросить
+        нечего, медленный клиент отключается с 1013.
+        """
+        if self.closed:
+            return False
+
+        buffer = self._held if self._held is not None else self._queue
+        if self._pending(buffer) >= self.max_queue and not self._make_room(buffer):
+            logger.warning("Send queue overflow, disconnecting slow client", extra={"chat_id": self.chat_id})
+            self._shutdown(status.WS_1013_TRY_AGAIN_LATER)
+            return False
+
+        buffer.append((text, droppable))
+        if buffer is self._queue:
+            self._ready.set()
+        return True
+
+    def release(self, frames: List[str]):
+        """Отправляет кадры догоняющей истории и следом — накопленные живые кадры.
+
+        Кадры истории ограничены вызывающим кодом и в лимит очереди не входят.
+        """
+        if self.closed or self._held is None:
+            return
+        self._queue.extend((text, False) for text in frames)
+        self._replay = len(self._queue)
+        self._queue.extend(self._held)
+        self._held = None
+        self._ready.set()
+
+    def _pending(self, buffer) -> int:
+        return len(buffer) - self._replay if buffer is self._queue else len(buffer)
+
+    def _make_room(self, buffer) -> bool:
+        """Освобождает место под кадр; False — выбросить нечего."""
+        if self.overflow_policy != OVERFLOW_DROP_OLDEST:
+            return False
+        start = self._replay if buffer is self._queue else 0
+        for i in range(start, len(buffer)):
+            if buffer[i][1]:
+                del buffer[i]
+                self.dropped += 1
+                return True
+        return False
+
+    @property
+    def inflight(self) -> int:
+        return sum(1 for task in self._requests.values() if not task.done())
+
+    def has_request(self, request_id: Hashable) -> bool:
+        task = self._requests.get(request_id)
+        return task is not None and not task.done()
+
+    def start_request(self, request_id: Hashable, coro: Coroutine) -> asyncio.Task:
+        """Запускает обработку запроса клиента отдельной задачей.
+
+        Проверки лимита (``inflight``) и повторного id (``has_request``)
+        делает вызывающий код — он же сообщает клиенту об отказе. Задача не
+        отменяется при закрытии соединения: ответ дописывается в историю.
+        """
+        task = asyncio.create_task(coro, name=f"ws-request-{self.chat_id}-{request_id}")
+        self._requests[request_id] = task
+
+        def _forget(_):
+            if self._requests.get(request_id) is task:
+                del self._requests[request_id]
+
+        task.add_done_callback(_forget)
+        return task
+
+    def adopt_request(self, request_id: Hashable, task: asyncio.Task):
+        """Привязывает чужой запрос (начатый до переподключения), чтобы его можно было отменить."""
+        if not task.done():
+            self._requests[request_id] = task
+
+    def cancel_request(self, request_id: Hashable) -> bool:
+        """Отменяет запрос клиента. False — такого запроса нет или он уже завершён."""
+        task = self._requests.get(request_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def close(self, code: int = status.WS_1000_NORMAL_CLOSURE):
+        self._shutdown(code)
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def _shutdown(self, code: int):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._held = None
+        self._replay = 0
+        self._manager._remove(self)
+        self._task.cancel()
+        asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _sender(self):
+        # Проверяем closed, а не полагаемся только на cancel: wait_for в
+        # Python < 3.12 может проглотить отмену, если отправка завершилась
+        # в тот же момент
+        while not self.closed:
+            await self._ready.wait()
+            while self._queue:
+                text, _ = self._queue.popleft()
+                if self._replay:
+                    self._replay -= 1
+                try:
+                    await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Сокет мёртв или завис — убираем его из рассылки
+                    logger.info("Send failed, pruning connection: %r", e, extra={"chat_id": self.chat_id})
+                    self._shutdown(status.WS_1011_INTERNAL_ERROR)
+                    return
+            self._ready.clear()
+
+
+class ReplyStream:
+    """Ответ ассистента, который сейчас генерируется.
+
+    Хранит уже отправленный текст: переподключившийся клиент получает его
+    одним кадром и дальше продолжает получать delta вместе с остальными
+    слушателями. Состояние локально для воркера.
+    """
+
+    def __init__(self, manager: "ConnectionManager", chat_id: int, request_id: Hashable,
+                 user_message: dict, task: asyncio.Task):
+        self.chat_id = chat_id
+        self.request_id = request_id
+        self.user_message = user_message
+        self.task = task
+        self.parts: List[str] = []
+        self.listeners: Set[ClientConnection] = set()
+        self._manager = manager
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def start_frame(self) -> dict:
+        return {"type": "start", "request_id": self.request_id, "user_message": self.user_message}
+
+    def send(self, frame: dict):
+        text = dumps_text(frame)
+        for connection in list(self.listeners):
+            if not connection.send(text, droppable=False):
+                self.listeners.discard(connection)
+
+    def push(self, event: dict):
+        """Пересылает событие process_message_stream (delta/reset) слушателям."""
+        if event["type"] == "reset":
+            self.parts.clear()
+        else:
+            self.parts.append(event["content"])
+        self.send({**event, "request_id": self.request_id})
+
+    def attach(self, connection: ClientConnection) -> List[str]:
+        """Добавляет слушателя и возвращает кадры, догоняющие его до текущего состояния."""
+        self.listeners.add(connection)
+        connection.adopt_request(self.request_id, self.task)
+        frames = [dumps_text(self.start_frame())]
+        if self.parts:
+            frames.append(dumps_text({"type": "delta", "content": self.text, "request_id": self.request_id}))
+        return frames
+
+    def finish(self, frame: dict):
+        """Отправляет последний кадр (done/cancelled/ошибка) и снимает ответ с учёта."""
+        self.send(frame)
+        self._manager._close_stream(self)
+
+
+class ConnectionManager:
+    """Локальные (в пределах воркера) WebSocket-соединения и генерируемые ответы по чатам.
+
+    ``on_chat_open``/``on_chat_close`` вызываются, когда у чата появляется
+    первое соединение и уходит последнее: брокер подписывает воркер только
+    на те чаты, которые он обслуживает.
+    """
+
+    def __init__(self, on_chat_open: Optional[Callable[[int], None]] = None,
+                 on_chat_close: Optional[Callable[[int], None]] = None):
+        self._by_chat: Dict[int, Set[ClientConnection]] = {}
+        self._streams: Dict[int, Set[ReplyStream]] = {}
+        self._on_chat_open = on_chat_open
+        self._on_chat_close = on_chat_close
+
+    def connect(self, chat_id: int, websocket: WebSocket, held: bool = False) -> ClientConnection:
+        """Регистрирует соединение. С ``held=True`` живые кадры придерживаются до ``release``."""
+        connection = ClientConnection(websocket, self, chat_id, held=held)
+        chat_connections = self._by_chat.get(chat_id)
+        if chat_connections is None:
+            chat_connections = self._by_chat[chat_id] = set()
+            if self._on_chat_open is not None:
+                self._on_chat_open(chat_id)
+        chat_connections.add(connection)
+        return connection
+
+    async def disconnect(self, connection: ClientConnection):
+        await connection.close()
+
+    def broadcast(self, chat_id: int, text: str) -> int:
+        """Раздаёт кадр всем соединениям чата без ожидания отправки."""
+        delivered = 0
+        for connection in list(self._by_chat.get(chat_id, ())):
+            if connection.send(text):
+                delivered += 1
+        return delivered
+
+    def count(self, chat_id: int) -> int:
+        return len(self._by_chat.get(chat_id, ()))
+
+    def open_stream(self, connection: ClientConnection, request_id: Hashable, user_message: dict) -> ReplyStream:
+        """Регистрирует ответ, который генерирует текущая задача, и отправляет кадр start."""
+        stream = ReplyStream(self, connection.chat_id, request_id, user_message, asyncio.current_task())
+        stream.listeners.add(connection)
+        self._streams.setdefault(connection.chat_id, set()).add(stream)
+        stream.send(stream.start_frame())
+        return stream
+
+    def streams(self, chat_id: int) -> List[ReplyStream]:
+        return list(self._streams.get(chat_id, ()))
+
+    def _close_stream(self, stream: ReplyStream):
+        streams = self._streams.get(stream.chat_id)
+        if streams is None:
+            return
+        streams.discard(stream)
+        if not streams:
+            del self._streams[stream.chat_id]
+
+    def _remove(self, connection: ClientConnection):
+        connections = self._by_chat.get(connection.chat_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self._by_chat[connection.chat_id]
+            if self._on_chat_close is not None:
+                self._on_chat_close(connection.chat_id)
+
+
+connections = ConnectionManager(on_chat_open=broker.watch, on_chat_close=broker.unwatch)
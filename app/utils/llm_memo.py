@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional
+
+# Файл SQLite с ответами вспомогательных промптов; общий для всех воркеров на узле.
+# Пустая строка — хранить только в памяти процесса (например, в тестах)
+LLM_MEMO_PATH = os.getenv("LLM_MEMO_PATH", "./llm_memo.db")
+# Ограничение размера: при превышении удаляются давно не использованные записи
+LLM_MEMO_MAX_ENTRIES = int(os.getenv("LLM_MEMO_MAX_ENTRIES", "50000"))
+LLM_MEMO_ENABLED = os.getenv("LLM_MEMO_ENABLED", "1") == "1"
+
+KIND_CLASSIFY = "classify"
+KIND_WEB_SEARCH = "web_search"
+KIND_REWRITE = "rewrite"
+KIND_TRANSLATE = "translate"
+KIND_PREPROCESS = "preprocess"
+
+# Время жизни по видам промптов (секунды), переопределяется через LLM_MEMO_TTL_<KIND>.
+# Перевод и классификация от времени не зависят; переписанный запрос для
+# поиска может устареть вместе с темой (например, «новости про выборы»)
+_DEFAULT_TTLS = {
+    KIND_CLASSIFY: 7 * 86400,
+    KIND_WEB_SEARCH: 7 * 86400,
+    KIND_REWRITE: 86400,
+    KIND_TRANSLATE: 30 * 86400,
+    KIND_PREPROCESS: 86400,
+}
+
+# Время последнего использования обновляется не чаще раза в столько секунд,
+# чтобы чтения не превращались в запись на каждом попадании
+_TOUCH_INTERVAL = 3600
+# Проверять размер не на каждой вставке
+_EVICT_EVERY = 100
+
+_SPACES_RE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.,!?;:…\"'«»"
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> str:
+    """Приводит запрос к виду, в котором совпадают разные написания одной фразы."""
+    text = _SPACES_RE.sub(" ", text.casefold().replace("ё", "е"))
+    return text.strip(_EDGE_PUNCTUATION)
+
+
+def _ttl(kind: str) -> float:
+    return float(os.getenv(f"LLM_MEMO_TTL_{kind.upper()}", str(_DEFAULT_TTLS.get(kind, 86400))))
+
+
+class LLMMemo:
+    """Дисковый кэш ответов на небольшие детерминированные промпты.
+
+    Классификация запроса, решение о веб-поиске, переписывание и перевод
+    поискового запроса зависят только от текста запроса, поэтому ответ
+    модели можно переиспользовать: после перезапуска и между воркерами
+    (SQLite в режиме WAL). Ключ — вид промпта и нормализованный текст.
+    Ошибки хранилища не мешают работе: значение просто вычисляется заново.
+    """
+
+    def __init__(self, path: str = LLM_MEMO_PATH, max_entries: int = LLM_MEMO_MAX_ENTRIES,
+                 enabled: bool = LLM_MEMO_ENABLED):
+        self.path = path or ":memory:"
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.ttls: Dict[str, float] = {kind: _ttl(kind) for kind in _DEFAULT_TTLS}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._hits: Counter = Counter()
+        self._misses: Counter = Counter()
+        self._errors = 0
+
+    def get_or_compute(self, kind: str, text: str, compute: Callable[[], Optional[str]]) -> Optional[str]:
+        """Возвращает сохранённый ответ или вызывает ``compute`` и сохраняет результат.
+
+        ``compute`` возвращает None, если ответ получить не удалось, — такой
+        результат не кэшируется.
+        """
+        if not self.enabled:
+            return compute()
+        key = self._key(kind, text)
+        value = self.get(kind, key)
+        if value is not None:
+            return value
+        value = compute()
+        if value is not None:
+            self.set(kind, key, value)
+        return value
+
+    async def aget_or_compute(self, kind: str, text: str,
+                              compute: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Вариант ``get_or_compute`` для асинхронного ``compute``.
+
+        Обращения к SQLite блокирующие (busy timeout, общий lock, fsync
+        при записи), поэтому выполняются в пуле потоков, а не в цикле событий.
+        """
+        if not self.enabled:
+            return await compute()
+        key = self._key(kind, text)
+        value = await asyncio.to_thread(self.get, kind, key)
+        if value is not None:
+            return value
+        value = await compute()
+        if value is not None:
+            await asyncio.to_thread(self.set, kind, key, value)
+        return value
+
+    def get(self, kind: str, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value, expires_at, used_at FROM llm_memo WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] <= now:
+                    conn.execute("DELETE FROM llm_memo WHERE key = ?", (key,))
+                    row = None
+                if row is None:
+                    self._misses[kind] += 1
+                    return None
+                if now - row[2] > _TOUCH_INTERVAL:
+                    conn.execute("UPDATE llm_memo SET used_at = ? WHERE key = ?", (now, key))
+                self._hits[kind] += 1
+                return row[0]
+        except sqlite3.Error as e:
+            self._errors += 1
+            logger.warning("Memo read failed: %s", e)
+            return None
+
+    def set(self, kind: str, key: str, value: str):
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_memo (key, kind, value, expires_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, kind, value, now + self.ttls.get(kind, 86400), now),
+                )
+                self._inserts += 1
+                if self._inserts % _EVICT_EVERY == 0:
+                    self._evict(conn, now)
+        except sqlite3.Error as e:
+            self._errors += 1
+            logger.warning("Memo write failed: %s", e)
+
+    def stats(self) -> dict:
+        kinds = set(self._hits) | set(self._misses)
+        result = {}
+        for kind in sorted(kinds):
+            hits, misses = self._hits[kind], self._misses[kind]
+            result[kind] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3)}
+        return {"enabled": self.enabled, "errors": self._errors, "kinds": result}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _key(kind: str, text: str) -> str:
+        return kind + ":" + hashlib.blake2b(normalize(text).encode(), digest_size=16).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Один коннект на процесс под self._lock; autocommit (isolation_level=None)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_memo ("
+                "key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_memo_used_at ON llm_memo (used_at)")
+            self._conn = conn
+        return self._conn
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM llm_memo WHERE expires_at <= ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM llm_memo").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM llm_memo WHERE key IN (SELECT key FROM llm_memo ORDER BY used_at LIMIT ?)",
+                (excess,),
+            )
+            logger.info("Memo evicted entries", extra={"evicted": excess})
+
+
+llm_memo = LLMMemo()
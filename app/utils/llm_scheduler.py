@@ -0,0 +1,224 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Optional
+
+# Сколько вызовов модели выполняется одновременно во всём процессе
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Сколько секунд вызов может ждать в очереди; дольше — отказ (вызывающий получает default)
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+# Если ждут обе очереди, из стольких подряд выдач одна достаётся фоновой,
+# чтобы поток интерактивных запросов не остановил её совсем
+LLM_INTERACTIVE_WEIGHT = int(os.getenv("LLM_INTERACTIVE_WEIGHT", "4"))
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+_ANONYMOUS = "anonymous"
+_WAIT_WINDOW = 256
+
+# Кто и с каким приоритетом вызывает модель. Задаётся на входе запроса
+# (llm_context) и доходит до потоков через asyncio.to_thread / copy_context
+_llm_user: contextvars.ContextVar[str] = contextvars.ContextVar("llm_user", default=_ANONYMOUS)
+_llm_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=PRIORITY_BACKGROUND)
+
+
+@contextmanager
+def llm_context(user: Optional[str] = None, priority: Optional[str] = None):
+    """Помечает вызовы модели внутри блока пользователем и/или приоритетом."""
+    tokens = []
+    if user is not None:
+        tokens.append((_llm_user, _llm_user.set(user)))
+    if priority is not None:
+        tokens.append((_llm_priority, _llm_priority.set(priority)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class LLMSchedulerBusy(Exception):
+    """Вызов не дождался свободного слота за LLM_QUEUE_TIMEOUT."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "user", "enqueued_at", "granted", "event", "loop", "future")
+
+    def __init__(self, priority: Optional[str]):
+        priority = priority or _llm_priority.get()
+        self.priority = priority if priority in (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND) else PRIORITY_BACKGROUND
+        self.user = _llm_user.get()
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+    def wake(self) -> bool:
+        if self.event is not None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        except RuntimeError:
+            # Event loop ожидающего уже закрыт — слот ему не нужен
+            return False
+        return True
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMScheduler:
+    """Единая очередь вызовов модели: приоритеты, справедливость, общий лимит.
+
+    Вызов сначала получает слот (их ``max_concurrency``), затем идёт в
+    GigaChat. Ожидающие разложены по приоритетам, внутри приоритета — по
+    пользователям; пользователи обслуживаются по кругу, поэтому новостной
+    запрос с десятками вызовов не задерживает чужие сообщения. Слот можно
+    ждать из потока (``slot``) и из корутины (``aslot``).
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, queue_timeout: float = LLM_QUEUE_TIMEOUT,
+                 interactive_weight: int = LLM_INTERACTIVE_WEIGHT):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.interactive_weight = max(1, interactive_weight)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._interactive_streak = 0
+        # приоритет -> пользователь -> очередь его вызовов (порядок ключей — круг обслуживания)
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {
+            PRIORITY_INTERACTIVE: OrderedDict(),
+            PRIORITY_BACKGROUND: OrderedDict(),
+        }
+        self._waits: Dict[str, Deque[float]] = {priority: deque(maxlen=_WAIT_WINDOW) for priority in self._queues}
+        self._counters: Counter = Counter()
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None):
+        """Блокирующее ожидание слота (для вызовов модели из потоков)."""
+        waiter = _Waiter(priority)
+        waiter.event = threading.Event()
+        if self._enqueue(waiter) and not waiter.event.wait(self.queue_timeout):
+            self._abandon(waiter)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: Optional[str] = None):
+        waiter = _Waiter(priority)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        if self._enqueue(waiter):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._abandon(waiter)
+            except asyncio.CancelledError:
+                # Отменили в очереди: убираем себя, а уже выданный слот возвращаем
+                try:
+                    self._abandon(waiter)
+                except LLMSchedulerBusy:
+                    pass
+                else:
+                    self.release()
+                raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = {priority: sum(len(q) for q in users.values()) for priority, users in self._queues.items()}
+            waits = {priority: sorted(samples) for priority, samples in self._waits.items()}
+            counters = dict(self._counters)
+            active = self._active
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": active,
+            "queued": queued,
+            "wait_ms_p50": {priority: _percentile(samples, 0.5) for priority, samples in waits.items()},
+            "wait_ms_p95": {priority: _percentile(samples, 0.95) for priority, samples in waits.items()},
+            **counters,
+        }
+
+    def _enqueue(self, waiter: _Waiter) -> bool:
+        """Выдаёт слот сразу, если очередь пуста (False); иначе ставит в очередь (True)."""
+        with self._lock:
+            self._counters[waiter.priority] += 1
+            if self._active < self.max_concurrency and not any(self._queues.values()):
+                self._active += 1
+                waiter.granted = True
+                self._waits[waiter.priority].append(0.0)
+                return False
+            self._queues[waiter.priority].setdefault(waiter.user, deque()).append(waiter)
+            return True
+
+    def _abandon(self, waiter: _Waiter):
+        """Таймаут или отмена: выходим из очереди, если слот ещё не выдан."""
+        with self._lock:
+            if waiter.granted:
+                return
+            users = self._queues[waiter.priority]
+            queue = users.get(waiter.user)
+            if queue is not None:
+                queue.remove(waiter)
+                if not queue:
+                    del users[waiter.user]
+            self._counters["abandoned"] += 1
+        raise LLMSchedulerBusy()
+
+    def _dispatch(self):
+        # Вызывается под self._lock
+        while self._active < self.max_concurrency:
+            priority = self._next_priority()
+            if priority is None:
+                return
+            users = self._queues[priority]
+            user, queue = next(iter(users.items()))
+            waiter = queue.popleft()
+            # Пользователь уходит в конец круга (или из очереди, если вызовов больше нет)
+            del users[user]
+            if queue:
+                users[user] = queue
+            if not waiter.wake():
+                continue
+            self._active += 1
+            waiter.granted = True
+            self._waits[priority].append((time.monotonic() - waiter.enqueued_at) * 1000)
+
+    def _next_priority(self) -> Optional[str]:
+        interactive = bool(self._queues[PRIORITY_INTERACTIVE])
+        background = bool(self._queues[PRIORITY_BACKGROUND])
+        if interactive and (not background or self._interactive_streak < self.interactive_weight - 1):
+            self._interactive_streak += 1
+            return PRIORITY_INTERACTIVE
+        if background:
+            self._interactive_streak = 0
+            return PRIORITY_BACKGROUND
+        return None
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * q))], 1)
+
+
+llm_scheduler = LLMScheduler()
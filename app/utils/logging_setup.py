@@ -0,0 +1,163 @@
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import orjson
+
+# Уровень по умолчанию и уровни отдельных модулей: "app.utils.auth=WARNING,app.routers.chat=DEBUG"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# json — одна JSON-строка на запись (для сборщиков логов), text — для консоли разработчика
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Размер очереди до фонового писателя; при переполнении записи отбрасываются, а не блокируют запрос
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Сэмплирование горячих путей: не больше LOG_SAMPLE_BURST записей одного места
+# за LOG_SAMPLE_INTERVAL секунд. WARNING и выше не сэмплируются.
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "1"))
+LOG_SAMPLED_MODULES = os.getenv(
+    "LOG_SAMPLED_MODULES",
+    "app.utils.auth,app.routers.chat,app.utils.connections,app.utils.ai_agent_new,app.utils.salutespeech_client",
+)
+
+# Атрибуты LogRecord, которые не относятся к полям, переданным через extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """Обычная строка лога, поля из extra дописываются как key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Ограничивает частоту записей одного места (logger + шаблон сообщения).
+
+    Пропускает не больше ``burst`` записей за ``interval`` секунд; следующая
+    пропущенная запись получает поле ``suppressed`` с числом отброшенных.
+    """
+
+    def __init__(self, burst: int = LOG_SAMPLE_BURST, interval: float = LOG_SAMPLE_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # (logger, шаблон) -> (начало окна, записано в окне, отброшено)
+        self._windows: Dict[Tuple[str, object], Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.burst <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            started, emitted, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, emitted = now, 0
+            if emitted >= self.burst:
+                self._windows[key] = (started, emitted, suppressed + 1)
+                return False
+            self._windows[key] = (started, emitted + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который никогда не блокирует вызывающий код."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Подставляем аргументы сразу (объекты могут измениться), а
+        # форматирование и запись в поток делает фоновый писатель
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Настраивает корневой логгер: очередь в вызывающем потоке, вывод в stderr в фоновом."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL.upper())
+
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    sampler = SamplingFilter()
+    for name in filter(None, (module.strip() for module in LOG_SAMPLED_MODULES.split(","))):
+        logging.getLogger(name).addFilter(sampler)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый писатель."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
@@ -1,5 +1,5 @@
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Tuple
 
 from agent.news_agent.utils.helpers import (
     search_news,
@@ -10,17 +10,27 @@ from agent.news_agent.utils.helpers import (
 
 from new_agent.main import safe_model_invoke
 
+from app.utils.llm_memo import KIND_TRANSLATE, llm_memo
+
 # Максимальное число новостей для выборки и суммаризации
 _MAX_RESULTS = 7
 
 
-def _collect_articles(query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+def _collect_articles(query: str, num_results: int = 5, query_en: Optional[str] = None,
+                      should_stop: Optional[Callable[[], bool]] = None) -> List[Dict[str, Any]]:
     """Ищет статьи через search_news и извлекает их содержимое.
 
     Возвращает список словарей с ключами: title, url, source, date, content.
+    *query_en* — уже готовый английский вариант запроса; без него запрос
+    переводится отдельным вызовом модели. *should_stop* проверяется перед
+    поиском и перед загрузкой каждой статьи: отменённый сбор возвращает то,
+    что успел набрать.
     """
+    stopped = should_stop or (lambda: False)
     # Переводим запрос при необходимости (английские ключи дают больше результатов)
-    query_en = _translate_if_needed(query)
+    query_en = query_en or _translate_if_needed(query)
+    if stopped():
+        return []
     raw_results = search_news(query_en, num_results * 2) # Запрашиваем больше, чтобы было из чего выбирать после дедупликации
 
     articles: List[Dict[str, Any]] = []
@@ -35,7 +45,7 @@ def _collect_articles(query: str, num_results: int = 5) -> List[Dict[str, Any]]:
             continue
         
         processed_urls.add(url)
-        if len(articles) >= num_results: # Если уже набрали нужное количество уникальных статей
+        if len(articles) >= num_results or stopped(): # Набрали нужное количество уникальных статей или сбор отменён
             break
 
         html = fetch_html_content(url) or ""
@@ -55,34 +65,33 @@ def _collect_articles(query: str, num_results: int = 5) -> List[Dict[str, Any]]:
     return articles
 
 
-def get_news_summary(query: str, num_results: int = 5) -> str:
-    """Формирует сводку новостей по *query*.
+def build_news_prompt(query: str, num_results: int = 5, query_en: Optional[str] = None,
+                      should_stop: Optional[Callable[[], bool]] = None) -> Optional[Tuple[str, str]]:
+    """Собирает статьи по *query* и готовит промпт для сводки.
 
-    1. Ищет релевантные статьи с помощью search_news (Google News/DuckDuckGo).
-    2. Извлекает содержимое статей.
-    3. Просит LLM (safe_model_invoke) сформировать отчёт с цитированием источников.
+    Возвращает (prompt, sources_block) или None, если статей не нашлось.
+    Сама сводка генерируется вызывающим кодом по токенам (safe_model_stream).
     """
-    try:
-        num_results = min(num_results, _MAX_RESULTS)
-        articles = _collect_articles(query, num_results)
-        if not articles:
-            return ""
-
-        # Формируем нумерованный список источников для промпта
-        sources_block_lines = []
-        content_block_lines = []
-        for idx, art in enumerate(articles, 1):
-            sources_block_lines.append(f"[{idx}] {art['title']} — {art['url']}")
-            # В контент берём первые 2000 символов, чтобы не переполнить промпт
-            content_excerpt = (art["content"] or "")[:2000]
-            content_block_lines.append(
-                f"СТАТЬЯ [{idx}]:\nИсточник: {art['source']}\nДата: {art['date']}\nURL: {art['url']}\n{content_excerpt}\n"
-            )
-
-        sources_block = "\n".join(sources_block_lines)
-        content_block = "\n".join(content_block_lines)
-
-        prompt = f"""
+    num_results = min(num_results, _MAX_RESULTS)
+    articles = _collect_articles(query, num_results, query_en, should_stop)
+    if not articles:
+        return None
+
+    # Формируем нумерованный список источников для промпта
+    sources_block_lines = []
+    content_block_lines = []
+    for idx, art in enumerate(articles, 1):
+        sources_block_lines.append(f"[{idx}] {art['title']} — {art['url']}")
+        # В контент берём первые 2000 символов, чтобы не переполнить промпт
+        content_excerpt = (art["content"] or "")[:2000]
+        content_block_lines.append(
+            f"СТАТЬЯ [{idx}]:\nИсточник: {art['source']}\nДата: {art['date']}\nURL: {art['url']}\n{content_excerpt}\n"
+        )
+
+    sources_block = "\n".join(sources_block_lines)
+    content_block = "\n".join(content_block_lines)
+
+    prompt = f"""
 Ты — опытный аналитик новостей. На основе приведённых ниже статей составь детальный обзор по теме: "{query}".
 
 Требования к ответу:
@@ -105,18 +114,13 @@ def get_news_summary(query: str, num_results: int = 5) -> str:
 
 Сформируй ответ на русском языке.
 """
-        summary = safe_model_invoke(prompt, "")
+    return prompt, sources_block
 
-        # Гарантируем, что список источников будет присутствовать в ответе,
-        # даже если LLM его не добавил.
-        summary_with_sources = (
-            summary.rstrip() + "\n\nИсточники:\n" + sources_block
-        )
 
-        return summary_with_sources
-    except Exception as e:
-        print(f"Ошибка в get_news_summary: {e}")
-        return ""
+def append_sources(summary: str, sources_block: str) -> str:
+    """Гарантирует, что список источников будет в ответе, даже если LLM его не добавил."""
+    return summary.rstrip() + "\n\nИсточники:\n" + sources_block
+
 
 # ----------------------------------------------------------------------------
 # Вспомогательные функции
@@ -129,6 +133,9 @@ def _translate_if_needed(text: str) -> str:
             "Переведи следующую фразу на английский, чтобы использовать её как поисковый запрос. Верни ТОЛЬКО перевод без кавычек: "
             + text
         )
-        translated = safe_model_invoke(prompt, text)
-        return translated.strip().strip('"\'')
+
+        def ask() -> Optional[str]:
+            return safe_model_invoke(prompt, "").strip().strip('"\'') or None
+
+        return llm_memo.get_or_compute(KIND_TRANSLATE, text, ask) or text
     return text 
\ No newline at end of file
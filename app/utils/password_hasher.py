@@ -0,0 +1,115 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Optional, Tuple
+
+from passlib.context import CryptContext
+
+# Сколько потоков считают bcrypt (bcrypt отпускает GIL, потоки работают параллельно)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Сколько операций может ждать или выполняться одновременно; сверх — отказ (503)
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+# Стоимость bcrypt. Хэши с другим числом раундов пересчитываются при входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Сколько последних замеров держим для перцентилей
+_LATENCY_WINDOW = 256
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь хэширования заполнена — запрос нужно повторить позже."""
+
+
+class PasswordHasher:
+    """Хэширование и проверка паролей в отдельном пуле потоков.
+
+    bcrypt намеренно медленный: в event loop он останавливал бы все
+    запросы и WebSocket-соединения на время каждого входа. Число
+    ожидающих операций ограничено, поэтому поток логинов получает отказ,
+    а не вытесняет остальной трафик.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.rounds = rounds
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        # Меняется только из event loop
+        self._pending = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._lock = threading.Lock()
+        self._count = 0
+        self._latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._waits: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Проверяет пароль; второй элемент — новый хэш, если старый надо пересчитать."""
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed)
+        if new_hash is not None:
+            self._rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            waits = sorted(self._waits)
+            count = self._count
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "rejected": self._rejected,
+            "rehashed": self._rehashed,
+            "operations": count,
+            "hash_ms_p50": _percentile(latencies, 0.5),
+            "hash_ms_p95": _percentile(latencies, 0.95),
+            "wait_ms_p95": _percentile(waits, 0.95),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn: Callable, *args):
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise PasswordHasherBusy()
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, fn, args, time.perf_counter())
+        finally:
+            self._pending -= 1
+
+    def _timed(self, fn: Callable, args: tuple, queued_at: float):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self._count += 1
+                self._latencies.append((finished - started) * 1000)
+                self._waits.append((started - queued_at) * 1000)
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * q))], 1)
+
+
+password_hasher = PasswordHasher()
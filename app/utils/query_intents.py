@@ -0,0 +1,273 @@
+"""Размеченные примеры запросов для локального классификатора news/chat.
+
+news — нужен обзор свежих событий и СМИ; chat — всё остальное (общение,
+советы, инструкции, объяснения, творческие задачи). Пополняйте список
+реальными запросами, на которых классификатор ошибается, и проверяйте
+результат через ``python -m benchmarks.eval_query_router``.
+"""
+
+NEWS = [
+    "Расскажи последние новости про Tesla",
+    "Что нового в мире технологий?",
+    "Какие тренды на рынке нефти сейчас?",
+    "Последние новости",
+    "Что происходит в мире?",
+    "Какие новости сегодня?",
+    "Новости дня",
+    "Свежие новости из Москвы",
+    "Что случилось на бирже сегодня",
+    "Курс доллара сегодня, что пишут аналитики",
+    "Что известно о выборах в США",
+    "Обзор новостей за неделю",
+    "Какие главные события произошли вчера",
+    "Новости спорта",
+    "Что слышно про санкции против России",
+    "Последние события на Украине",
+    "Что нового у Apple",
+    "Новости про искусственный интеллект за последнюю неделю",
+    "Что пишут СМИ о повышении ключевой ставки",
+    "Какие новости в экономике",
+    "Расскажи о последних событиях в Израиле",
+    "Что нового в политике",
+    "Последние новости про биткоин",
+    "Как сейчас обстоят дела на фондовом рынке",
+    "Что произошло с акциями Сбербанка сегодня",
+    "Свежие новости про OpenAI",
+    "Какие новости про Илона Маска",
+    "Что там с ценами на бензин, есть новости?",
+    "Чем закончился матч Спартак Зенит",
+    "Кто выиграл вчерашний матч",
+    "Результаты выборов",
+    "Последние новости науки",
+    "Что нового в космосе, какие запуски были на этой неделе",
+    "Новости культуры",
+    "Дайджест новостей за сегодня",
+    "Сводка новостей",
+    "Что сегодня в заголовках",
+    "Что нового в автомобильной индустрии",
+    "Какие новости про Китай",
+    "Новости Европы",
+    "Что случилось в Японии",
+    "Новости про землетрясение",
+    "Что известно о пожаре в торговом центре",
+    "Последние новости о погодных аномалиях",
+    "Что происходит с курсом рубля",
+    "Что сказал президент на пресс-конференции",
+    "Какие законы приняла Госдума на этой неделе",
+    "Новости про ЦБ и ставку",
+    "Что нового в игровой индустрии",
+    "Анонсы Samsung на последней презентации",
+    "Что показали на WWDC",
+    "Новости про nvidia",
+    "Что нового с GPT",
+    "Какие новости про криптовалюты",
+    "Что происходит на Ближнем Востоке",
+    "Ситуация в Газе последние новости",
+    "Какие последние новости про пандемию",
+    "Что пишут про инфляцию в этом месяце",
+    "Итоги саммита G20",
+    "Что нового на рынке недвижимости",
+    "Новости рынка труда",
+    "Какие компании объявили об увольнениях",
+    "Кто стал новым премьер-министром",
+    "Что известно про аварию",
+    "Новости Санкт-Петербурга",
+    "Что нового в Казани",
+    "Какие новости в регионе",
+    "Последние новости футбола",
+    "Трансферные новости",
+    "Новости хоккея КХЛ",
+    "Что нового в Формуле 1",
+    "Обзор прессы",
+    "Что обсуждают в СМИ",
+    "Главные новости часа",
+    "Срочные новости",
+    "Что происходит с ценами на нефть",
+    "Какие новости про Газпром",
+    "Новости про Яндекс",
+    "Что нового у Сбера",
+    "Последние события в мире",
+    "Что произошло за выходные",
+    "Какие события были сегодня утром",
+    "latest news",
+    "what's new in tech",
+    "news about Tesla",
+    "breaking news today",
+    "what happened in the stock market today",
+    "latest headlines",
+    "recent news about AI",
+    "what is going on in the world",
+    "news on the US election",
+    "today's top stories",
+    "latest updates on the war",
+    "crypto news",
+    "what did the fed announce",
+    "sports news",
+    "any news about apple",
+    "recent events in europe",
+    "what happened yesterday in politics",
+    "current events summary",
+    "Расскажи новости",
+    "Дай новости",
+    "Есть что-то новое про Марс?",
+    "Какие свежие новости про экономику России",
+    "Что случилось с Boeing",
+    "Новости про забастовку",
+    "Что нового в медицине за последние дни",
+    "Обзор событий на рынке акций за неделю",
+    "Что известно о новом законе о мигрантах",
+    "Как прошли переговоры",
+    "Что решили на совещании ОПЕК",
+    "Какая сейчас обстановка в Сирии",
+]
+
+CHAT = [
+    "Как дела?",
+    "Привет!",
+    "Привет, как ты?",
+    "Доброе утро",
+    "Добрый вечер",
+    "Добрый день",
+    "Здравствуй",
+    "Здравствуйте",
+    "Как у тебя дела",
+    "Спасибо",
+    "Спасибо большое, ты очень помог",
+    "Пока",
+    "До свидания",
+    "Кто ты?",
+    "Что ты умеешь?",
+    "Как тебя зовут",
+    "Расскажи о себе",
+    "Ты робот?",
+    "Как приготовить яблочный пирог?",
+    "Рецепт борща",
+    "Как сварить гречку",
+    "Как испечь блины",
+    "Что приготовить на ужин",
+    "Рецепт оливье",
+    "Как приготовить плов",
+    "Как сделать тесто для пиццы",
+    "Как заварить чай правильно",
+    "Посоветуй фильм на вечер",
+    "Посоветуй книгу",
+    "Какую музыку послушать",
+    "Напиши стихотворение про осень",
+    "Сочини сказку для ребёнка",
+    "Придумай название для кафе",
+    "Напиши поздравление с днём рождения",
+    "Помоги написать резюме",
+    "Напиши письмо начальнику",
+    "Переведи на английский: я люблю программирование",
+    "Как будет кошка по-английски",
+    "Объясни теорию относительности простыми словами",
+    "Что такое фотосинтез",
+    "Почему небо голубое",
+    "Как работает двигатель внутреннего сгорания",
+    "Что такое черная дыра",
+    "Объясни, что такое рекурсия",
+    "Как написать сортировку пузырьком на Python",
+    "Что такое замыкание в JavaScript",
+    "Помоги исправить ошибку в коде",
+    "Как работает async await в Python",
+    "Как создать список в Python",
+    "Что такое SQL индекс",
+    "Реши уравнение 2x + 3 = 7",
+    "Сколько будет 15 умножить на 17",
+    "Как найти площадь круга",
+    "Докажи теорему Пифагора",
+    "Что такое производная",
+    "Как выучить английский быстро",
+    "Как подготовиться к собеседованию",
+    "Как научиться плавать",
+    "Как перестать прокрастинировать",
+    "Как справиться со стрессом",
+    "Что делать, если не могу уснуть",
+    "Как бросить курить",
+    "Какие упражнения делать для спины",
+    "Как похудеть без диет",
+    "Сколько воды надо пить в день",
+    "Как ухаживать за кактусом",
+    "Как выбрать ноутбук для учёбы",
+    "Как настроить роутер",
+    "Как почистить клавиатуру",
+    "Как вывести пятно с одежды",
+    "Как завязать галстук",
+    "Что подарить маме на день рождения",
+    "Идеи для свидания",
+    "Куда сходить в выходные с детьми",
+    "Какие есть настольные игры для компании",
+    "Расскажи анекдот",
+    "Расскажи интересный факт",
+    "Загадай мне загадку",
+    "Давай поиграем в города",
+    "В чем смысл жизни",
+    "Что такое счастье",
+    "Ты веришь в судьбу?",
+    "Мне грустно",
+    "Я устал",
+    "Поговори со мной",
+    "Кто написал Войну и мир",
+    "Когда была Куликовская битва",
+    "Кто такой Наполеон",
+    "Расскажи историю Древнего Рима",
+    "Столица Австралии",
+    "Какая самая высокая гора в мире",
+    "Сколько планет в солнечной системе",
+    "Чем отличается вирус от бактерии",
+    "Как устроена демократия",
+    "Объясни, что такое инфляция",
+    "Как работает биржа",
+    "Что такое облигации и как в них инвестировать",
+    "Как составить личный бюджет",
+    "Как открыть ИП",
+    "Как написать бизнес-план",
+    "Как правильно торговаться",
+    "Составь план тренировок на неделю",
+    "Составь меню на неделю",
+    "Составь список покупок для пикника",
+    "Как организовать рабочее место",
+    "Как ухаживать за собакой",
+    "Почему кошки мурлыкают",
+    "Как научить собаку команде сидеть",
+    "Что посадить на даче весной",
+    "Как вырастить помидоры",
+    "Как покрасить стену",
+    "Как поменять колесо",
+    "Как прокачать машину",
+    "Как играть в шахматы",
+    "Правила игры в покер",
+    "Как собрать кубик Рубика",
+    "Нарисуй мне кота словами",
+    "Продолжи историю",
+    "Ok",
+    "Хорошо",
+    "Понятно",
+    "Да",
+    "Нет",
+    "Круто",
+    "Ладно, а ещё?",
+    "Повтори, пожалуйста",
+    "Сделай короче",
+    "Объясни подробнее",
+    "hello",
+    "hi there",
+    "how are you",
+    "good morning",
+    "thanks",
+    "who are you",
+    "tell me a joke",
+    "how to cook pasta",
+    "recipe for pancakes",
+    "explain quantum computing simply",
+    "write a poem about the sea",
+    "translate hello into french",
+    "how do I learn python",
+    "what is the meaning of life",
+    "help me write an email",
+    "what is a neural network",
+    "how to make a cake",
+    "give me a workout plan",
+    "recommend a good book",
+    "how does photosynthesis work",
+]
@@ -0,0 +1,162 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from app.utils.query_intents import CHAT, NEWS
+
+# Ниже этой уверенности решение отдаётся LLM-классификатору
+QUERY_ROUTER_THRESHOLD = float(os.getenv("QUERY_ROUTER_THRESHOLD", "0.85"))
+
+LABEL_NEWS = "news"
+LABEL_CHAT = "chat"
+
+SOURCE_RULE = "rule"
+SOURCE_MODEL = "model"
+
+# Прямые указания на новости: такой запрос не нужно отправлять в LLM
+_NEWS_PATTERNS = [
+    r"новост", r"\bnews\b", r"headline", r"заголовк", r"дайджест", r"сводк", r"breaking",
+]
+# Кулинария, переводы и тексты «под заказ» — всегда обычный чат
+_CHAT_PATTERNS = [
+    r"рецепт", r"\bкак (приготовить|сварить|испечь|пожарить)", r"\brecipe", r"\bhow to (cook|make|bake)",
+    r"\bпереведи", r"\btranslate\b", r"\bнапиши (стих|письм|поздравлен|сказк|код)", r"\bсочини",
+]
+# Короткие приветствия и реплики
+_GREETING_TRIGGERS = [
+    "как дела", "как у тебя дела", "привет", "доброе утро", "добрый вечер",
+    "добрый день", "здравствуй", "здравствуйте", "спасибо", "hello", "thanks",
+]
+_GREETING_MAX_LEN = 20
+
+_NEWS_RE = re.compile("|".join(_NEWS_PATTERNS))
+_CHAT_RE = re.compile("|".join(_CHAT_PATTERNS))
+_WORD_RE = re.compile(r"[a-zа-я0-9]+")
+
+# Длина «основы» слова: грубая замена стеммера, склеивает падежи и времена
+_STEM_LEN = 5
+
+
+def _features(text: str) -> List[str]:
+    words = _WORD_RE.findall(text.lower().replace("ё", "е"))
+    stems = [word[:_STEM_LEN] for word in words]
+    features = [f"w:{word}" for word in words] + [f"s:{stem}" for stem in stems]
+    features += [f"b:{a}_{b}" for a, b in zip(stems, stems[1:])]
+    if stems:
+        # Первое слово различает «что нового…» и «что такое…», «как…» и «какие…»
+        features.append(f"f:{stems[0]}")
+    return features
+
+
+class RouteDecision:
+    __slots__ = ("label", "confidence", "source")
+
+    def __init__(self, label: str, confidence: float, source: str):
+        self.label = label
+        self.confidence = confidence
+        self.source = source
+
+    def __repr__(self):
+        return f"RouteDecision({self.label!r}, {self.confidence:.2f}, {self.source!r})"
+
+
+class QueryRouter:
+    """Локальный классификатор запросов news/chat: правила + наивный Байес.
+
+    Сначала проверяются явные ключевые слова, затем мультиномиальный
+    наивный Байес по словам, их основам и парам основ. Модель обучается
+    при импорте на примерах из ``app.utils.query_intents`` (доли
+    миллисекунды) и не требует внешних зависимостей. Если уверенность
+    ниже порога, ``classify`` всё равно возвращает лучшую догадку, а
+    вызывающий код решает, спрашивать ли LLM (см. ``confident``).
+    """
+
+    def __init__(self, examples: Iterable[Tuple[str, str]], threshold: float = QUERY_ROUTER_THRESHOLD):
+        self.threshold = threshold
+        self._priors: Dict[str, float] = {}
+        self._log_probs: Dict[str, Dict[str, float]] = {}
+        self._unknown: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._decisions: Counter = Counter()
+        self.fit(examples)
+
+    def fit(self, examples: Iterable[Tuple[str, str]]):
+        counts: Dict[str, Counter] = {LABEL_NEWS: Counter(), LABEL_CHAT: Counter()}
+        docs: Counter = Counter()
+        for text, label in examples:
+            counts[label].update(_features(text))
+            docs[label] += 1
+
+        vocabulary = set(counts[LABEL_NEWS]) | set(counts[LABEL_CHAT])
+        total_docs = sum(docs.values())
+        for label, feature_counts in counts.items():
+            # Сглаживание Лапласа: неизвестный признак не обнуляет вероятность
+            denominator = sum(feature_counts.values()) + len(vocabulary)
+            self._priors[label] = math.log((docs[label] + 1) / (total_docs + 2))
+            self._log_probs[label] = {
+                feature: math.log((count + 1) / denominator) for feature, count in feature_counts.items()
+            }
+            self._unknown[label] = math.log(1 / denominator)
+        self._vocabulary = vocabulary
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        # Признаки вне словаря одинаково «тянут» обе метки и лишь размывают
+        # уверенность, поэтому учитываем только известные модели
+        features = [feature for feature in _features(text) if feature in self._vocabulary]
+        # Признаки одного слова (слово, основа, пара) сильно зависимы, и
+        # «наивная» сумма даёт завышенную уверенность. Делим на корень из
+        # числа признаков — уверенность становится ближе к реальной точности
+        scale = math.sqrt(max(1, len(features)))
+        scores = {}
+        for label, log_probs in self._log_probs.items():
+            unknown = self._unknown[label]
+            likelihood = sum(log_probs.get(feature, unknown) for feature in features)
+            scores[label] = self._priors[label] + likelihood / scale
+        top = max(scores.values())
+        weights = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(weights.values())
+        return {label: weight / total for label, weight in weights.items()}
+
+    def classify(self, text: str) -> RouteDecision:
+        decision = self._classify(text)
+        with self._lock:
+            self._decisions[decision.source if self.confident(decision) else "unsure"] += 1
+        return decision
+
+    def confident(self, decision: RouteDecision) -> bool:
+        return decision.confidence >= self.threshold
+
+    def stats(self) -> dict:
+        with self._lock:
+            decisions = dict(self._decisions)
+        total = sum(decisions.values())
+        unsure = decisions.get("unsure", 0)
+        return {
+            "threshold": self.threshold,
+            "decisions": decisions,
+            "llm_calls_saved": round((total - unsure) / total, 3) if total else None,
+        }
+
+    def _classify(self, text: str) -> RouteDecision:
+        lower = text.lower().strip()
+        is_news = bool(_NEWS_RE.search(lower))
+        is_chat = bool(_CHAT_RE.search(lower)) or (
+            len(lower) < _GREETING_MAX_LEN and any(trigger in lower for trigger in _GREETING_TRIGGERS)
+        )
+        # Сработали правила обоих типов — пусть решает модель
+        if is_news != is_chat:
+            return RouteDecision(LABEL_NEWS if is_news else LABEL_CHAT, 1.0, SOURCE_RULE)
+
+        proba = self.predict_proba(lower)
+        label = max(proba, key=proba.get)
+        return RouteDecision(label, proba[label], SOURCE_MODEL)
+
+
+def seed_examples() -> List[Tuple[str, str]]:
+    return [(text, LABEL_NEWS) for text in NEWS] + [(text, LABEL_CHAT) for text in CHAT]
+
+
+query_router = QueryRouter(seed_examples())
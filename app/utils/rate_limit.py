@@ -0,0 +1,250 @@
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import List, Optional, Pattern, Tuple
+
+from fastapi.responses import JSONResponse
+
+from app.utils.auth import token_identity
+
+# Выключатель на случай отладки и нагрузочных тестов
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# Пусто — счётчики в памяти процесса (лимиты действуют на каждый воркер отдельно).
+# redis://host:6379/0 — общие счётчики для всех воркеров и узлов.
+RATE_LIMIT_STORE_URL = os.getenv("RATE_LIMIT_STORE_URL", "")
+# Брать IP клиента из X-Forwarded-For (только за доверенным прокси)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+# Ограничение памяти in-memory хранилища: число отслеживаемых ключей
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+SCOPE_USER = "user"
+SCOPE_IP = "ip"
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitRule:
+    """Бюджет для группы маршрутов: token bucket на пользователя или IP.
+
+    ``per_minute`` — скорость пополнения, ``burst`` — ёмкость корзины.
+    Правило без ``pattern`` не привязано к HTTP-маршруту и вызывается из
+    кода напрямую (например, для сообщений по WebSocket).
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int, scope: str = SCOPE_USER,
+                 method: Optional[str] = None, pattern: Optional[str] = None):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.scope = scope
+        self.method = method
+        self.pattern: Optional[Pattern] = re.compile(pattern) if pattern else None
+
+
+def _rule(name: str, per_minute: float, burst: int, **kwargs) -> RateLimitRule:
+    # Бюджет переопределяется через RATE_LIMIT_<NAME>_PER_MINUTE / _BURST
+    env = name.upper()
+    return RateLimitRule(
+        name,
+        float(os.getenv(f"RATE_LIMIT_{env}_PER_MINUTE", str(per_minute))),
+        int(os.getenv(f"RATE_LIMIT_{env}_BURST", str(burst))),
+        **kwargs,
+    )
+
+
+# Сообщения, на которые отвечает GigaChat: общий бюджет для REST и WebSocket
+CHAT_MESSAGE_LIMIT = _rule("chat_message", 20, 10, method="POST", pattern=r"^/chat/\d+/messages$")
+# Платные вызовы SaluteSpeech
+VOICE_LIMIT = _rule("voice", 10, 5, method="POST", pattern=r"^/voice/(synthesize|transcribe)$")
+# Вход и регистрация (bcrypt) — по IP, пользователь ещё не известен
+AUTH_LIMIT = _rule("auth", 10, 10, scope=SCOPE_IP, method="POST", pattern=r"^/auth/(token|register|refresh)$")
+
+DEFAULT_RULES = [CHAT_MESSAGE_LIMIT, VOICE_LIMIT, AUTH_LIMIT]
+
+
+class RateLimitStore:
+    """Хранилище корзин. ``take`` списывает токен и возвращает (разрешено, через сколько секунд повторить)."""
+
+    async def take(self, key: str, rate: float, capacity: int, cost: int = 1) -> Tuple[bool, float]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Корзины в памяти процесса. Без await внутри — атомарно для event loop."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, capacity: int, cost: int = 1) -> Tuple[bool, float]:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = float(capacity)
+        else:
+            tokens, updated_at = bucket
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            self._buckets.move_to_end(key)
+
+        if tokens >= cost:
+            allowed, retry_after = True, 0.0
+            tokens -= cost
+        else:
+            allowed, retry_after = False, (cost - tokens) / rate
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+# Время берётся из Redis (TIME), чтобы часы воркеров не влияли на пополнение
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+end
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Общие для всех воркеров корзины: один Lua-скрипт на проверку (один round-trip)."""
+
+    KEY_PREFIX = "ratelimit:"
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("Для RATE_LIMIT_STORE_URL=redis://... установите пакет redis") from e
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(_TOKEN_BUCKET_LUA)
+
+    async def take(self, key: str, rate: float, capacity: int, cost: int = 1) -> Tuple[bool, float]:
+        allowed, retry_after = await self._script(keys=[self.KEY_PREFIX + key], args=[rate, capacity, cost])
+        return bool(int(allowed)), float(retry_after)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_rate_limit_store(url: str = RATE_LIMIT_STORE_URL) -> RateLimitStore:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRateLimitStore(url)
+    return InMemoryRateLimitStore()
+
+
+class RateLimiter:
+    def __init__(self, rules: List[RateLimitRule], store: RateLimitStore, enabled: bool = RATE_LIMIT_ENABLED):
+        self.rules = rules
+        self.store = store
+        self.enabled = enabled
+
+    def match(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.method == method and rule.pattern is not None and rule.pattern.match(path):
+                return rule
+        return None
+
+    async def hit(self, rule: RateLimitRule, identity: str) -> Tuple[bool, float]:
+        if not self.enabled:
+            return True, 0.0
+        try:
+            return await self.store.take(f"{rule.name}:{identity}", rule.rate, rule.capacity)
+        except Exception as e:
+            # Хранилище недоступно — пропускаем запрос, а не роняем API
+            logger.warning("Store error, allowing request: %s", e)
+            return True, 0.0
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
+
+
+class RateLimitMiddleware:
+    """ASGI-middleware: проверяет бюджет только для маршрутов из правил.
+
+    Остальные запросы проходят без обращения к хранилищу. Пользователь
+    определяется по Bearer-токену без БД, анонимные запросы — по IP.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        rule = self.limiter.match(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        allowed, retry_after = await self.limiter.hit(rule, _identity(scope, rule.scope))
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        response = JSONResponse(
+            {"detail": "Too many requests"},
+            status_code=429,
+            headers={"Retry-After": retry_after_header(retry_after)},
+        )
+        await response(scope, receive, send)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _identity(scope, rule_scope: str) -> str:
+    if rule_scope == SCOPE_USER:
+        authorization = _header(scope, b"authorization")
+        if authorization and authorization.startswith("Bearer "):
+            identity = token_identity(authorization[7:])
+            if identity is not None:
+                return identity
+    return f"ip:{_client_ip(scope)}"
+
+
+rate_limiter = RateLimiter(DEFAULT_RULES, create_rate_limit_store())
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from fastapi import Response
+
+# Сколько секунд живёт запись (страховка на случай пропущенной инвалидации)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+# Ограничения памяти: число пользователей и записей на пользователя
+RESPONSE_CACHE_MAX_USERS = int(os.getenv("RESPONSE_CACHE_MAX_USERS", "1000"))
+RESPONSE_CACHE_MAX_ENTRIES_PER_USER = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES_PER_USER", "64"))
+
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag — хэш точного тела ответа."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "expires_at")
+
+    def __init__(self, body: bytes, ttl: float):
+        self.body = body
+        self.etag = make_etag(body)
+        self.expires_at = time.monotonic() + ttl
+
+    def to_response(self, if_none_match: Optional[str] = None) -> Response:
+        # no-cache: браузер хранит копию, но каждый раз ревалидирует по ETag
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """Кэш сериализованных ответов (список чатов, страницы сообщений) по пользователю.
+
+    Ключ — (вид, chat_id, параметры запроса). Пишущие обработчики вызывают
+    ``invalidate``; повторный GET без изменений отдаётся из памяти или как
+    304 по If-None-Match, без запроса к БД. Кэш локален для процесса.
+
+    Чтобы ответ, построенный до записи, не попал в кэш после её
+    ``invalidate``, обработчик берёт ``generation`` до запроса к БД и
+    передаёт его в ``set``: если поколение (пользователь, чат) с тех пор
+    сменилось, ответ отдаётся, но не сохраняется.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_users: int = RESPONSE_CACHE_MAX_USERS,
+                 max_entries_per_user: int = RESPONSE_CACHE_MAX_ENTRIES_PER_USER):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_entries_per_user = max_entries_per_user
+        self._users: "OrderedDict[int, OrderedDict[Hashable, CachedResponse]]" = OrderedDict()
+        # Поколение (user_id, chat_id) — значение счётчика _clock при последнем
+        # invalidate; chat_id=None — список чатов. Вытесненные из LRU записи
+        # учитываются через _evicted: их поколение не меньше него
+        self._generations: "OrderedDict[Tuple[int, Optional[int]], int]" = OrderedDict()
+        self._max_generations = max(1, max_users * max_entries_per_user)
+        self._clock = 0
+        self._evicted = 0
+        self._lock = threading.Lock()
+
+    def generation(self, user_id: int, chat_id: Optional[int] = None) -> int:
+        """Поколение данных (пользователь, чат); берётся до чтения из БД."""
+        with self._lock:
+            return self._generations.get((user_id, chat_id), self._evicted)
+
+    def get(self, user_id: int, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is None:
+                return None
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            self._users.move_to_end(user_id)
+            return entry
+
+    def set(self, user_id: int, key: Hashable, body: bytes, generation: Optional[int] = None) -> CachedResponse:
+        entry = CachedResponse(body, self.ttl)
+        with self._lock:
+            if generation is not None and self._generations.get((user_id, key[1]), self._evicted) != generation:
+                # Пока строили ответ, данные изменились — не сохраняем устаревшее
+                return entry
+            entries = self._users.get(user_id)
+            if entries is None:
+                entries = self._users[user_id] = OrderedDict()
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(user_id)
+            entries[key] = entry
+            entries.move_to_end(key)
+            if len(entries) > self.max_entries_per_user:
+                entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, user_id: int, chat_id: Optional[int] = None):
+        """Сбрасывает список чатов пользователя и, если указан chat_id, страницы этого чата."""
+        with self._lock:
+            self._bump(user_id, None)
+            if chat_id is not None:
+                self._bump(user_id, chat_id)
+            entries = self._users.get(user_id)
+            if not entries:
+                return
+            for key in [k for k in entries if k[0] == "chats" or (chat_id is not None and k[1] == chat_id)]:
+                del entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def _bump(self, user_id: int, chat_id: Optional[int]):
+        self._clock += 1
+        self._generations[(user_id, chat_id)] = self._clock
+        self._generations.move_to_end((user_id, chat_id))
+        if len(self._generations) > self._max_generations:
+            _, evicted = self._generations.popitem(last=False)
+            self._evicted = max(self._evicted, evicted)
+
+
+response_cache = ResponseCache()
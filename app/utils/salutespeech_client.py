@@ -2,7 +2,7 @@ import os
 import requests
 import base64
 import uuid
-import json
+import logging
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from .salutespeech_auth import get_salute_access_token
@@ -41,6 +41,8 @@ VOICE_DESCRIPTIONS = {
 # Голос по умолчанию
 DEFAULT_VOICE = "May_24000"  # Женский голос (Майя) с высоким качеством
 
+logger = logging.getLogger(__name__)
+
 class SaluteSpeechClient:
     """
     Клиент для работы с SaluteSpeech API: STT (speech-to-text) и TTS (text-to-speech)
@@ -48,7 +50,7 @@ class SaluteSpeechClient:
     def __init__(self):
         # Базовый URL для SaluteSpeech API v1 (согласно документации)
         self.base_url = "https://smartspeech.sber.ru/rest/v1"
-        print(f"[DEBUG] SaluteSpeechClient initialized with base_url: {self.base_url}") # Отладочный вывод
+        logger.debug("SaluteSpeechClient initialized", extra={"base_url": self.base_url})
         self.access_token = None
         self.token_expires_at = None
         # Общие заголовки, Authorization добавится после аутентификации
@@ -60,7 +62,7 @@ class SaluteSpeechClient:
         """Получает и сохраняет токен доступа."""
         token_info = get_salute_access_token()
         if not token_info or not token_info.get('access_token'):
-            print("Не удалось получить токен доступа SaluteSpeech или токен пуст.")
+            logger.error("Не удалось получить токен доступа SaluteSpeech или токен пуст")
             self.access_token = None
             self.token_expires_at = None
             return False
@@ -70,16 +72,16 @@ class SaluteSpeechClient:
         # Устанавливаем буферное время, чтобы обновить токен заранее
         buffer_time = min(300, int(expires_in * 0.1)) # 10% от времени жизни или 5 минут
         self.token_expires_at = datetime.now() + timedelta(seconds=expires_in - buffer_time)
-        print(f"SaluteSpeech токен получен, действителен до: {self.token_expires_at}")
+        logger.info("SaluteSpeech токен получен", extra={"expires_at": self.token_expires_at.isoformat()})
         return True
 
     def ensure_valid_token(self):
         """Проверяет валидность токена и обновляет его при необходимости."""
         if not self.access_token or not self.token_expires_at or datetime.now() >= self.token_expires_at:
-            print("Токен SaluteSpeech отсутствует или истек, обновляем...")
+            logger.info("Токен SaluteSpeech отсутствует или истек, обновляем")
             if not self.authenticate():
                 # Если аутентификация не удалась, возвращаем False
-                print("Не удалось обновить токен SaluteSpeech. Запросы к API будут невозможны.")
+                logger.error("Не удалось обновить токен SaluteSpeech. Запросы к API будут невозможны")
                 return False
         return True
 
@@ -94,10 +96,10 @@ class SaluteSpeechClient:
         Returns:
             Текстовая транскрипция, пустая строка если транскрипция не удалась, или None при ошибке подключения.
         """
-        print(f"[DEBUG] Transcribe вызван с content_type: {content_type}, размер аудио: {len(audio_bytes)} байт")
+        logger.debug("Transcribe вызван", extra={"content_type": content_type, "audio_bytes": len(audio_bytes)})
         
         if not self.ensure_valid_token():
-            print("Ошибка аутентификации SaluteSpeech для STT. Проверьте учетные данные и доступность API.")
+            logger.error("Ошибка аутентификации SaluteSpeech для STT. Проверьте учетные данные и доступность API")
             # Возвращаем None, чтобы сигнализировать об ошибке аутентификации
             return None
         
@@ -130,66 +132,53 @@ class SaluteSpeechClient:
                 try:
                     rate_part = content_type.split('rate=')[1].split(';')[0].split(',')[0]
                     rate = rate_part
-                    print(f"[DEBUG] Извлечен rate из content_type: {rate}")
                 except:
                     rate = '16000'
-                    print(f"[DEBUG] Не удалось извлечь rate, используем по умолчанию: {rate}")
             
             params['sample_rate'] = rate
             params['channels_count'] = '2'   # API требует стерео
-            print(f"[DEBUG] Для WAV/PCM установлены параметры: sample_rate={rate}, channels_count=2")
         elif 'webm' in content_type.lower():
             # Для WebM с Opus нам не нужно указывать дополнительные параметры,
             # SaluteSpeech должен автоматически определить параметры
-            print(f"[DEBUG] WebM формат - дополнительные параметры не нужны")
             pass
         elif 'ogg' in content_type.lower():
             # Для Ogg с Opus кодеком также не требуются дополнительные параметры
-            print(f"[DEBUG] OGG формат - дополнительные параметры не нужны")
             pass
 
-        print(f"STT Request URL: {url}")
-        print(f"STT Request Params: {params}")
-        print(f"STT Request Headers: {json.dumps(stt_headers, default=str)}")
-        print(f"STT Audio Content-Type: {content_type}")
-        print(f"STT Audio size: {len(audio_bytes)} bytes")
+        # Заголовки не логируем: в них токен доступа
+        logger.debug("STT request", extra={"url": url, "params": params, "request_id": req_uid})
         
         try:
             # Отправляем аудио напрямую в теле запроса, как в примере из документации
             response = requests.post(url, headers=stt_headers, params=params, data=audio_bytes, verify=False)
-            print(f"STT Response status: {response.status_code}")
+            logger.debug("STT response", extra={"status": response.status_code, "request_id": req_uid})
             
             if response.status_code == 200:
                 result = response.json()
-                print(f"STT Raw Response: {json.dumps(result, ensure_ascii=False)}")
                 
                 # Обработка ответа согласно документации API v1
                 # Пример успешного ответа: {"result": ["текст 1", "текст 2"], "status": 200}
                 if result and isinstance(result, dict) and 'result' in result and result['result']:
                     # Объединяем все предложения в одну строку
                     transcription = ' '.join(result['result'])
-                    print(f"STT Transcription: {transcription}")
+                    logger.debug("STT transcription", extra={"chars": len(transcription), "request_id": req_uid})
                     return transcription
                 else:
-                    print(f"STT: Не удалось извлечь транскрипцию из ответа. Ответ: {result}")
+                    logger.warning("STT: не удалось извлечь транскрипцию из ответа", extra={"response": result})
                     # Возвращаем пустую строку, если ответ успешен, но не содержит текста
                     return ""
             else:
-                print(f"Ошибка STT SaluteSpeech: {response.status_code}")
-                error_text = response.text
-                print(f"STT Error Response Text: {error_text}")
-                try:
-                    error_details = response.json()
-                    print(f"STT Error Details (JSON): {json.dumps(error_details, ensure_ascii=False)}")
-                except json.JSONDecodeError:
-                    print("STT Error response is not valid JSON.")
+                logger.error(
+                    "Ошибка STT SaluteSpeech",
+                    extra={"status": response.status_code, "response": response.text[:1000], "request_id": req_uid},
+                )
                 # Возвращаем None, чтобы обозначить ошибку запроса к API
                 return None
         except requests.exceptions.RequestException as e:
-            print(f"Исключение при запросе STT SaluteSpeech (requests.exceptions.RequestException): {e}")
+            logger.error("Исключение при запросе STT SaluteSpeech: %s", e, extra={"request_id": req_uid})
             return None
         except Exception as e:
-            print(f"Общее исключение при STT SaluteSpeech: {e}")
+            logger.exception("Общее исключение при STT SaluteSpeech", extra={"request_id": req_uid})
             return None
 
     def synthesize(self, text: str, voice: str = DEFAULT_VOICE, audio_format: str = "opus") -> Optional[str]:
@@ -207,12 +196,12 @@ class SaluteSpeechClient:
             Base64 аудио-контента (в формате ogg/opus или pcm) или None при ошибке.
         """
         if not self.ensure_valid_token():
-            print("Ошибка аутентификации SaluteSpeech для TTS. Проверьте учетные данные и доступность API.")
+            logger.error("Ошибка аутентификации SaluteSpeech для TTS. Проверьте учетные данные и доступность API")
             return None
         
         # Проверяем, что запрошенный голос поддерживается API
         if voice not in SALUTE_SPEECH_VOICES:
-            print(f"Предупреждение: голос '{voice}' не поддерживается SaluteSpeech API. Используем голос по умолчанию '{DEFAULT_VOICE}'")
+            logger.warning("Голос не поддерживается SaluteSpeech API, используем голос по умолчанию", extra={"voice": voice, "default_voice": DEFAULT_VOICE})
             voice = DEFAULT_VOICE
         
         # TTS URL для API v1
@@ -240,10 +229,8 @@ class SaluteSpeechClient:
         if audio_format.upper() == "PCM":
             params["sample_rate_hertz"] = "22050"  # Добавляем частоту дискретизации как параметр
 
-        print(f"TTS Request URL: {url}")
-        print(f"TTS Request Headers: {json.dumps(tts_headers, default=str)}")
-        print(f"TTS Request Params: {params}")
-        print(f"TTS Request Text: {text[:50]}..." if len(text) > 50 else text)
+        # Заголовки не логируем: в них токен доступа
+        logger.debug("TTS request", extra={"url": url, "params": params, "chars": len(text), "request_id": req_uid})
 
         try:
             # Отправляем текст напрямую, без обертки в JSON
@@ -254,31 +241,24 @@ class SaluteSpeechClient:
                 data=text,  # Текст отправляется как есть
                 verify=False
             )
-            print(f"TTS Response status: {response.status_code}")
+            logger.debug("TTS response", extra={"status": response.status_code, "request_id": req_uid})
 
             if response.status_code == 200:
                 # API для синтеза возвращает аудиопоток напрямую
                 # Content-Type ответа будет указывать на формат
-                response_content_type = response.headers.get('Content-Type', '')
-                print(f"TTS Response Content-Type: {response_content_type}")
-                
                 audio_bytes = response.content
                 audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-                print(f"TTS Audio synthesized, {len(audio_bytes)} bytes, base64 length: {len(audio_base64)}")
+                logger.debug("TTS audio synthesized", extra={"audio_bytes": len(audio_bytes), "content_type": response.headers.get("Content-Type", ""), "request_id": req_uid})
                 return audio_base64
             else:
-                print(f"Ошибка TTS SaluteSpeech: {response.status_code}")
-                error_text = response.text
-                print(f"TTS Error Response Text: {error_text}")
-                try:
-                    error_details = response.json()
-                    print(f"TTS Error Details (JSON): {json.dumps(error_details, ensure_ascii=False)}")
-                except json.JSONDecodeError:
-                    print("TTS Error response is not valid JSON.")
+                logger.error(
+                    "Ошибка TTS SaluteSpeech",
+                    extra={"status": response.status_code, "response": response.text[:1000], "request_id": req_uid},
+                )
                 return None
         except requests.exceptions.RequestException as e:
-            print(f"Исключение при запросе TTS SaluteSpeech (requests.exceptions.RequestException): {e}")
+            logger.error("Исключение при запросе TTS SaluteSpeech: %s", e, extra={"request_id": req_uid})
             return None
         except Exception as e:
-            print(f"Общее исключение при TTS SaluteSpeech: {e}")
+            logger.exception("Общее исключение при TTS SaluteSpeech", extra={"request_id": req_uid})
             return None 
\ No newline at end of file
@@ -0,0 +1,44 @@
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+# Поля ответов — совпадают со схемами Message / Chat в app.schemas.chat
+MESSAGE_FIELDS = ("id", "chat_id", "role", "content", "created_at", "is_voice")
+CHAT_FIELDS = ("id", "user_id", "title", "created_at", "updated_at")
+
+# attrgetter собирается один раз и достаёт все поля за один вызов;
+# работает и с ORM-объектами, и с Row из select(колонки)
+_get_message_fields = attrgetter(*MESSAGE_FIELDS)
+_get_chat_fields = attrgetter(*CHAT_FIELDS)
+
+
+def encode_message(message: Any) -> Dict[str, Any]:
+    return dict(zip(MESSAGE_FIELDS, _get_message_fields(message)))
+
+
+def encode_messages(messages: Iterable[Any]) -> List[Dict[str, Any]]:
+    return [dict(zip(MESSAGE_FIELDS, _get_message_fields(m))) for m in messages]
+
+
+def encode_chat(chat: Any) -> Dict[str, Any]:
+    return dict(zip(CHAT_FIELDS, _get_chat_fields(chat)))
+
+
+def dumps(obj: Any) -> bytes:
+    """orjson сам сериализует datetime в ISO 8601 (как ``isoformat()``)."""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_text(obj: Any) -> str:
+    """Для ``WebSocket.send_text``."""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def fast_response(content: Any, status_code: int = 200) -> ORJSONResponse:
+    """Готовый ответ: FastAPI не прогоняет его повторно через response_model.
+
+    ``content`` уже должен быть в форме схемы ответа (см. encode_*).
+    """
+    return ORJSONResponse(content, status_code=status_code)
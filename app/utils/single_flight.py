@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import Counter
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from app.utils.llm_memo import normalize
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+
+T = TypeVar("T")
+
+
+def flight_key(*parts) -> str:
+    """Ключ вызова по точному тексту частей (промпты модели).
+
+    Промпты не нормализуются: разные регистр, пробелы или пунктуация —
+    это разные промпты, и ответ одного не подходит другому.
+    """
+    return _hash("\x1f".join(str(part) for part in parts))
+
+
+def query_key(*parts) -> str:
+    """Ключ по коротким поисковым запросам новостного конвейера:
+    «Нефть » и «нефть» — один и тот же поиск."""
+    return _hash("\x1f".join(normalize(str(part)) for part in parts))
+
+
+def _hash(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class _Call:
+    """Вызов из потока: первый поток выполняет, остальные ждут event."""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class _Flight:
+    """Асинхронный вызов: задача живёт, пока её ждёт хотя бы один запрос."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """Поток токенов, который читают несколько запросов.
+
+    Токены накапливаются в ``chunks``: присоединившийся позже получает
+    ответ с начала, затем — новые токены по мере генерации.
+    """
+
+    __slots__ = ("chunks", "done", "error", "subscribers", "signal", "task")
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self.signal = asyncio.get_running_loop().create_future()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        signal, self.signal = self.signal, self.signal.get_loop().create_future()
+        signal.set_result(None)
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые вызовы в один.
+
+    Когда выходит громкая новость, десятки пользователей почти одновременно
+    спрашивают об одном и том же. Пока вызов с данным ключом выполняется,
+    повторные вызовы не идут в модель или поиск, а ждут его результат (или
+    ошибку). Результат не сохраняется после завершения — это задача
+    ``llm_memo`` и ``answer_cache``. Асинхронный вызов отменяется, только
+    когда его перестали ждать все запросы.
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self._counters: Counter = Counter()
+
+    def do(self, key: str, compute: Callable[[], T]) -> T:
+        """Блокирующий вариант — для кода, работающего в потоках."""
+        if not self.enabled:
+            return compute()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._counters["executed" if leader else "coalesced"] += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = compute()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key: str, compute: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await compute()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(compute()))
+            flight.task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+            self._count("executed")
+        else:
+            self._count("coalesced")
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Никто больше не ждёт (запросы отменены) — останавливаем вызов
+                self._forget(self._flights, key, flight)
+                flight.task.cancel()
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Потоковый вариант: все подписчики получают одни и те же токены."""
+        if not self.enabled:
+            async for chunk in factory():
+                yield chunk
+            return
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = self._streams[key] = _SharedStream(factory())
+            shared.task.add_done_callback(lambda _: self._forget(self._streams, key, shared))
+            self._count("executed")
+        else:
+            self._count("coalesced")
+        shared.subscribers += 1
+        try:
+            index = 0
+            while True:
+                if index < len(shared.chunks):
+                    yield shared.chunks[index]
+                    index += 1
+                elif shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                else:
+                    await asyncio.shield(shared.signal)
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done:
+                self._forget(self._streams, key, shared)
+                shared.task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight = len(self._calls) + len(self._flights) + len(self._streams)
+        return {"enabled": self.enabled, "in_flight": in_flight, **counters}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    @staticmethod
+    def _forget(registry: dict, key: str, entry):
+        # Удаляем только свою запись: под тем же ключом мог начаться новый вызов
+        if registry.get(key) is entry:
+            del registry[key]
+
+
+# Промпты модели (safe_model_invoke / safe_model_ainvoke / потоковые ответы)
+llm_flights = SingleFlight()
+# Новостной конвейер: сбор статей и news-агент
+news_flights = SingleFlight()
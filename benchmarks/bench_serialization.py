@@ -0,0 +1,85 @@
+"""Бенчмарк сериализации истории чата (10 000 сообщений).
+
+Сравнивает прежний путь (словари вручную + повторная валидация
+``List[MessageSchema]`` + json из FastAPI) с быстрым путём из
+``app.utils.serialization`` (attrgetter + orjson, без response_model).
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_serialization [--messages 10000] [--repeat 20]
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import app.database.init_db  # noqa: F401 — регистрирует модели в правильном порядке
+from app.models.chat import Message
+from app.schemas.chat import Message as MessageSchema
+from app.utils.serialization import dumps, encode_messages
+
+
+def make_history(count: int) -> List[Message]:
+    start = datetime(2024, 1, 1)
+    return [
+        Message(
+            id=i,
+            chat_id=1,
+            role="user" if i % 2 else "assistant",
+            content=f"Сообщение номер {i}. " * 20,
+            created_at=start + timedelta(seconds=i),
+            is_voice=0,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def legacy_path(messages: List[Message], adapter: TypeAdapter) -> bytes:
+    # Так get_messages работал раньше: словари руками, затем FastAPI
+    # валидирует их по response_model и кодирует стандартным json
+    result = [
+        {
+            "id": m.id,
+            "chat_id": m.chat_id,
+            "role": m.role,
+            "content": m.content,
+            "created_at": m.created_at.isoformat(),
+            "is_voice": m.is_voice,
+        }
+        for m in messages
+    ]
+    validated = adapter.validate_python(result)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def fast_path(messages: List[Message]) -> bytes:
+    return dumps(encode_messages(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = make_history(args.messages)
+    adapter = TypeAdapter(List[MessageSchema])
+
+    # Оба пути должны давать одинаковые данные
+    assert json.loads(legacy_path(messages, adapter)) == json.loads(fast_path(messages))
+
+    legacy = min(timeit.repeat(lambda: legacy_path(messages, adapter), number=1, repeat=args.repeat))
+    fast = min(timeit.repeat(lambda: fast_path(messages), number=1, repeat=args.repeat))
+
+    print(f"messages: {args.messages}")
+    print(f"legacy (dict + response_model + json): {legacy * 1000:8.2f} ms")
+    print(f"fast   (attrgetter + orjson):          {fast * 1000:8.2f} ms")
+    print(f"speedup: x{legacy / fast:.1f}")
+
+
+if __name__ == "__main__":
+    main()
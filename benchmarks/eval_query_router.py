@@ -0,0 +1,112 @@
+"""Офлайн-оценка локального классификатора news/chat (``app.utils.query_router``).
+
+Считает k-fold кросс-валидацию на размеченных примерах из
+``app.utils.query_intents``: точность лучшей догадки, долю запросов, на
+которых классификатор уверен (ровно столько вызовов LLM экономится), и
+точность на уверенных решениях. Дополнительный размеченный набор
+(``--file``, строки вида ``news<TAB>текст``) проверяется на модели,
+обученной на всех примерах.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.eval_query_router [--folds 5] [--threshold 0.85] [--file labelled.tsv]
+"""
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+from app.utils.query_router import QUERY_ROUTER_THRESHOLD, QueryRouter, SOURCE_RULE, seed_examples
+
+
+def evaluate(router: QueryRouter, examples: List[Tuple[str, str]]) -> dict:
+    correct = confident = confident_correct = rules = 0
+    errors = []
+    started = time.perf_counter()
+    for text, label in examples:
+        decision = router.classify(text)
+        correct += decision.label == label
+        if decision.source == SOURCE_RULE:
+            rules += 1
+        if router.confident(decision):
+            confident += 1
+            if decision.label == label:
+                confident_correct += 1
+            else:
+                errors.append((text, label, decision))
+    elapsed = time.perf_counter() - started
+    return {
+        "total": len(examples),
+        "correct": correct,
+        "confident": confident,
+        "confident_correct": confident_correct,
+        "rules": rules,
+        "errors": errors,
+        "us_per_query": elapsed / max(1, len(examples)) * 1e6,
+    }
+
+
+def merge(results: List[dict]) -> dict:
+    merged = {key: sum(result[key] for result in results) for key in ("total", "correct", "confident",
+                                                                      "confident_correct", "rules")}
+    merged["errors"] = [error for result in results for error in result["errors"]]
+    merged["us_per_query"] = sum(result["us_per_query"] for result in results) / len(results)
+    return merged
+
+
+def cross_validate(examples: List[Tuple[str, str]], folds: int, threshold: float, seed: int) -> dict:
+    shuffled = examples[:]
+    random.Random(seed).shuffle(shuffled)
+    results = []
+    for fold in range(folds):
+        test = shuffled[fold::folds]
+        train = [example for i, example in enumerate(shuffled) if i % folds != fold]
+        results.append(evaluate(QueryRouter(train, threshold), test))
+    return merge(results)
+
+
+def load_labelled(path: str) -> List[Tuple[str, str]]:
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            label, _, text = line.rstrip("\n").partition("\t")
+            if label in ("news", "chat") and text:
+                examples.append((text, label))
+    return examples
+
+
+def report(title: str, result: dict, show_errors: bool):
+    total = result["total"]
+    confident = result["confident"]
+    print(f"{title}: {total} запросов")
+    print(f"  точность лучшей догадки:   {result['correct'] / total:.1%}")
+    print(f"  уверенных решений:         {confident / total:.1%} (столько вызовов LLM экономится)")
+    if confident:
+        print(f"  точность уверенных:        {result['confident_correct'] / confident:.1%}")
+    print(f"  решено правилами:          {result['rules'] / total:.1%}")
+    print(f"  время классификации:       {result['us_per_query']:.1f} мкс/запрос")
+    if show_errors:
+        for text, label, decision in result["errors"]:
+            print(f"  ошибка: {text!r} ожидалось {label}, получено {decision}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=QUERY_ROUTER_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--file", help="дополнительный размеченный набор: news|chat<TAB>текст")
+    parser.add_argument("--errors", action="store_true", help="показать уверенные ошибки")
+    args = parser.parse_args()
+
+    examples = seed_examples()
+    report(f"Кросс-валидация ({args.folds} фолдов, порог {args.threshold})",
+           cross_validate(examples, args.folds, args.threshold, args.seed), args.errors)
+
+    if args.file:
+        router = QueryRouter(examples, args.threshold)
+        report(f"Отложенный набор {args.file}", evaluate(router, load_labelled(args.file)), args.errors)
+
+
+if __name__ == "__main__":
+    main()
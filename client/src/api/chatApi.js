@@ -2,35 +2,33 @@ import axios from 'axios';
 import axiosInstance from '../utils/axiosConfig';
 
 // Функции для работы с чатами
+
+// Список чатов отдаётся страницами: { chats, next_cursor }
+const CHATS_PAGE_SIZE = 200;
+
 export const getAllChats = async () => {
   try {
     console.log('Sending request to get all chats...');
-    const response = await axiosInstance.get('/chat/');
-    console.log('Received chats response:', response);
-
-    // API возвращает объект с полем chats, которое содержит массив чатов
-    if (response.data && response.data.chats) {
-      console.log('Retrieved chats:', response.data.chats);
-      return response.data.chats;
-    } else if (Array.isArray(response.data)) {
-      // Если API возвращает массив напрямую, используем его
-      console.log('API returned array directly:', response.data);
-      return response.data;
-    } else if (typeof response.data === 'object') {
-      // Пытаемся найти массив в ответе
-      const possibleChatsArrays = Object.values(response.data).filter(val => Array.isArray(val));
-      if (possibleChatsArrays.length > 0) {
-        console.log('Found possible chats array in response:', possibleChatsArrays[0]);
-        return possibleChatsArrays[0];
+    const chats = [];
+    let cursor = null;
+    do {
+      const params = { limit: CHATS_PAGE_SIZE };
+      if (cursor) {
+        params.cursor = cursor;
       }
+      const response = await axiosInstance.get('/chat/', { params });
+      console.log('Received chats response:', response);
 
-      // Если не нашли массив, превращаем объект в массив
-      console.log('Transforming object to array:', response.data);
-      return [response.data];
-    } else {
-      console.error('Unexpected API response format:', response.data);
-      return [];
-    }
+      if (!response.data || !Array.isArray(response.data.chats)) {
+        console.error('Unexpected API response format:', response.data);
+        break;
+      }
+      chats.push(...response.data.chats);
+      cursor = response.data.next_cursor;
+    } while (cursor);
+
+    console.log('Retrieved chats:', chats);
+    return chats;
   } catch (error) {
     console.error('Error fetching chats:', error);
     // Добавим информацию о конфигурации запроса
@@ -70,10 +68,21 @@ export const createChat = async (title = 'Новый чат') => {
   }
 };
 
-export const getChatMessages = async (chatId) => {
+// Сервер отдаёт историю страницами (по умолчанию — последние 50 сообщений).
+// before=<id самого старого загруженного> возвращает более ранние сообщения
+export const MESSAGES_PAGE_SIZE = 50;
+
+export const getChatMessages = async (chatId, { before, after, limit = MESSAGES_PAGE_SIZE } = {}) => {
   try {
-    console.log(`Fetching messages for chat ${chatId}...`);
-    const response = await axiosInstance.get(`/chat/${chatId}/messages`);
+    console.log(`Fetching messages for chat ${chatId}...`, { before, after, limit });
+    const params = { limit };
+    if (before !== undefined && before !== null) {
+      params.before = before;
+    }
+    if (after !== undefined && after !== null) {
+      params.after = after;
+    }
+    const response = await axiosInstance.get(`/chat/${chatId}/messages`, { params });
 
     // Проверка ответа
     if (!response.data) {
@@ -151,8 +160,11 @@ export const synthesizeSpeech = async (text) => {
   }
 };
 
-// Установка WebSocket соединения
-export const connectWebSocket = (chatId, onMessage) => {
+// Установка WebSocket соединения.
+// getLastMessageId возвращает id последнего известного клиенту сообщения:
+// после обрыва соединение восстанавливается, и сервер досылает только
+// более новые сообщения и недогенерированный ответ
+export const connectWebSocket = (chatId, onMessage, getLastMessageId = () => null) => {
   const accessToken = localStorage.getItem('accessToken');
   if (!accessToken) {
     throw new Error('Authentication required');
@@ -162,55 +174,93 @@ export const connectWebSocket = (chatId, onMessage) => {
   const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
   const host = 'localhost:8080'; // Используем тот же хост, что и для HTTP запросов
 
-  // Передаем токен как query параметр для WebSocket
-  const wsUrl = `${protocol}//${host}/chat/ws/${chatId}?token=${accessToken}`;
-  console.log('Connecting to WebSocket:', wsUrl);
+  let ws = null;
+  let closedByClient = false;
+  let reconnectDelay = 1000;
 
-  const ws = new WebSocket(wsUrl);
+  const open = (resume) => {
+    // Передаем токен как query параметр для WebSocket
+    let wsUrl = `${protocol}//${host}/chat/ws/${chatId}?token=${accessToken}`;
+    const lastMessageId = resume ? getLastMessageId() : null;
+    if (lastMessageId !== null && lastMessageId !== undefined) {
+      wsUrl += `&last_message_id=${lastMessageId}`;
+    }
+    console.log('Connecting to WebSocket:', wsUrl);
 
-  ws.onopen = () => {
-    console.log(`WebSocket connection established for chat ${chatId}`);
-  };
+    ws = new WebSocket(wsUrl);
 
-  ws.onmessage = (event) => {
-    console.log('WebSocket message received:', event.data);
-    try {
-      const data = JSON.parse(event.data);
-      onMessage(data);
-    } catch (e) {
-      console.error('Error parsing WebSocket message:', e);
-    }
-  };
+    ws.onopen = () => {
+      console.log(`WebSocket connection established for chat ${chatId}`);
+      reconnectDelay = 1000;
+    };
 
-  ws.onerror = (error) => {
-    console.error('WebSocket error:', error);
-  };
+    ws.onmessage = (event) => {
+      console.log('WebSocket message received:', event.data);
+      try {
+        const data = JSON.parse(event.data);
+        onMessage(data);
+      } catch (e) {
+        console.error('Error parsing WebSocket message:', e);
+      }
+    };
+
+    ws.onerror = (error) => {
+      console.error('WebSocket error:', error);
+    };
 
-  ws.onclose = (event) => {
-    console.log(`WebSocket connection closed for chat ${chatId}, code: ${event.code}, reason: ${event.reason}`);
+    ws.onclose = (event) => {
+      console.log(`WebSocket connection closed for chat ${chatId}, code: ${event.code}, reason: ${event.reason}`);
+      // 1008 — ошибка авторизации, переподключаться бессмысленно
+      if (closedByClient || event.code === 1000 || event.code === 1008) {
+        return;
+      }
+      setTimeout(() => {
+        if (!closedByClient) {
+          open(true);
+        }
+      }, reconnectDelay);
+      reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+    };
   };
 
+  open(false);
+
+  // Каждый запрос получает свой id: ответы на несколько запросов
+  // могут приходить одновременно
+  let nextRequestId = 1;
+
   return {
     send: (content, isVoice = 0) => {
       if (!content || !content.trim()) {
         console.warn('Attempted to send empty message');
-        return;
+        return null;
       }
 
       try {
+        const requestId = `r${nextRequestId++}`;
         const message = JSON.stringify({
           content,
           is_voice: isVoice,
+          request_id: requestId,
           timestamp: new Date().toISOString()
         });
         console.log('Sending WebSocket message:', message);
         ws.send(message);
+        return requestId;
       } catch (e) {
         console.error('Error sending message via WebSocket:', e);
         throw e;
       }
     },
+    cancel: (requestId) => {
+      try {
+        ws.send(JSON.stringify({ type: 'cancel', request_id: requestId }));
+      } catch (e) {
+        console.error('Error cancelling request via WebSocket:', e);
+      }
+    },
     close: () => {
+      closedByClient = true;
       try {
         ws.close();
       } catch (e) {
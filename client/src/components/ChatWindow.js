@@ -1,10 +1,15 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { getChat, getChatMessages, sendMessage, connectWebSocket } from '../api/chatApi';
+import { getChat, getChatMessages, sendMessage, connectWebSocket, MESSAGES_PAGE_SIZE } from '../api/chatApi';
 import styled from 'styled-components';
 import VoiceRecorder from './VoiceRecorder';
 import ReactMarkdown from 'react-markdown';
 import { FiSend, FiVolume2, FiVolumeX } from 'react-icons/fi';
 
+// id черновика ответа, который собирается из потоковых delta-кадров;
+// у каждого запроса свой черновик
+const STREAMING_ID = 'streaming';
+const draftId = (requestId) => `${STREAMING_ID}-${requestId}`;
+
 const ChatWindow = ({ chatId, onBack }) => {
   const [chat, setChat] = useState(null);
   const [messages, setMessages] = useState([]);
@@ -14,6 +19,13 @@ const ChatWindow = ({ chatId, onBack }) => {
   const [wsConnection, setWsConnection] = useState(null);
   const [textToSpeechEnabled, setTextToSpeechEnabled] = useState(true);
   const messagesEndRef = useRef(null);
+  // id последнего сохранённого сообщения — с него WebSocket продолжает после обрыва
+  const lastMessageIdRef = useRef(null);
+  // Есть ли на сервере сообщения старше загруженных (история грузится страницами)
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  // Подгрузка старых сообщений не должна прокручивать чат вниз
+  const skipScrollRef = useRef(false);
 
   // Загрузка чата и сообщений
   useEffect(() => {
@@ -26,6 +38,7 @@ const ChatWindow = ({ chatId, onBack }) => {
         // Получаем сохраненные сообщения
         const messagesData = await getChatMessages(chatId);
         console.log('Received messages from server:', messagesData);
+        setHasOlder(Array.isArray(messagesData) && messagesData.length === MESSAGES_PAGE_SIZE);
 
         // Если messagesData - это массив, используем его,
         // в противном случае создаем пустой массив
@@ -74,9 +87,65 @@ const ChatWindow = ({ chatId, onBack }) => {
 
   // Обработка сообщений от WebSocket
   const handleWebSocketMessage = async (data) => {
+    // Досылка после переподключения: добавляем пропущенное, дубли по id отбрасываем
+    if (data.type === 'message' || data.type === 'start') {
+      const saved = data.type === 'message' ? data : data.user_message;
+      setMessages((prevMessages) => {
+        if (prevMessages.some((msg) => msg.id === saved.id)) {
+          return prevMessages;
+        }
+        // Оптимистичная копия своего сообщения заменяется сохранённой
+        const temp = prevMessages.find((msg) =>
+          String(msg.id).startsWith('temp-') && msg.role === saved.role && msg.content === saved.content
+        );
+        const rest = temp ? prevMessages.filter((msg) => msg !== temp) : prevMessages;
+        const { type, ...message } = saved;
+        return [...rest, message];
+      });
+      return;
+    }
+
+    // Пропущено слишком много — перечитываем историю целиком
+    if (data.type === 'resync') {
+      const messagesData = await getChatMessages(chatId);
+      if (Array.isArray(messagesData)) {
+        setMessages(messagesData);
+        setHasOlder(messagesData.length === MESSAGES_PAGE_SIZE);
+      }
+      return;
+    }
+
+    // Потоковый ответ: дописываем токены в черновик
+    if (data.type === 'delta') {
+      const id = draftId(data.request_id);
+      setMessages((prevMessages) => {
+        if (prevMessages.some((msg) => msg.id === id)) {
+          return prevMessages.map((msg) => (msg.id === id ? { ...msg, content: msg.content + data.content } : msg));
+        }
+        return [
+          ...prevMessages,
+          {
+            id,
+            role: 'assistant',
+            content: data.content,
+            created_at: new Date().toISOString(),
+            is_voice: 0
+          }
+        ];
+      });
+      return;
+    }
+
+    // Сервер отменил частичный ответ (начнёт новый вариант или запрос отменён)
+    if (data.type === 'reset' || data.type === 'cancelled') {
+      setMessages((prevMessages) => prevMessages.filter((msg) => msg.id !== draftId(data.request_id)));
+      return;
+    }
+
     if (data.role === 'assistant') {
+      // Финальный кадр заменяет черновик сохранённым сообщением
       setMessages((prevMessages) => [
-        ...prevMessages,
+        ...prevMessages.filter((msg) => msg.id !== draftId(data.request_id) && msg.id !== data.id),
         {
           id: data.id,
           role: data.role,
@@ -164,7 +233,7 @@ const ChatWindow = ({ chatId, onBack }) => {
   useEffect(() => {
     if (chatId && !wsConnection) {
       try {
-        const ws = connectWebSocket(chatId, handleWebSocketMessage);
+        const ws = connectWebSocket(chatId, handleWebSocketMessage, () => lastMessageIdRef.current);
         setWsConnection(ws);
       } catch (err) {
         console.error('Error connecting to WebSocket:', err);
@@ -172,11 +241,44 @@ const ChatWindow = ({ chatId, onBack }) => {
     }
   }, [chatId, wsConnection]);
 
+  useEffect(() => {
+    const ids = messages.map((msg) => msg.id).filter((id) => Number.isInteger(id));
+    if (ids.length > 0) {
+      lastMessageIdRef.current = Math.max(...ids);
+    }
+  }, [messages]);
+
   // Прокрутка к последнему сообщению
   useEffect(() => {
+    if (skipScrollRef.current) {
+      skipScrollRef.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages]);
 
+  // Подгрузка более ранней страницы истории: before = id самого старого сообщения
+  const loadOlderMessages = async () => {
+    const ids = messages.map((msg) => msg.id).filter((id) => Number.isInteger(id));
+    if (loadingOlder || ids.length === 0) {
+      return;
+    }
+    setLoadingOlder(true);
+    try {
+      const olderMessages = await getChatMessages(chatId, { before: Math.min(...ids) });
+      setHasOlder(olderMessages.length === MESSAGES_PAGE_SIZE);
+      if (olderMessages.length > 0) {
+        skipScrollRef.current = true;
+        setMessages((prevMessages) => {
+          const known = new Set(prevMessages.map((msg) => msg.id));
+          return [...olderMessages.filter((msg) => !known.has(msg.id)), ...prevMessages];
+        });
+      }
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
@@ -342,7 +444,13 @@ const ChatWindow = ({ chatId, onBack }) => {
             </WelcomeSuggestions>
           </WelcomeMessage>
         ) : (
-          messages.map((message) => (
+          <>
+          {hasOlder && (
+            <LoadOlderButton onClick={loadOlderMessages} disabled={loadingOlder}>
+              {loadingOlder ? 'Загрузка...' : 'Показать предыдущие сообщения'}
+            </LoadOlderButton>
+          )}
+          {messages.map((message) => (
             <MessageBubble key={message.id} role={message.role}>
               <MessageContent>
                 {message.role === 'assistant' ? (
@@ -365,7 +473,8 @@ const ChatWindow = ({ chatId, onBack }) => {
                 )}
               </MessageContent>
             </MessageBubble>
-          ))
+          ))}
+          </>
         )}
         <div ref={messagesEndRef} />
       </MessagesContainer>
@@ -462,6 +571,22 @@ const MessagesContainer = styled.div`
   `}
 `;
 
+const LoadOlderButton = styled.button`
+  align-self: center;
+  margin-bottom: 1rem;
+  padding: 0.5rem 1rem;
+  background: none;
+  border: 1px solid var(--primary-color);
+  border-radius: 4px;
+  color: var(--primary-color);
+  cursor: pointer;
+
+  &:disabled {
+    opacity: 0.6;
+    cursor: default;
+  }
+`;
+
 const MessageBubble = styled.div`
   max-width: 70%;
   padding: 0.75rem 1rem;
@@ -1,3 +1,4 @@
+import logging
 import os
 import uuid
 import requests
@@ -7,27 +8,28 @@ from dotenv import load_dotenv
 # Загрузка переменных из .env файла
 load_dotenv()
 
-def get_access_token():
+OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+
+logger = logging.getLogger(__name__)
+
+def _token_request(auth_token=None):
     """
-    Получает access_token от API GigaChat, используя учетные данные из .env файла
-    
+    Собирает заголовки и тело запроса токена
+
     Returns:
-        str или dict: Токен доступа в формате JWT или словарь с токеном и временем истечения, 
-                      None в случае ошибки
+        tuple или None: (headers, payload), None если учетные данные не найдены
     """
     # Получаем учетные данные из .env
-    auth_token = os.getenv("GIGACHAT_AUTH_TOKEN")
+    auth_token = auth_token or os.getenv("GIGACHAT_AUTH_TOKEN")
     
     # Если в .env не найдены необходимые данные
     if not auth_token:
-        print("ОШИБКА: GIGACHAT_AUTH_TOKEN не найден в файле .env")
+        logger.error("GIGACHAT_AUTH_TOKEN is not set")
         return None
     
     # Генерируем уникальный идентификатор запроса
     rq_uid = os.getenv("RqUID", str(uuid.uuid4()))
     
-    url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-    
     payload = {
         'scope': 'GIGACHAT_API_PERS'
     }
@@ -38,29 +40,65 @@ def get_access_token():
         'RqUID': rq_uid,
         'Authorization': f'Basic {auth_token}'
     }
+    return headers, payload
+
+def _parse_token_response(status_code, token_data, text):
+    # Проверяем успешность запроса
+    if status_code == 200:
+        access_token = token_data.get('access_token')
+        expires_in = token_data.get('expires_in', 1800)  # По умолчанию 30 минут (1800 секунд)
+        
+        logger.info("GigaChat token received", extra={"expires_in": expires_in})
+        
+        # Возвращаем полную информацию о токене
+        return {
+            'access_token': access_token,
+            'expires_in': expires_in
+        }
+    logger.warning("GigaChat token request failed: %s %s", status_code, (text or "")[:200])
+    return None
+
+def get_access_token(auth_token=None, session=None):
+    """
+    Получает access_token от API GigaChat, используя учетные данные из .env файла
+    
+    Args:
+        auth_token (str): Учетные данные Basic; по умолчанию GIGACHAT_AUTH_TOKEN
+        session (requests.Session): Сессия с keep-alive; по умолчанию новое соединение
+
+    Returns:
+        str или dict: Токен доступа в формате JWT или словарь с токеном и временем истечения, 
+                      None в случае ошибки
+    """
+    request = _token_request(auth_token)
+    if request is None:
+        return None
+    headers, payload = request
     
     try:
-        response = requests.post(url, headers=headers, data=payload, verify=False)
-        
-        # Проверяем успешность запроса
-        if response.status_code == 200:
-            token_data = response.json()
-            access_token = token_data.get('access_token')
-            expires_in = token_data.get('expires_in', 1800)  # По умолчанию 30 минут (1800 секунд)
-            
-            print(f"Токен получен успешно. Срок действия: {expires_in} секунд")
-            
-            # Возвращаем полную информацию о токене
-            return {
-                'access_token': access_token,
-                'expires_in': expires_in
-            }
-        else:
-            print(f"Ошибка получения токена. Код: {response.status_code}")
-            print(f"Ответ: {response.text}")
-            return None
-    except Exception as e:
-        print(f"Исключение при запросе токена: {str(e)}")
+        response = (session or requests).post(OAUTH_URL, headers=headers, data=payload, verify=False)
+        token_data = response.json() if response.status_code == 200 else None
+        return _parse_token_response(response.status_code, token_data, response.text)
+    except Exception:
+        logger.exception("GigaChat token request error")
+        return None
+
+async def aget_access_token(client, auth_token=None):
+    """
+    Асинхронный вариант get_access_token через переданный httpx.AsyncClient
+    (соединения берутся из его пула)
+    """
+    request = _token_request(auth_token)
+    if request is None:
+        return None
+    headers, payload = request
+    
+    try:
+        response = await client.post(OAUTH_URL, headers=headers, data=payload)
+        token_data = response.json() if response.status_code == 200 else None
+        return _parse_token_response(response.status_code, token_data, response.text)
+    except Exception:
+        logger.exception("GigaChat token request error")
         return None
 
 if __name__ == "__main__":
@@ -1,10 +1,14 @@
+import asyncio
+import logging
 import os
 import requests
 import json
 import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from gigachat_auth import get_access_token
+from gigachat_auth import aget_access_token, get_access_token
+
+import httpx
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -21,6 +25,8 @@ class GigaChatClient:
             'Content-Type': 'application/json',
             'Accept': 'application/json'
         }
+        # Keep-alive: TLS-рукопожатие один раз, а не на каждый запрос
+        self.session = requests.Session()
     
     def authenticate(self):
         """
@@ -30,7 +36,7 @@ class GigaChatClient:
             bool: True, если аутентификация успешна, иначе False
         """
         # Запрашиваем новый токен
-        token_info = get_access_token()
+        token_info = get_access_token(session=self.session)
         
         if token_info:
             # Извлекаем токен и время истечения
@@ -92,7 +98,7 @@ class GigaChatClient:
         }
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 url, 
                 headers=self.headers, 
                 data=json.dumps(payload),
@@ -123,6 +129,194 @@ class GigaChatClient:
             print(f"Исключение при запросе к API: {str(e)}")
             return None
 
+BASE_URL = "https://gigachat.devices.sberbank.ru/api/v1"
+
+# Пул соединений асинхронного клиента: одновременные запросы к модели
+# ограничены числом сокетов, а не потоков
+GIGACHAT_MAX_CONNECTIONS = int(os.getenv("GIGACHAT_MAX_CONNECTIONS", "20"))
+GIGACHAT_MAX_KEEPALIVE = int(os.getenv("GIGACHAT_MAX_KEEPALIVE", "10"))
+GIGACHAT_KEEPALIVE_EXPIRY = float(os.getenv("GIGACHAT_KEEPALIVE_EXPIRY", "60"))
+# Таймауты (секунды): установка соединения, ожидание ответа модели, ожидание свободного сокета
+GIGACHAT_CONNECT_TIMEOUT = float(os.getenv("GIGACHAT_CONNECT_TIMEOUT", "10"))
+GIGACHAT_READ_TIMEOUT = float(os.getenv("GIGACHAT_READ_TIMEOUT", "120"))
+GIGACHAT_POOL_TIMEOUT = float(os.getenv("GIGACHAT_POOL_TIMEOUT", "30"))
+# HTTP/2 мультиплексирует запросы в одном соединении (нужен пакет h2)
+GIGACHAT_HTTP2 = os.getenv("GIGACHAT_HTTP2", "1") == "1"
+GIGACHAT_MODEL = os.getenv("GIGACHAT_MODEL", "GigaChat")
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class AsyncGigaChatClient:
+    """
+    Асинхронный клиент GigaChat поверх пула соединений httpx.
+
+    Один httpx.AsyncClient на процесс: соединения переиспользуются
+    (keep-alive, при наличии h2 — HTTP/2), токен обновляется одним
+    запросом, даже если его ждут несколько корутин.
+    """
+
+    def __init__(self, credentials=None, model=GIGACHAT_MODEL, base_url=BASE_URL):
+        self.credentials = credentials
+        self.model = model
+        self.base_url = base_url
+        self.access_token = None
+        self.token_expires_at = 0.0
+        self._client = None
+        self._token_lock = None
+
+    def _http(self):
+        # Создаём лениво: клиент и lock привязываются к работающему event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=GIGACHAT_HTTP2 and _http2_available(),
+                verify=False,
+                limits=httpx.Limits(
+                    max_connections=GIGACHAT_MAX_CONNECTIONS,
+                    max_keepalive_connections=GIGACHAT_MAX_KEEPALIVE,
+                    keepalive_expiry=GIGACHAT_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    GIGACHAT_READ_TIMEOUT,
+                    connect=GIGACHAT_CONNECT_TIMEOUT,
+                    pool=GIGACHAT_POOL_TIMEOUT,
+                ),
+            )
+            self._token_lock = asyncio.Lock()
+        return self._client
+
+    async def _token(self, rejected=None):
+        """Действующий токен; ``rejected`` — токен, который API отклонил (401)."""
+        client = self._http()
+        async with self._token_lock:
+            # Если токен уже обновила другая корутина, повторно не запрашиваем
+            stale = rejected is not None and self.access_token == rejected
+            if stale or not self.access_token or time.monotonic() >= self.token_expires_at:
+                token_info = await aget_access_token(client, self.credentials)
+                if not token_info:
+                    self.access_token = None
+                    return None
+                expires_in = token_info['expires_in']
+                # Запас как в синхронном клиенте: 10% срока, но не больше 5 минут
+                buffer_time = min(300, expires_in * 0.1)
+                self.access_token = token_info['access_token']
+                self.token_expires_at = time.monotonic() + expires_in - buffer_time
+            return self.access_token
+
+    async def chat_completion(self, messages, temperature=0.7, max_tokens=1024):
+        """
+        Асинхронный аналог GigaChatClient.chat_completion
+
+        Returns:
+            dict: Ответ API или None в случае ошибки
+        """
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        token = await self._token()
+        if token is None:
+            logger.warning("GigaChat authentication failed")
+            return None
+        try:
+            for attempt in range(2):
+                response = await self._http().post(
+                    f"{self.base_url}/chat/completions",
+                    headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+                    json=payload,
+                )
+                # Токен отозван раньше срока — обновляем один раз и повторяем
+                if response.status_code == 401 and attempt == 0:
+                    token = await self._token(rejected=token)
+                    if token is None:
+                        return None
+                    continue
+                if response.status_code != 200:
+                    logger.warning("GigaChat request failed: %s %s", response.status_code, response.text[:200])
+                    return None
+                return response.json()
+        except httpx.HTTPError as e:
+            logger.warning("GigaChat request error: %r", e)
+            return None
+
+    async def complete(self, prompt, temperature=0.7, max_tokens=1024):
+        """Текст ответа модели на один промпт или список сообщений {role, content}; None при ошибке."""
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        response = await self.chat_completion(messages, temperature, max_tokens)
+        try:
+            return response['choices'][0]['message']['content']
+        except (TypeError, KeyError, IndexError):
+            return None
+
+    async def stream(self, prompt, temperature=0.7, max_tokens=1024):
+        """
+        Ответ модели по частям (``"stream": true``, события SSE) на промпт
+        или список сообщений {role, content}.
+
+        Отдаёт непустые фрагменты текста; при ошибке поток просто
+        завершается (ошибка пишется в лог).
+        """
+        messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        token = await self._token()
+        if token is None:
+            logger.warning("GigaChat authentication failed")
+            return
+        try:
+            for attempt in range(2):
+                async with self._http().stream(
+                    "POST",
+                    f"{self.base_url}/chat/completions",
+                    headers={"Authorization": f"Bearer {token}", "Accept": "text/event-stream"},
+                    json=payload,
+                ) as response:
+                    # Токен отозван раньше срока — обновляем один раз и повторяем
+                    if response.status_code == 401 and attempt == 0:
+                        token = await self._token(rejected=token)
+                        if token is None:
+                            return
+                        continue
+                    if response.status_code != 200:
+                        await response.aread()
+                        logger.warning("GigaChat stream failed: %s %s", response.status_code, response.text[:200])
+                        return
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            return
+                        try:
+                            content = json.loads(data)['choices'][0]['delta'].get('content')
+                        except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+                            continue
+                        if content:
+                            yield content
+                    return
+        except httpx.HTTPError as e:
+            logger.warning("GigaChat stream error: %r", e)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
 # Пример использования
 if __name__ == "__main__":
     # Отключаем предупреждения о неверных SSL-сертификатах
@@ -7,10 +7,25 @@ from datetime import datetime
 
 from app.routers import auth, chat, voice
 from app.database.init_db import create_tables
+from app.database.message_writer import message_writer
+from app.utils.answer_cache import answer_cache
+from app.utils.broker import broker
+from app.utils.chat_memory import chat_memory
+from app.utils.llm_memo import llm_memo
+from app.utils.llm_scheduler import llm_scheduler
+from app.utils.single_flight import llm_flights, news_flights
+from app.utils.password_hasher import password_hasher
+from app.utils.query_router import query_router
+from app.utils.rate_limit import RateLimitMiddleware, rate_limiter
+from app.utils.logging_setup import setup_logging, shutdown_logging
+from new_agent.main import aclose_model_clients
 
 # Загружаем переменные из .env
 load_dotenv()
 
+# Логи пишутся в stderr фоновым потоком через очередь
+setup_logging()
+
 # Проверка API ключей
 print(f"ENV vars loaded: GIGACHAT_AUTH_TOKEN present: {'GIGACHAT_AUTH_TOKEN' in os.environ}")
 print(f"SERVER SETUP: Running on host 0.0.0.0, port 8080")
@@ -19,6 +34,9 @@ print(f"Included routers: auth, chat, voice")
 
 app = FastAPI(title="AI Assistant API")
 
+# Лимиты запросов добавляются раньше CORS, чтобы ответ 429 тоже получал CORS-заголовки
+app.add_middleware(RateLimitMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -35,7 +53,20 @@ app.include_router(voice.router)
 
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    await create_tables()
+    await message_writer.start()
+    await broker.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Дописываем сообщения, оставшиеся в очереди
+    await message_writer.stop()
+    await broker.stop()
+    password_hasher.shutdown()
+    await rate_limiter.store.close()
+    llm_memo.close()
+    await aclose_model_clients()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -60,6 +91,13 @@ async def status():
         "api_version": "1.0",
         "total_routes": len(routes),
         "websocket_routes": websocket_routes,
+        "password_hasher": password_hasher.stats(),
+        "query_router": query_router.stats(),
+        "llm_memo": llm_memo.stats(),
+        "answer_cache": answer_cache.stats(),
+        "chat_memory": chat_memory.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "single_flight": {"llm": llm_flights.stats(), "news": news_flights.stats()},
         "timestamp": datetime.now().isoformat()
     }
 
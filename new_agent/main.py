@@ -14,14 +14,23 @@ import requests
 import json
 import os
 import base64
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, AsyncIterator, Callable, Union
 from dotenv import load_dotenv
+import asyncio
+import logging
 import re
 from urllib.parse import urljoin
 
+from app.utils.llm_memo import KIND_TRANSLATE, llm_memo
+from app.utils.llm_scheduler import PRIORITY_BACKGROUND, LLMSchedulerBusy, llm_scheduler
+from app.utils.single_flight import flight_key, llm_flights
+from gigachat_client import AsyncGigaChatClient
+
 # Загрузка переменных окружения из .env файла
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Универсальный User-Agent, чтобы сайты не блокировали наши HTTP-запросы
 HEADERS: Dict[str, str] = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:126.0) Gecko/20100101 Firefox/126.0"
@@ -98,6 +107,9 @@ class MockModel:
 # Объявление глобальной переменной перед использованием
 global run_news_agent
 
+# Асинхронный клиент с пулом соединений (для safe_model_ainvoke); None — API недоступен
+async_client = None
+
 # Если токен найден, проверяем его
 if gigachat_auth_token:
     print(f"Найден GIGACHAT_AUTH_TOKEN длиной {len(gigachat_auth_token)} символов")
@@ -178,6 +190,8 @@ if gigachat_auth_token:
                 scope="GIGACHAT_API_PERS"
             )
             
+            async_client = AsyncGigaChatClient(credentials=gigachat_auth_token)
+
             # Для langchain используем wrapper
             model = GigaChat(
                 credentials=gigachat_auth_token,
@@ -242,7 +256,27 @@ else:
     run_news_agent = mock_run_news_agent
 
 # Безопасная обертка для вызова модели
-def safe_model_invoke(prompt: str, default: str = "Не удалось получить ответ от модели") -> str:
+def safe_model_invoke(prompt: str, default: str = "Не удалось получить ответ от модели",
+                      priority: Optional[str] = None) -> str:
+    """
+    Вызов модели через общий планировщик llm_scheduler.
+
+    Ждёт слот (приоритет — ``priority`` или из llm_context вызывающего
+    запроса), затем вызывает _model_invoke. Если слот не выдан за
+    LLM_QUEUE_TIMEOUT, возвращает default. Одновременные вызовы с тем же
+    промптом ждут один общий ответ (llm_flights).
+    """
+    return llm_flights.do(_prompt_key(prompt, default), lambda: _scheduled_invoke(prompt, default, priority))
+
+def _scheduled_invoke(prompt, default: str, priority: Optional[str]) -> str:
+    try:
+        with llm_scheduler.slot(priority):
+            return _model_invoke(prompt, default)
+    except LLMSchedulerBusy:
+        logger.warning("LLM queue is full, returning default", extra={"priority": priority, "mode": "sync"})
+        return default
+
+def _model_invoke(prompt: str, default: str) -> str:
     """
     Безопасно вызывает модель LangChain или GigaChat, обрабатывая различные типы моделей
     и возвращая текстовый ответ. Предпочитает .invoke, затем .predict, затем .chat.
@@ -341,6 +375,143 @@ def safe_model_invoke(prompt: str, default: str = "Не удалось полу
         print(f"Непредвиденная ошибка при вызове модели: {e}")
         return default
 
+_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+def _to_api_messages(prompt):
+    """Промпт (строка или список сообщений LangChain) в формат [{role, content}] API GigaChat."""
+    if isinstance(prompt, list):
+        return [
+            {"role": _ROLES.get(getattr(m, "type", "human"), "user"), "content": str(getattr(m, "content", m))}
+            for m in prompt
+        ]
+    return [{"role": "user", "content": str(prompt)}]
+
+def _prompt_key(prompt, default: str) -> str:
+    return flight_key(_to_api_messages(prompt), default)
+
+async def safe_model_ainvoke(prompt, default: str = "Не удалось получить ответ от модели",
+                             priority: Optional[str] = None) -> str:
+    """
+    Awaitable-вариант safe_model_invoke.
+
+    Запрос идёт через AsyncGigaChatClient: без потока из пула, по
+    keep-alive соединению, поэтому число одновременных вызовов модели
+    ограничено сокетами (GIGACHAT_MAX_CONNECTIONS), а не потоками. Если
+    асинхронный клиент не настроен (нет токена, MockModel), выполняет
+    safe_model_invoke в отдельном потоке; если настроен, но вызов не
+    удался — возвращает ``default`` (повтор через поток только удвоил бы
+    нагрузку на модель). Слот llm_scheduler ожидается без занятия потока.
+    Одновременные вызовы с тем же промптом ждут один общий ответ (llm_flights).
+    """
+    return await llm_flights.ado(_prompt_key(prompt, default), lambda: _scheduled_ainvoke(prompt, default, priority))
+
+async def _scheduled_ainvoke(prompt, default: str, priority: Optional[str]) -> str:
+    if async_client is None:
+        return await asyncio.to_thread(safe_model_invoke, prompt, default, priority)
+    try:
+        async with llm_scheduler.aslot(priority):
+            content = await async_client.complete(_to_api_messages(prompt))
+    except LLMSchedulerBusy:
+        logger.warning("LLM queue is full, returning default", extra={"priority": priority, "mode": "async"})
+        return default
+    except Exception:
+        logger.exception("Async GigaChat call failed, returning default")
+        return default
+    return content if content is not None else default
+
+def async_model_available() -> bool:
+    """Настроен ли AsyncGigaChatClient (иначе — только синхронные вызовы модели в потоках)."""
+    return async_client is not None
+
+async def safe_model_astream(prompt, default: str = "Не удалось получить ответ от модели",
+                             priority: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Асинхронный вариант safe_model_stream для интерактивных ответов: токены
+    идут из AsyncGigaChatClient.stream, слот llm_scheduler ожидается через
+    aslot, поэтому ни очередь, ни чтение ответа не держат поток пула.
+    Отмена итерации закрывает HTTP-поток и освобождает слот.
+
+    Требует настроенного асинхронного клиента (см. async_model_available).
+    Если модель не отдала ни одного токена, отдаёт ``default`` (если он не пуст).
+    """
+    produced = False
+    try:
+        async with llm_scheduler.aslot(priority):
+            async for content in async_client.stream(_to_api_messages(prompt)):
+                produced = True
+                yield content
+    except LLMSchedulerBusy:
+        logger.warning("LLM queue is full, returning default", extra={"priority": priority, "mode": "astream"})
+    except Exception:
+        logger.exception("Async GigaChat stream failed", extra={"produced": produced})
+    if not produced and default:
+        yield default
+
+async def aclose_model_clients():
+    """Закрывает пул соединений асинхронного клиента (при остановке приложения)."""
+    if async_client is not None:
+        await async_client.aclose()
+
+def safe_model_stream(prompt: str, default: str = "Не удалось получить ответ от модели",
+                      priority: Optional[str] = None, should_stop: Optional[Callable[[], bool]] = None):
+    """
+    Потоковый вариант safe_model_invoke: генератор, отдающий ответ модели по частям
+    (токенам) через `model.stream`.
+
+    Если модель не умеет стримить (MockModel) или поток упал до первого токена,
+    отдаёт одним куском результат safe_model_invoke. Если поток оборвался на
+    середине, уже отданное не повторяется — генератор просто завершается.
+    Слот llm_scheduler занят, пока идёт поток.
+
+    ``should_stop`` — проверка отмены (например, проигравшая спекулятивная
+    ветка): она делается до ожидания слота, перед вызовом модели и между
+    токенами, так что отменённый генератор не занимает модель зря.
+    """
+    global model
+
+    def stopped() -> bool:
+        return should_stop is not None and should_stop()
+
+    if stopped():
+        return
+    if hasattr(model, "stream"):
+        produced = False
+        try:
+            from langchain_core.messages import HumanMessage, BaseMessage  # локальный импорт
+
+            if isinstance(prompt, list) and all(isinstance(m, BaseMessage) for m in prompt):
+                stream_input = prompt
+            else:
+                stream_input = [HumanMessage(content=str(prompt))]
+
+            with llm_scheduler.slot(priority):
+                if stopped():
+                    return
+                for chunk in model.stream(stream_input):  # type: ignore[arg-type]
+                    if stopped():
+                        return
+                    content = getattr(chunk, "content", chunk)
+                    if isinstance(content, str) and content:
+                        produced = True
+                        yield content
+            if produced:
+                return
+        except LLMSchedulerBusy:
+            logger.warning("LLM queue is full, returning default", extra={"priority": priority, "mode": "stream"})
+            if default:
+                yield default
+            return
+        except Exception:
+            logger.exception("model.stream failed", extra={"produced": produced})
+            if produced:
+                return
+
+    if stopped():
+        return
+    response = safe_model_invoke(prompt, default, priority)
+    if response:
+        yield response
+
 # Инициализация инструментов поиска
 tavily_api_key = os.getenv("TAVILY_API_KEY")
 if tavily_api_key:
@@ -399,7 +570,9 @@ def validate_news_source(url):
         Верни только число оценки от 0 до 10 и короткое обоснование.
         """
         
-        llm_assessment = safe_model_invoke(prompt, "5 - Не удалось проанализировать достоверность источника")
+        # Массовые вызовы (по одному на источник) уступают интерактивным
+        llm_assessment = safe_model_invoke(prompt, "5 - Не удалось проанализировать достоверность источника",
+                                           priority=PRIORITY_BACKGROUND)
         
         # Извлекаем числовую оценку из ответа LLM
         try:
@@ -432,8 +605,12 @@ def find_credible_news_sources(query):
     def _translate(text: str) -> str:
         if any('а' <= ch.lower() <= 'я' for ch in text):
             tr_prompt = f"Переведи следующую фразу на английский, чтобы использовать её как поисковый запрос. Верни только перевод без кавычек: {text}"
-            translated = safe_model_invoke(tr_prompt, text)
-            return translated.strip().strip('\"\'')
+
+            def ask() -> Optional[str]:
+                return safe_model_invoke(tr_prompt, "").strip().strip('\"\'') or None
+
+            # Общий с news_parser_old кэш переводов поисковых запросов
+            return llm_memo.get_or_compute(KIND_TRANSLATE, text, ask) or text
         return text
 
     search_phrase = _translate(query)
@@ -534,7 +711,8 @@ def extract_news_from_source(url, topic):
                     "Если известно, укажи дату (формат YYYY-MM-DD). Верни JSON вида {\"summary\": \"...\", \"date\": \"YYYY-MM-DD или blank\"}. "
                     "Текст статьи: " + article_text
                 )
-                summary_resp = safe_model_invoke(summary_prompt, "{\"summary\": \"Не удалось извлечь содержание\", \"date\": \"\"}")
+                summary_resp = safe_model_invoke(summary_prompt, "{\"summary\": \"Не удалось извлечь содержание\", \"date\": \"\"}",
+                                                 priority=PRIORITY_BACKGROUND)
 
                 try:
                     summary_json = json.loads(summary_resp) if isinstance(summary_resp, str) else {}
@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+# Приложение целиком: нужны зависимости агентов (gigachat, langchain)
+main = pytest.importorskip("main")
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # app.db открывается относительно текущего каталога. Приложение
+    # запускается один раз на модуль: пул соединений и исполнители живут
+    # в глобальном состоянии модулей
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("ws"))
+    try:
+        with TestClient(main.app) as client:
+            yield client
+    finally:
+        os.chdir(cwd)
+
+
+def _login(client, username):
+    client.post("/auth/register", json={"username": username, "password": "secret"})
+    response = client.post("/auth/token", data={"username": username, "password": "secret"})
+    return response.json()["access_token"]
+
+
+def test_websocket_rejects_chat_of_another_user(client):
+    alice = _login(client, "alice")
+    bob = _login(client, "bob")
+    chat_id = client.post("/chat/", json={"title": "private"}, headers={"Authorization": f"Bearer {alice}"}).json()["id"]
+
+    # С last_message_id сервер сразу отдал бы историю — проверяем, что до неё не доходит
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect(f"/chat/ws/{chat_id}?token={bob}&last_message_id=0") as websocket:
+            websocket.receive_text()
+    assert exc_info.value.code == 1008
+
+    with client.websocket_connect(f"/chat/ws/{chat_id}?token={alice}&last_message_id=0") as websocket:
+        assert json.loads(websocket.receive_text())["type"] == "resumed"
+
+
+def test_websocket_rejects_missing_chat(client):
+    carol = _login(client, "carol")
+
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect(f"/chat/ws/999?token={carol}") as websocket:
+            websocket.receive_text()
+    assert exc_info.value.code == 1008
@@ -0,0 +1,111 @@
+import asyncio
+
+from fastapi import status
+
+from app.utils.connections import OVERFLOW_DROP_OLDEST, ClientConnection, ConnectionManager
+
+
+class StuckWebSocket:
+    """Клиент, который не читает: send_text висит, пока тест не отпустит."""
+
+    def __init__(self):
+        self.unblock = asyncio.Event()
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, text):
+        await self.unblock.wait()
+        self.sent.append(text)
+
+    async def close(self, code=status.WS_1000_NORMAL_CLOSURE):
+        self.close_code = code
+
+
+def _run(coro):
+    # Регрессия в очереди не должна подвешивать весь прогон
+    asyncio.run(asyncio.wait_for(coro, 5))
+
+
+def _connect(manager, websocket, **kwargs):
+    connection = ClientConnection(websocket, manager, chat_id=1, overflow_policy=OVERFLOW_DROP_OLDEST,
+                                  **kwargs)
+    manager._by_chat.setdefault(1, set()).add(connection)
+    return connection
+
+
+def test_drop_oldest_disconnects_when_queue_is_full_of_non_droppable_frames():
+    async def scenario():
+        manager = ConnectionManager()
+        websocket = StuckWebSocket()
+        connection = _connect(manager, websocket, max_queue=3)
+
+        assert connection.send("delta-0", droppable=False)
+        await asyncio.sleep(0)  # отправитель забрал первый кадр и завис на нём
+        for i in range(1, 4):
+            assert connection.send(f"delta-{i}", droppable=False)
+        assert len(connection._queue) == 3
+
+        assert not connection.send("delta-4", droppable=False)
+        await asyncio.sleep(0)
+        assert connection.closed
+        assert websocket.close_code == status.WS_1013_TRY_AGAIN_LATER
+        assert manager.count(1) == 0
+        assert len(connection._queue) == 0
+
+    _run(scenario())
+
+
+def test_drop_oldest_drops_broadcast_frames_before_replies():
+    async def scenario():
+        manager = ConnectionManager()
+        websocket = StuckWebSocket()
+        connection = _connect(manager, websocket, max_queue=3)
+
+        connection.send("reply", droppable=False)
+        connection.send("broadcast-1")
+        connection.send("broadcast-2")
+        assert connection.send("reply-2", droppable=False)
+        assert not connection.closed
+        assert connection.dropped == 1
+        assert [text for text, _ in connection._queue] == ["reply", "broadcast-2", "reply-2"]
+
+        await connection.close()
+
+    _run(scenario())
+
+
+def test_held_frames_are_capped():
+    async def scenario():
+        manager = ConnectionManager()
+        websocket = StuckWebSocket()
+        connection = _connect(manager, websocket, max_queue=2, held=True)
+
+        assert connection.send("a", droppable=False)
+        assert connection.send("b", droppable=False)
+        assert not connection.send("c", droppable=False)
+        assert connection.closed
+        await asyncio.sleep(0)
+        assert websocket.close_code == status.WS_1013_TRY_AGAIN_LATER
+
+    _run(scenario())
+
+
+def test_replayed_history_does_not_count_towards_the_cap():
+    async def scenario():
+        manager = ConnectionManager()
+        websocket = StuckWebSocket()
+        connection = _connect(manager, websocket, max_queue=2, held=True)
+
+        connection.send("live", droppable=False)
+        connection.release([f"history-{i}" for i in range(5)])
+        assert connection.send("live-2", droppable=False)
+        assert not connection.closed
+
+        websocket.unblock.set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        assert websocket.sent == [f"history-{i}" for i in range(5)] + ["live", "live-2"]
+        assert connection._replay == 0
+        await connection.close()
+
+    _run(scenario())